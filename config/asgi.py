@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# После setup(): модули приложений читают настройки и модели
+from habits.streams import STREAM_PATH, reminder_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    SSE-поток напоминаний обслуживается отдельным ASGI-приложением
+    (habits.streams), всё остальное — Django.
+    """
+    if scope["type"] == "http" and scope["path"] == STREAM_PATH:
+        await reminder_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,165 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from rest_framework import exceptions
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+class AsyncAPIViewMixin:
+    """
+    Асинхронный dispatch для DRF-view (сам DRF async-view не поддерживает).
+
+    Под ASGI async-обработчики (async def get, list, retrieve) выполняются
+    в event loop и не занимают поток на время запросов к БД и Redis:
+    аутентификация, выборка и пагинация идут через асинхронный ORM
+    и кэш Django. Синхронные обработчики того же view (изменения, action)
+    выполняются как раньше, в потоке (sync_to_async). Под WSGI Django сам
+    запускает async-view через async_to_sync.
+    """
+
+    @classonlymethod
+    def as_view(cls, *args, **kwargs):
+        # ViewSetMixin.as_view, в отличие от View.as_view, не помечает view
+        # корутиной — без пометки Django вызовет dispatch синхронно
+        view = super().as_view(*args, **kwargs)
+        if not iscoroutinefunction(view):
+            view = markcoroutinefunction(view)
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            handler = self.http_method_not_allowed
+        is_async = iscoroutinefunction(handler)
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            if is_async:
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        if is_async:
+            self.response = self.finalize_response(request, response, *args, **kwargs)
+        else:
+            # После синхронного обработчика finalize_response может писать
+            # в Redis (read-your-writes) — тоже в потоке
+            self.response = await sync_to_async(self.finalize_response)(
+                request, response, *args, **kwargs
+            )
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """
+        APIView.initial с асинхронной аутентификацией.
+        """
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        if self.throttle_classes:
+            # Счётчики троттлинга — в кэше Django
+            await sync_to_async(self.check_throttles)(request)
+
+    async def aperform_authentication(self, request):
+        """
+        Request._authenticate: аутентификаторы с aauthenticate вызываются
+        в event loop, остальные — в потоке.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth = await authenticator.aauthenticate(request)
+                else:
+                    user_auth = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def aget_object(self):
+        """
+        GenericAPIView.get_object через queryset.aget.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, self)
+
+
+class AsyncListModelMixin:
+    async def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer([obj async for obj in queryset], many=True)
+        return Response(serializer.data)
+
+
+class AsyncRetrieveModelMixin:
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    PageNumberPagination с асинхронным подсчётом (acount) и выборкой
+    страницы (async for) для AsyncListModelMixin.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # count — cached_property: посчитанное значение paginator не пересчитывает
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return list(self.page)
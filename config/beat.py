@@ -0,0 +1,159 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+import redis
+from celery.beat import PersistentScheduler
+from django.conf import settings
+
+from config.metrics import BEAT_LEADERSHIP, BEAT_TICK_LOCKS, BEAT_TICK_OVERRUNS, STORE
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+
+# Продлить или снять блокировку может только её владелец
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def redis_client():
+    url = settings.BEAT_REDIS_URL
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(
+            url, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+    return _clients[url]
+
+
+class LeaderScheduler(PersistentScheduler):
+    """
+    Планировщик celery beat, которого можно запускать на нескольких узлах.
+
+    Задачи отправляет только ведущий — владелец блокировки
+    BEAT_LOCK_PREFIX + "leader" в Redis. Ведущий продлевает её каждые
+    BEAT_LEADER_RENEW_INTERVAL секунд, остальные экземпляры с той же
+    частотой пытаются её захватить. Если ведущий упал, блокировка истекает
+    через BEAT_LEADER_LOCK_TTL секунд и её забирает другой узел; при
+    штатной остановке она снимается сразу.
+
+    Если Redis не отвечает, ведущий продолжает работать, пока не истекла
+    последняя продлённая им блокировка (раньше её никто не захватит),
+    затем уступает.
+
+    Расписание (время последних запусков) по-прежнему хранится в локальном
+    celerybeat-schedule каждого узла: новый ведущий сразу запускает задачи,
+    чьё время подошло по его файлу. Повтор send_habit_reminders за ту же
+    минуту отсекает tick_lock.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.node = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leader = False
+        self.lease_until = 0
+        super().__init__(*args, **kwargs)
+        # Спать дольше интервала продления нельзя: блокировка истечёт
+        self.max_interval = min(self.max_interval, settings.BEAT_LEADER_RENEW_INTERVAL)
+
+    @property
+    def leader_key(self):
+        return f"{settings.BEAT_LOCK_PREFIX}leader"
+
+    def tick(self, *args, **kwargs):
+        if not self.elect():
+            return settings.BEAT_LEADER_RENEW_INTERVAL
+        return super().tick(*args, **kwargs)
+
+    def elect(self):
+        """
+        Захватывает или продлевает блокировку ведущего; True — этот узел
+        ведущий.
+        """
+        ttl_ms = int(settings.BEAT_LEADER_LOCK_TTL * 1000)
+        started = time.monotonic()
+        client = redis_client()
+        try:
+            if self.leader:
+                owned = client.eval(RENEW_SCRIPT, 1, self.leader_key, self.node, ttl_ms)
+            else:
+                owned = client.set(self.leader_key, self.node, nx=True, px=ttl_ms)
+        except redis.RedisError:
+            logger.warning("beat: Redis недоступен", exc_info=True)
+            owned = self.leader and time.monotonic() < self.lease_until
+        else:
+            if owned:
+                self.lease_until = started + settings.BEAT_LEADER_LOCK_TTL
+        self.set_leader(bool(owned))
+        return self.leader
+
+    def set_leader(self, leader):
+        if leader == self.leader:
+            return
+        self.leader = leader
+        logger.info(
+            "beat %s: %s", self.node, "стал ведущим" if leader else "больше не ведущий"
+        )
+        BEAT_LEADERSHIP.inc(result="acquired" if leader else "lost")
+        # Процесс beat метрики почти не пишет — сбрасываем сразу
+        STORE.flush()
+
+    def close(self):
+        if self.leader:
+            try:
+                redis_client().eval(RELEASE_SCRIPT, 1, self.leader_key, self.node)
+            except redis.RedisError:
+                logger.warning("beat: не удалось снять блокировку", exc_info=True)
+            self.set_leader(False)
+        super().close()
+
+
+@contextmanager
+def tick_lock(task, tick, period):
+    """
+    Не больше одного запуска периодической задачи task за такт tick
+    (например, "2026-01-01T08:00" для поминутной задачи), даже если beat
+    отправил её дважды (смена ведущего) или предыдущий запуск ещё идёт.
+
+    Отдаёт True, если запуск должен выполняться. Блокировка не снимается
+    после запуска, а истекает через BEAT_TICK_LOCK_TTL секунд: повтор за
+    уже обработанный такт тоже пропускается. Если Redis недоступен, задача
+    выполняется: лишнее напоминание лучше пропущенного.
+
+    Запуск дольше period секунд считается в beat_tick_overruns_total.
+    """
+    key = f"{settings.BEAT_LOCK_PREFIX}tick:{task}:{tick}"
+    try:
+        acquired = redis_client().set(
+            key, uuid.uuid4().hex, nx=True, ex=settings.BEAT_TICK_LOCK_TTL
+        )
+    except redis.RedisError:
+        logger.warning("Блокировка такта %s недоступна", key, exc_info=True)
+        BEAT_TICK_LOCKS.inc(task=task, result="error")
+        acquired = True
+    else:
+        BEAT_TICK_LOCKS.inc(task=task, result="acquired" if acquired else "skipped")
+    if not acquired:
+        yield False
+        return
+
+    started = time.monotonic()
+    try:
+        yield True
+    finally:
+        duration = time.monotonic() - started
+        if duration > period:
+            logger.warning("%s за %s шёл %.1f с", task, tick, duration)
+            BEAT_TICK_OVERRUNS.inc(task=task)
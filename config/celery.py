@@ -13,3 +13,12 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Автоматически искать tasks.py во всех приложениях
 app.autodiscover_tasks()
+
+# Длительность и результат задач в метриках (сигналы task_prerun/task_postrun)
+import config.metrics  # noqa: E402,F401
+
+# Слушатель шины инвалидации в каждом процессе воркера (worker_process_init)
+import config.invalidation  # noqa: E402,F401
+
+# Concurrency и prefetch воркера по его очереди (worker_init)
+import config.workers  # noqa: E402,F401
@@ -0,0 +1,99 @@
+import os
+import sys
+from importlib.util import find_spec
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+POOL_MODES = ("persistent", "pool", "pgbouncer")
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Значения по умолчанию для каждой роли процесса. Web-воркер обслуживает
+# запросы в нескольких потоках, воркер Celery с prefork — по одной задаче
+# на процесс, поэтому ему нужен пул поменьше.
+POOL_DEFAULTS = {
+    "web": {"CONN_MAX_AGE": 60, "POOL_MIN_SIZE": 2, "POOL_MAX_SIZE": 10},
+    "celery": {"CONN_MAX_AGE": 300, "POOL_MIN_SIZE": 1, "POOL_MAX_SIZE": 4},
+}
+
+
+def process_role(argv=None, environ=None):
+    """
+    Роль процесса: PROCESS_ROLE из окружения или "celery", если процесс
+    запущен командой celery (worker, beat), иначе "web".
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    role = environ.get("PROCESS_ROLE")
+    if role:
+        if role not in POOL_DEFAULTS:
+            raise ImproperlyConfigured(f"Неизвестная PROCESS_ROLE: {role}")
+        return role
+    program = Path(argv[0]).name if argv else ""
+    return "celery" if program == "celery" else "web"
+
+
+def role_setting(name, role, environ):
+    """
+    DB_<NAME>_<ROLE> -> DB_<NAME> -> значение по умолчанию для роли.
+    """
+    value = environ.get(f"DB_{name}_{role.upper()}", environ.get(f"DB_{name}"))
+    return int(value) if value is not None else POOL_DEFAULTS[role][name]
+
+
+def pooling_settings(mode, role, environ=None):
+    """
+    Ключи для DATABASES["default"] в зависимости от DB_POOL_MODE:
+
+    - persistent: постоянные соединения (CONN_MAX_AGE) с проверкой перед
+      повторным использованием (CONN_HEALTH_CHECKS) — одно соединение
+      на поток;
+    - pool: встроенный пул Django (нужен psycopg 3 и psycopg-pool),
+      не больше POOL_MAX_SIZE соединений на процесс;
+    - pgbouncer: соединение с PgBouncer в режиме transaction. Серверные
+      курсоры отключены, состояние сессии (SET, временные таблицы,
+      advisory-локи) между транзакциями не сохраняется. Часовой пояс
+      задаётся на стороне БД: ALTER ROLE ... SET timezone = 'UTC'.
+    """
+    environ = os.environ if environ is None else environ
+    if mode not in POOL_MODES:
+        raise ImproperlyConfigured(
+            f"DB_POOL_MODE должен быть одним из {', '.join(POOL_MODES)}, а не {mode}"
+        )
+
+    options = {
+        "CONN_MAX_AGE": role_setting("CONN_MAX_AGE", role, environ),
+        "CONN_HEALTH_CHECKS": True,
+    }
+    if mode == "pool":
+        if find_spec("psycopg_pool") is None:
+            raise ImproperlyConfigured(
+                "DB_POOL_MODE=pool требует пакеты psycopg (3) и psycopg-pool"
+            )
+        # Соединения держит пул, Django возвращает их после каждого запроса
+        options["CONN_MAX_AGE"] = 0
+        options["OPTIONS"] = {
+            "pool": {
+                "min_size": role_setting("POOL_MIN_SIZE", role, environ),
+                "max_size": role_setting("POOL_MAX_SIZE", role, environ),
+                "timeout": int(environ.get("DB_POOL_TIMEOUT", 10)),
+            }
+        }
+    elif mode == "pgbouncer":
+        options["DISABLE_SERVER_SIDE_CURSORS"] = True
+    return options
+
+
+def copy_from(cursor, sql, stream):
+    """
+    COPY ... FROM STDIN из файлового объекта stream. В режиме pool Django
+    работает через psycopg 3, у курсора которого нет copy_expert, — там
+    данные передаются кусками через cursor.copy().
+    """
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(sql, stream)
+        return
+    with cursor.copy(sql) as copy:
+        while data := stream.read(COPY_CHUNK_SIZE):
+            copy.write(data)
@@ -0,0 +1,209 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+class ReplicaPin:
+    """
+    Реплика, выбранная при первом чтении в блоке replica_reads (view,
+    задача): COUNT и страница, связанные выборки одного запроса читаются
+    с одного сервера с одним отставанием. PRIMARY — реплик не нашлось.
+    """
+
+    PRIMARY = "default"
+
+    def __init__(self):
+        self.alias = None
+
+
+# Пин реплики текущего контекста; None — читать с реплик нельзя. Объект
+# общий для копий контекста (sync_to_async), поэтому выбор виден всем.
+_replica_reads = ContextVar("replica_reads", default=None)
+
+# Отставание реплики в секундах; 0, если всё полученное WAL уже применено
+# (иначе на простаивающем primary now() - replay_timestamp растёт бесконечно)
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+@contextmanager
+def replica_reads():
+    """
+    Чтения внутри блока могут уйти на реплику. Использовать только там,
+    где допустимы данные, отстающие на REPLICA_MAX_LAG секунд.
+    """
+    token = _replica_reads.set(ReplicaPin())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_active():
+    return _replica_reads.get() is not None
+
+
+class ReplicaLagMonitor:
+    """
+    Отставание реплик, проверяемое не чаще раза в REPLICA_LAG_CHECK_INTERVAL
+    секунд на процесс. Недоступная реплика считается отставшей.
+    """
+
+    def __init__(self):
+        self.checked = {}
+
+    def lag(self, alias):
+        now = time.monotonic()
+        cached = self.checked.get(alias)
+        if cached and now - cached[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return cached[1]
+
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0] or 0)
+        except DatabaseError:
+            lag = None
+        self.checked[alias] = (now, lag)
+        return lag
+
+    def fresh(self, alias):
+        lag = self.lag(alias)
+        return lag is not None and lag <= settings.REPLICA_MAX_LAG
+
+    def healthy_replicas(self):
+        return [alias for alias in settings.DATABASE_REPLICAS if self.fresh(alias)]
+
+
+MONITOR = ReplicaLagMonitor()
+
+
+class ReplicaRouter:
+    """
+    Чтения внутри replica_reads() распределяются по репликам из
+    DATABASE_REPLICAS, отставание которых не больше REPLICA_MAX_LAG:
+    реплика выбирается на весь блок (ReplicaPin).
+    Всё остальное (записи, чтения вне блока и внутри транзакции на primary)
+    идёт в default. Миграции на реплики не применяются.
+    """
+
+    def db_for_read(self, model, **hints):
+        pin = _replica_reads.get()
+        if pin is None:
+            return None
+        # Внутри транзакции читаем свои же незакоммиченные данные
+        if connections["default"].in_atomic_block:
+            return None
+        if pin.alias is None:
+            replicas = MONITOR.healthy_replicas()
+            pin.alias = random.choice(replicas) if replicas else pin.PRIMARY
+        elif pin.alias != pin.PRIMARY and not MONITOR.fresh(pin.alias):
+            # Реплика отстала или упала посреди запроса — дочитываем с primary
+            pin.alias = pin.PRIMARY
+        return None if pin.alias == pin.PRIMARY else pin.alias
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def recent_write_key(user_id):
+    return f"db:recent_write:{user_id}"
+
+
+def mark_recent_write(user):
+    """
+    После записи пользователь READ_YOUR_WRITES_SECONDS секунд читает
+    с primary, чтобы не увидеть старые данные с отстающей реплики.
+    """
+    try:
+        cache.set(recent_write_key(user.pk), 1, settings.READ_YOUR_WRITES_SECONDS)
+    except Exception:
+        pass
+
+
+def has_recent_write(user):
+    try:
+        return cache.get(recent_write_key(user.pk)) is not None
+    except Exception:
+        # Не знаем — безопаснее читать с primary
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Миксин для DRF-view: безопасные запросы перечисленных action читаются
+    с реплики, успешные изменяющие запросы включают read-your-writes
+    для пользователя. Для view без action (generics) считается "list".
+    """
+
+    replica_actions = ("list", "retrieve")
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        if iscoroutinefunction(super().dispatch):
+            return self.adispatch(request, *args, **kwargs)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            self.reset_replica_reads()
+
+    async def adispatch(self, request, *args, **kwargs):
+        # Async-view (config.async_views): флаг сбрасывается после await
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        finally:
+            self.reset_replica_reads()
+
+    def reset_replica_reads(self):
+        if self._replica_token is not None:
+            _replica_reads.reset(self._replica_token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.use_replica(request):
+            self._replica_token = _replica_reads.set(ReplicaPin())
+
+    async def ainitial(self, request, *args, **kwargs):
+        await super().ainitial(request, *args, **kwargs)
+        # has_recent_write читает Redis
+        if await sync_to_async(self.use_replica)(request):
+            self._replica_token = _replica_reads.set(ReplicaPin())
+
+    def use_replica(self, request):
+        if request.method not in SAFE_METHODS:
+            return False
+        if getattr(self, "action", "list") not in self.replica_actions:
+            return False
+        user = request.user
+        return not (user.is_authenticated and has_recent_write(user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            mark_recent_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
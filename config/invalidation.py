@@ -0,0 +1,206 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from celery.signals import worker_init, worker_process_init
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять соединение слушателя, если событий нет (секунды)
+HEARTBEAT_INTERVAL = 15
+
+
+class InvalidationBus:
+    """
+    Шина инвалидации локальных кэшей процессов.
+
+    Событие — короткая строка "<kind>:<key>" (например, "habits:42").
+    publish отправляет его через PostgreSQL NOTIFY или Redis PUBLISH
+    (CACHE_INVALIDATION_BACKEND), а поток-слушатель в каждом web-процессе
+    и воркере Celery вызывает подписчиков своего процесса. NOTIFY внутри
+    транзакции доставляется при коммите, так что незакоммиченные изменения
+    не рассылаются.
+
+    Пока слушатель подключён (healthy), локальный кэш может не сверяться
+    с Redis на каждом запросе. После переподключения подписчики получают
+    reset: события за время разрыва потеряны, локальные кэши очищаются.
+    """
+
+    def __init__(self):
+        self.handlers = defaultdict(list)
+        self.reset_handlers = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.connected = threading.Event()
+        self.stopping = threading.Event()
+        self.clients = {}
+
+    def subscribe(self, kind, handler):
+        self.handlers[kind].append(handler)
+
+    def on_reset(self, handler):
+        self.reset_handlers.append(handler)
+
+    def enabled(self):
+        return bool(settings.CACHE_INVALIDATION_BACKEND)
+
+    def healthy(self):
+        return (
+            self.enabled()
+            and self.pid == os.getpid()
+            and self.thread is not None
+            and self.thread.is_alive()
+            and self.connected.is_set()
+        )
+
+    def redis(self):
+        url = settings.CACHE_INVALIDATION_REDIS_URL
+        if url not in self.clients:
+            self.clients[url] = redis.Redis.from_url(
+                url, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        return self.clients[url]
+
+    def publish(self, kind, key):
+        """
+        Рассылает событие всем процессам; в своём процессе подписчики
+        вызываются сразу.
+        """
+        payload = f"{kind}:{key}"
+        channel = settings.CACHE_INVALIDATION_CHANNEL
+        try:
+            if settings.CACHE_INVALIDATION_BACKEND == "postgres":
+                with connections["default"].cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", [channel, payload])
+            elif settings.CACHE_INVALIDATION_BACKEND == "redis":
+                self.redis().publish(channel, payload)
+        except Exception:
+            # Другие процессы узнают об изменении по TTL локальных записей
+            logger.warning("Не удалось отправить событие %s", payload, exc_info=True)
+        self.dispatch(payload)
+
+    def dispatch(self, payload):
+        kind, _, key = payload.partition(":")
+        for handler in self.handlers.get(kind, ()):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Ошибка обработчика события %s", payload)
+
+    def reset(self):
+        for handler in self.reset_handlers:
+            handler()
+
+    def start(self):
+        """
+        Запускает поток-слушатель в текущем процессе (повторный вызов
+        ничего не делает; после fork поток запускается заново).
+        """
+        if not self.enabled():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+                return
+            self.pid = os.getpid()
+            self.connected.clear()
+            self.stopping.clear()
+            self.thread = threading.Thread(
+                target=self.run, name="cache-invalidation", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def run(self):
+        backoff = 0.5
+        while not self.stopping.is_set():
+            try:
+                if settings.CACHE_INVALIDATION_BACKEND == "postgres":
+                    self.listen_postgres()
+                else:
+                    self.listen_redis()
+            except Exception:
+                logger.warning("Слушатель инвалидации отключён", exc_info=True)
+            # Экспоненциальная пауза, пока подключиться не удаётся
+            if self.connected.is_set():
+                self.connected.clear()
+                backoff = 0.5
+            else:
+                backoff = min(backoff * 2, 30)
+            self.stopping.wait(backoff)
+
+    def listening(self):
+        self.connected.set()
+        self.reset()
+
+    def listen_postgres(self):
+        # Отдельное соединение вне пула Django: LISTEN живёт всю сессию
+        wrapper = connections.create_connection("default")
+        try:
+            wrapper.connect()
+            wrapper.set_autocommit(True)
+            raw = wrapper.connection
+            quote = wrapper.ops.quote_name
+            with raw.cursor() as cursor:
+                cursor.execute(f"LISTEN {quote(settings.CACHE_INVALIDATION_CHANNEL)}")
+            self.listening()
+
+            idle_since = time.monotonic()
+            while not self.stopping.is_set():
+                if callable(raw.notifies):
+                    # psycopg 3
+                    payloads = [notify.payload for notify in raw.notifies(timeout=1.0)]
+                elif select.select([raw], [], [], 1.0)[0]:
+                    raw.poll()
+                    payloads = [notify.payload for notify in raw.notifies]
+                    raw.notifies.clear()
+                else:
+                    payloads = []
+
+                for payload in payloads:
+                    self.dispatch(payload)
+                if payloads:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > HEARTBEAT_INTERVAL:
+                    with raw.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    idle_since = time.monotonic()
+        finally:
+            wrapper.close()
+
+    def listen_redis(self):
+        client = redis.Redis.from_url(
+            settings.CACHE_INVALIDATION_REDIS_URL,
+            socket_connect_timeout=1,
+            health_check_interval=HEARTBEAT_INTERVAL,
+        )
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+            self.listening()
+            while not self.stopping.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    self.dispatch(message["data"].decode())
+        finally:
+            pubsub.close()
+            client.close()
+
+
+BUS = InvalidationBus()
+
+
+@worker_init.connect
+@worker_process_init.connect
+def start_worker_listener(**kwargs):
+    BUS.start()
@@ -0,0 +1,382 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+import redis
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# Хэш в Redis, куда все процессы (gunicorn, Celery) сбрасывают приращения
+REDIS_KEY = "metrics"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsStore:
+    """
+    Хранилище значений метрик.
+
+    Приращения копятся в памяти процесса (без сетевых вызовов на горячем
+    пути), а фоновый поток раз в METRICS_FLUSH_INTERVAL секунд одним
+    pipeline сбрасывает их в общий хэш Redis через HINCRBYFLOAT — так
+    метрики воркеров Celery и всех web-процессов складываются, а не
+    перезаписывают друг друга. Поток запускается при первой записи в каждом
+    процессе (после fork — заново). Если METRICS_REDIS_URL пуст, значения
+    живут только в текущем процессе.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(float)
+        self.gauges = {}
+        self.totals = defaultdict(float)
+        self.clients = {}
+        self.pid = None
+
+    def client(self):
+        url = settings.METRICS_REDIS_URL
+        if not url:
+            return None
+        if url not in self.clients:
+            self.clients[url] = redis.Redis.from_url(
+                url, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        return self.clients[url]
+
+    def inc(self, field, amount=1):
+        with self.lock:
+            self.pending[field] += amount
+        self.start()
+
+    def set(self, field, value):
+        with self.lock:
+            self.gauges[field] = value
+        self.start()
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self.run, name="metrics-flush", daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(max(settings.METRICS_FLUSH_INTERVAL, 0.1))
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("Не удалось сбросить метрики", exc_info=True)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(float)
+            gauges, self.gauges = self.gauges, {}
+        if not (pending or gauges):
+            return
+
+        client = self.client()
+        if client is None:
+            with self.lock:
+                for field, amount in pending.items():
+                    self.totals[field] += amount
+                self.totals.update(gauges)
+            return
+
+        try:
+            pipe = client.pipeline(transaction=False)
+            for field, amount in pending.items():
+                pipe.hincrbyfloat(REDIS_KEY, field, amount)
+            if gauges:
+                pipe.hset(REDIS_KEY, mapping=gauges)
+            pipe.execute()
+        except redis.RedisError:
+            # Redis недоступен — вернём приращения и попробуем в следующий раз
+            with self.lock:
+                for field, amount in pending.items():
+                    self.pending[field] += amount
+                self.gauges = {**gauges, **self.gauges}
+
+    def local(self):
+        """
+        Значения, известные текущему процессу (в том числе не сброшенные).
+        """
+        with self.lock:
+            values = defaultdict(float, self.totals)
+            for field, amount in self.pending.items():
+                values[field] += amount
+            values.update(self.gauges)
+        return dict(values)
+
+    def snapshot(self):
+        self.flush()
+        client = self.client()
+        if client is None:
+            return self.local()
+        try:
+            values = client.hgetall(REDIS_KEY)
+        except redis.RedisError:
+            logger.warning("Redis метрик недоступен, отдаём метрики процесса")
+            return self.local()
+        return {field.decode(): float(value) for field, value in values.items()}
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+            self.gauges.clear()
+            self.totals.clear()
+        client = self.client()
+        if client is not None:
+            client.delete(REDIS_KEY)
+
+
+STORE = MetricsStore()
+REGISTRY = []
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(labels[name])}"' for name in sorted(labels))
+
+
+class Metric:
+    """
+    Базовая метрика. Значение хранится в STORE под полем
+    "<name>|<sample>|<labels>", где sample — вид значения (bucket:<le>,
+    sum, count) или пустая строка.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def field(self, sample, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        return f"{self.name}|{sample}|{format_labels(labels)}"
+
+    def samples(self, values):
+        """
+        values: {labels: {sample: value}} -> строки текстового формата.
+        """
+        raise NotImplementedError
+
+    def expose(self, snapshot):
+        values = defaultdict(dict)
+        prefix = f"{self.name}|"
+        for field, value in snapshot.items():
+            if field.startswith(prefix):
+                _, sample, labels = field.split("|", 2)
+                values[labels][sample] = value
+
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(self.samples(values))
+        return lines
+
+
+def sample_line(name, labels, value, extra=""):
+    labels = ",".join(part for part in (labels, extra) if part)
+    return f"{name}{{{labels}}} {value:g}" if labels else f"{name} {value:g}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        STORE.inc(self.field("", labels), amount)
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            yield sample_line(self.name, labels, value[""])
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        STORE.set(self.field("", labels), value)
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            yield sample_line(self.name, labels, value[""])
+
+
+class Histogram(Metric):
+    """
+    В хранилище пишется только попавший бакет, накопительные значения
+    `le` считаются при выдаче.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        index = bisect_left(self.buckets, value)
+        le = f"{self.buckets[index]:g}" if index < len(self.buckets) else "+Inf"
+        STORE.inc(self.field(f"bucket:{le}", labels))
+        STORE.inc(self.field("sum", labels), value)
+        STORE.inc(self.field("count", labels))
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            cumulative = 0
+            for bucket in self.buckets:
+                cumulative += value.get(f"bucket:{bucket:g}", 0)
+                yield sample_line(
+                    f"{self.name}_bucket", labels, cumulative, f'le="{bucket:g}"'
+                )
+            count = value.get("count", 0)
+            yield sample_line(f"{self.name}_bucket", labels, count, 'le="+Inf"')
+            yield sample_line(f"{self.name}_sum", labels, value.get("sum", 0))
+            yield sample_line(f"{self.name}_count", labels, count)
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса.",
+    ("view", "action", "method", "status"),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов за HTTP-запрос.",
+    ("view", "action"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Время выполнения задачи Celery.",
+    ("task", "outcome"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+HABIT_REMINDERS = Counter(
+    "habit_reminders_total",
+    "Напоминания о привычках: queued, skipped (планирование), sent, retried, "
+    "failed (доставка в Telegram), streamed (получено подписками SSE-узлов).",
+    ("result",),
+)
+HABIT_REMINDERS_LAST_TICK = Gauge(
+    "habit_reminders_last_tick",
+    "Напоминания за последний запуск send_habit_reminders.",
+    ("result",),
+)
+BEAT_LEADERSHIP = Counter(
+    "beat_leadership_changes_total",
+    "Смены ведущего celery beat на узлах: acquired, lost.",
+    ("result",),
+)
+BEAT_TICK_LOCKS = Counter(
+    "beat_tick_locks_total",
+    "Блокировки тактов периодических задач: acquired, skipped (такт уже "
+    "обработан или обрабатывается), error (Redis недоступен).",
+    ("task", "result"),
+)
+BEAT_TICK_OVERRUNS = Counter(
+    "beat_tick_overruns_total",
+    "Запуски периодических задач дольше своего периода.",
+    ("task",),
+)
+HABIT_LIST_CACHE = Counter(
+    "habit_list_cache_requests_total",
+    "Обращения к кэшу списка привычек по уровням (local, redis): hit, miss.",
+    ("tier", "result"),
+)
+REMINDER_STREAM_CONNECTIONS = Counter(
+    "reminder_stream_connections_total",
+    "Подключения к SSE-потоку напоминаний: opened, unauthorized, rejected "
+    "(лимит узла).",
+    ("result",),
+)
+REMINDER_STREAM_EVENTS = Counter(
+    "reminder_stream_events_total",
+    "События SSE-потока: queued, dropped (клиент не успевал читать).",
+    ("result",),
+)
+TELEGRAM_API_LATENCY = Histogram(
+    "telegram_api_duration_seconds",
+    "Время вызова Telegram Bot API.",
+    ("method",),
+)
+
+
+def render():
+    snapshot = STORE.snapshot()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose(snapshot))
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus. Скрейпер передаёт METRICS_TOKEN
+    в заголовке Authorization: Bearer; без токена в настройках эндпоинт
+    закрыт (403), если открытый доступ не включён явно (METRICS_PUBLIC).
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.METRICS_PUBLIC:
+            return HttpResponseForbidden()
+    elif request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4")
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None:
+        return
+    CELERY_TASK_DURATION.observe(
+        time.perf_counter() - started,
+        task=task.name,
+        outcome=(state or "unknown").lower(),
+    )
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_on_worker_shutdown(**kwargs):
+    # Фоновый поток не успеет сбросить последние приращения
+    STORE.flush()
@@ -0,0 +1,498 @@
+import cProfile
+import gzip
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость: без неё — только gzip
+    brotli = None
+
+# Таймеры текущего запроса; None — запрос не измеряется
+current_timings = ContextVar("current_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Накопленные за запрос длительности (мс) по именованным этапам.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.queries = 0
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds * 1000
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add("sql", time.perf_counter() - started)
+
+    def header(self):
+        """
+        Значение заголовка Server-Timing.
+        """
+        metrics = []
+        for name, duration in self.durations.items():
+            metric = f"{name};dur={duration:.2f}"
+            if name == "sql":
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        if "sql" not in self.durations:
+            metrics.append(f'sql;dur=0;desc="{self.queries} queries"')
+        return ", ".join(metrics)
+
+
+def timed(name, func):
+    """
+    Обёртка, добавляющая время вызова func к этапу name текущего запроса.
+    Вне измеряемого запроса стоит одно чтение ContextVar.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = current_timings.get()
+        if timings is None:
+            return func(*args, **kwargs)
+        with timings.measure(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def atimed(name, func):
+    """
+    timed для корутин.
+    """
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        timings = current_timings.get()
+        if timings is None:
+            return await func(*args, **kwargs)
+        with timings.measure(name):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def wrap_queries(stack, wrapper):
+    """
+    Подключает wrapper ко всем соединениям текущего потока. Соединения
+    Django свои у каждого потока, поэтому в async-цепочке вызывается через
+    sync_to_async: в тот же поток уходят и запросы асинхронного ORM.
+    """
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+class HybridMiddleware:
+    """
+    Middleware для синхронной (WSGI) и асинхронной (ASGI) цепочки: в async
+    цепочке Django не переключается в поток ради middleware, и async-view
+    выполняются в event loop. Наследник реализует handle и ahandle.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.ahandle(request)
+        return self.handle(request)
+
+
+_instrumented = False
+
+
+def install_instrumentation():
+    """
+    Один раз оборачиваем точки DRF, время которых не видно из middleware:
+    аутентификацию (она ленивая и выполняется внутри view; в async-view —
+    aperform_authentication), serializer.data
+    и рендеринг ответа.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+
+    from rest_framework.response import Response
+    from rest_framework.serializers import BaseSerializer
+    from rest_framework.views import APIView
+
+    from config.async_views import AsyncAPIViewMixin
+
+    APIView.perform_authentication = timed("auth", APIView.perform_authentication)
+    AsyncAPIViewMixin.aperform_authentication = atimed(
+        "auth", AsyncAPIViewMixin.aperform_authentication
+    )
+    BaseSerializer.data = property(timed("serialize", BaseSerializer.data.fget))
+    Response.rendered_content = property(
+        timed("render", Response.rendered_content.fget)
+    )
+    _instrumented = True
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер: фоновый поток раз в interval секунд снимает стек
+    потока запроса. Результат — стеки в формате collapsed (для flamegraph.pl
+    и speedscope) с числом попаданий.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def report(self):
+        return "".join(
+            f"{stack} {count}\n"
+            for stack, count in sorted(
+                self.samples.items(), key=lambda item: item[1], reverse=True
+            )
+        )
+
+
+class CProfileProfiler:
+    def __init__(self, limit):
+        self.limit = limit
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self):
+        output = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=output)
+        stats.sort_stats("cumulative").print_stats(self.limit)
+        return output.getvalue()
+
+
+class ServerTimingMiddleware(HybridMiddleware):
+    """
+    Профилирование запросов.
+
+    - SERVER_TIMING_ENABLED: каждый ответ получает заголовок Server-Timing
+      с временем SQL (и числом запросов), аутентификации, serializer.data,
+      рендеринга, view и всего запроса.
+    - REQUEST_PROFILING_ENABLED: staff-пользователь может прислать заголовок
+      X-Profile: cprofile | sample и получить вместо тела ответа профиль
+      этого запроса (pstats или collapsed-стеки сэмплирующего профайлера).
+
+    Если обе настройки выключены, middleware исключается из цепочки
+    (MiddlewareNotUsed) и не добавляет накладных расходов.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.server_timing = settings.SERVER_TIMING_ENABLED
+        self.profiling = settings.REQUEST_PROFILING_ENABLED
+        if not (self.server_timing or self.profiling):
+            raise MiddlewareNotUsed
+        if self.server_timing:
+            install_instrumentation()
+
+    def handle(self, request):
+        if not self.server_timing:
+            return self.profile_if_requested(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                wrap_queries(stack, timings.execute_wrapper)
+                response = self.profile_if_requested(request)
+        finally:
+            current_timings.reset(token)
+        return self.add_header(request, response, timings, started)
+
+    async def ahandle(self, request):
+        if not self.server_timing:
+            return await self.aprofile_if_requested(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            await sync_to_async(wrap_queries)(stack, timings.execute_wrapper)
+            response = await self.aprofile_if_requested(request)
+        finally:
+            await sync_to_async(stack.close)()
+            current_timings.reset(token)
+        return self.add_header(request, response, timings, started)
+
+    def add_header(self, request, response, timings, started):
+        view_started = getattr(request, "_server_timing_view_started", None)
+        if view_started is not None:
+            timings.add("view", time.perf_counter() - view_started)
+        timings.add("total", time.perf_counter() - started)
+        response["Server-Timing"] = timings.header()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._server_timing_view_started = time.perf_counter()
+
+    def profile_if_requested(self, request):
+        mode = request.headers.get("X-Profile") if self.profiling else None
+        if not mode:
+            return self.get_response(request)
+
+        profiler = self.get_profiler(mode)
+        if profiler is None or not self.is_staff(request):
+            return self.get_response(request)
+
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        return self.profiled_response(mode, profiler, response)
+
+    async def aprofile_if_requested(self, request):
+        """
+        В async-цепочке профиль покрывает event loop; код, выполняемый
+        в потоках (sync_to_async), в него не попадает.
+        """
+        mode = request.headers.get("X-Profile") if self.profiling else None
+        if not mode:
+            return await self.get_response(request)
+
+        profiler = self.get_profiler(mode)
+        if profiler is None or not await sync_to_async(self.is_staff)(request):
+            return await self.get_response(request)
+
+        profiler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        return self.profiled_response(mode, profiler, response)
+
+    def profiled_response(self, mode, profiler, response):
+        profiled = HttpResponse(
+            profiler.report(),
+            status=response.status_code,
+            content_type="text/plain; charset=utf-8",
+        )
+        profiled["X-Profile"] = mode
+        return profiled
+
+    def get_profiler(self, mode):
+        if mode == "cprofile":
+            return CProfileProfiler(settings.REQUEST_PROFILING_LIMIT)
+        if mode == "sample":
+            return StackSampler(settings.REQUEST_PROFILING_SAMPLE_INTERVAL)
+        return None
+
+    def is_staff(self, request):
+        """
+        API аутентифицируется по JWT внутри view, а middleware стоит раньше
+        AuthenticationMiddleware, поэтому токен проверяем сами. Выполняется
+        только для запросов с заголовком X-Profile.
+        """
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        return bool(authenticated and authenticated[0].is_staff)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Гистограммы латентности и числа SQL-запросов по DRF-view и action
+    (см. config/metrics.py). Отключается METRICS_ENABLED = False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_queries(stack, counter)
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    async def ahandle(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            await sync_to_async(wrap_queries)(stack, counter)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.observe(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    def observe(self, request, response, elapsed, queries):
+        from config.metrics import REQUEST_DB_QUERIES, REQUEST_LATENCY
+
+        view, action = view_labels(request)
+        REQUEST_LATENCY.observe(
+            elapsed,
+            view=view,
+            action=action,
+            method=request.method,
+            status=f"{response.status_code // 100}xx",
+        )
+        REQUEST_DB_QUERIES.observe(queries, view=view, action=action)
+
+
+def view_labels(request):
+    """
+    Имя view и action по resolver_match (без process_view: в async-цепочке
+    синхронный process_view стоил бы переключения в поток).
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched", ""
+    # DRF as_view() кладёт класс во view_func.cls, а ViewSet — ещё и actions
+    view_class = getattr(match.func, "cls", None)
+    view = view_class.__name__ if view_class else match.func.__name__
+    actions = getattr(match.func, "actions", None) or {}
+    return view, actions.get(request.method.lower(), "")
+
+
+def accepted_encodings(header):
+    """
+    Кодировки из Accept-Encoding, которые клиент принимает (q > 0).
+    """
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """
+    Сжатие ответов не меньше RESPONSE_COMPRESSION_MIN_BYTES: brotli, если
+    клиент его принимает и пакет brotli установлен, иначе gzip.
+
+    Потоковые ответы не сжимаются (события должны уходить клиенту сразу),
+    как и ответы, у которых уже есть Content-Encoding. ETag сжатого ответа
+    становится слабым, как в GZipMiddleware Django.
+    """
+
+    def __init__(self, get_response):
+        if not settings.RESPONSE_COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.min_bytes = settings.RESPONSE_COMPRESSION_MIN_BYTES
+
+    def handle(self, request):
+        return self.compress(request, self.get_response(request))
+
+    async def ahandle(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < self.min_bytes:
+            return response
+
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+            content = brotli.compress(
+                response.content, quality=settings.RESPONSE_BROTLI_QUALITY
+            )
+        elif "gzip" in accepted:
+            encoding = "gzip"
+            content = gzip.compress(
+                response.content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0
+            )
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
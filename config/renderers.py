@@ -0,0 +1,173 @@
+from datetime import time
+
+from django.db import models
+from django.utils.dateparse import parse_time
+from rest_framework import renderers, serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость: без неё — стандартный json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # без msgpack формат не регистрируется (settings)
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+if orjson is not None:
+    # Как у DRF: UTC с суффиксом Z, ключи-не-строки (id, даты) допустимы
+    ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+    # Decimal, UUID, ленивые строки и прочее, чего orjson не знает сам
+    _default = JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON-рендерер на orjson: сериализация на C, datetime/date/time
+    без Python-кода. Типы, которых orjson не знает (Decimal, UUID,
+    ленивые строки), передаются энкодеру DRF.
+
+    Без orjson, а также для отступов (?indent, браузерный API) работает
+    стандартный JSONRenderer DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON-парсер на orjson; как и JSONParser DRF, отклоняет NaN и Infinity.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        # orjson принимает только UTF-8 — как и требует RFC 8259
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+def minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def msgpack_default(obj):
+    """
+    Типы, которых нет в MessagePack: time — минута суток, остальное
+    (Decimal, UUID, date, ленивые строки) — как в JSON-ответах.
+    """
+    if isinstance(obj, time):
+        return minute_of_day(obj)
+    return JSONEncoder().default(obj)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    MessagePack для мобильных клиентов (Accept: application/msgpack или
+    ?format=msgpack). datetime передаётся расширением Timestamp, time —
+    минутой суток (см. CompactTimeField).
+    """
+
+    media_type = MSGPACK_MEDIA_TYPE
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(
+            data, default=msgpack_default, use_bin_type=True, datetime=True
+        )
+
+
+class MessagePackParser(BaseParser):
+    """
+    Тело запроса в MessagePack (Content-Type: application/msgpack);
+    Timestamp распаковывается в datetime с часовым поясом UTC.
+    """
+
+    media_type = MSGPACK_MEDIA_TYPE
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, timestamp=3)
+        except (msgpack.UnpackException, ValueError) as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+
+
+def binary_response(context):
+    request = context.get("request")
+    renderer = getattr(request, "accepted_renderer", None)
+    return getattr(renderer, "format", None) == MessagePackRenderer.format
+
+
+def binary_request(context):
+    request = context.get("request")
+    content_type = getattr(request, "content_type", "") or ""
+    return content_type.startswith(MSGPACK_MEDIA_TYPE)
+
+
+class CompactTimeField(serializers.TimeField):
+    """
+    TimeField, который в MessagePack передаётся минутой суток (0–1439),
+    а в JSON — как прежде, строкой.
+    """
+
+    def to_representation(self, value):
+        if value and binary_response(self.context):
+            # Несохранённая модель может хранить время строкой, как и в DRF
+            if isinstance(value, str):
+                value = parse_time(value)
+            return minute_of_day(value)
+        return super().to_representation(value)
+
+    def to_internal_value(self, value):
+        is_minute = isinstance(value, int) and not isinstance(value, bool)
+        if is_minute and binary_request(self.context):
+            if not 0 <= value < 24 * 60:
+                self.fail("invalid", format="минута суток 0–1439")
+            return time(value // 60, value % 60)
+        return super().to_internal_value(value)
+
+
+class CompactDateTimeField(serializers.DateTimeField):
+    """
+    DateTimeField, который в MessagePack отдаёт datetime как есть:
+    рендерер упаковывает его в Timestamp (до 12 байт вместо строки ISO 8601).
+    """
+
+    def to_representation(self, value):
+        if value is not None and binary_response(self.context):
+            return self.enforce_timezone(value)
+        return super().to_representation(value)
+
+
+class CompactTimesMixin:
+    """
+    Для ModelSerializer: поля времени и даты-времени модели компактны
+    в MessagePack.
+    """
+
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.TimeField: CompactTimeField,
+        models.DateTimeField: CompactDateTimeField,
+    }
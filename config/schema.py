@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, yaml_dump
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+API_INFO = openapi.Info(
+    title="Habit Tracker API",
+    default_version="v1",
+    description="API для сервиса отслеживания привычек",
+    terms_of_service="https://www.example.com/terms/",
+    contact=openapi.Contact(email="support@example.com"),
+    license=openapi.License(name="MIT License"),
+)
+
+# Приложения, по исходникам которых считается версия кода без CODE_VERSION
+SOURCE_DIRS = ("config", "habits", "users")
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "yaml": "application/yaml; charset=utf-8",
+}
+
+
+@lru_cache
+def source_digest(base_dir):
+    """
+    Хэш всех .py файлов приложений проекта (кроме тестов): меняется вместе
+    с кодом, который влияет на схему.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for directory in SOURCE_DIRS:
+        for path in sorted(Path(base_dir, directory).rglob("*.py")):
+            if path.name == "tests.py":
+                continue
+            digest.update(str(path.relative_to(base_dir)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def code_version():
+    """
+    Версия кода: CODE_VERSION (например, SHA коммита при деплое) или хэш
+    исходников.
+    """
+    return settings.CODE_VERSION or source_digest(str(settings.BASE_DIR))
+
+
+class SchemaArtifact:
+    """
+    Готовая схема в памяти процесса: тела JSON и YAML и их ETag.
+    """
+
+    def __init__(self, document):
+        self.version = document["x-code-version"]
+        self.bodies = {
+            "json": json.dumps(document, ensure_ascii=False).encode(),
+            "yaml": yaml_dump(document, binary=True),
+        }
+        self.etags = {
+            fmt: '"{}"'.format(hashlib.blake2b(body, digest_size=12).hexdigest())
+            for fmt, body in self.bodies.items()
+        }
+
+
+def generate_document():
+    """
+    Интроспекция всех view и сериализаторов (дорого) — без запроса, поэтому
+    в схеме нет host: Swagger UI подставляет адрес, с которого открыт.
+    """
+    generator = OpenAPISchemaGenerator(API_INFO)
+    swagger = generator.get_schema(request=None, public=True)
+    document = json.loads(OpenAPICodecJson(validators=[]).encode(swagger))
+    document["x-code-version"] = code_version()
+    return document
+
+
+def write_schema(path=None):
+    """
+    Генерирует схему и атомарно записывает её в OPENAPI_SCHEMA_PATH.
+    """
+    path = Path(path or settings.OPENAPI_SCHEMA_PATH)
+    document = generate_document()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    tmp.write_text(json.dumps(document, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    return document
+
+
+def read_schema(path):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+_artifact = None
+_lock = threading.Lock()
+
+
+def load_schema():
+    """
+    Схема для текущей версии кода: из памяти, из файла, записанного
+    командой generate_openapi_schema при деплое, или, если файла нет
+    или он от другой версии, — генерация с записью файла. Генерирует
+    схему один процесс за раз; остальные ждут и берут готовую.
+    """
+    global _artifact
+    version = code_version()
+    artifact = _artifact
+    if artifact is not None and artifact.version == version:
+        return artifact
+
+    with _lock:
+        if _artifact is not None and _artifact.version == version:
+            return _artifact
+        document = read_schema(settings.OPENAPI_SCHEMA_PATH)
+        if document is None or document.get("x-code-version") != version:
+            try:
+                document = write_schema()
+            except OSError:
+                # Каталог только для чтения: схема остаётся в памяти процесса
+                document = generate_document()
+        _artifact = SchemaArtifact(document)
+        return _artifact
+
+
+def schema_file_view(request, format):
+    """
+    Схема OpenAPI (/swagger.json, /swagger.yaml) из памяти с ETag:
+    повторный запрос с If-None-Match получает 304 без тела.
+    """
+    artifact = load_schema()
+    etag = artifact.etags[format]
+    # CompressionMiddleware делает ETag сжатого ответа слабым (W/"...")
+    tags = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in (tag.removeprefix("W/") for tag in tags):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            artifact.bodies[format], content_type=CONTENT_TYPES[format]
+        )
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
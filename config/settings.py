@@ -1,10 +1,16 @@
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
+from importlib.util import find_spec
 
 
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+from kombu import Queue
+
+from config.database import pooling_settings, process_role
+
 load_dotenv(override=True)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +47,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы total в Server-Timing покрывал все остальные middleware
+    "config.middleware.ServerTimingMiddleware",
+    "config.middleware.MetricsMiddleware",
+    # После метрик и Server-Timing: время сжатия входит в их замеры
+    "config.middleware.CompressionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -85,6 +96,64 @@ DATABASES = {
     }
 }
 
+# Соединения с БД: DB_POOL_MODE = persistent | pool | pgbouncer, размеры
+# и время жизни задаются отдельно для web и Celery (см. config/database.py)
+PROCESS_ROLE = process_role()
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "persistent")
+DATABASES["default"].update(pooling_settings(DB_POOL_MODE, PROCESS_ROLE))
+
+# Реплики для чтения: DATABASE_REPLICA_HOSTS="host[:port],host[:port]",
+# имя БД и учётные данные те же, что у default (см. config/db_router.py)
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    host.strip()
+    for host in os.environ.get("DATABASE_REPLICA_HOSTS", "").split(",")
+    if host.strip()
+):
+    replica_host, _, replica_port = replica.partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "PORT": replica_port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+# Шардирование привычек по пользователям (habits/sharding.py):
+# HABIT_SHARD_HOSTS="host[:port][/name],..." добавляет к default шарды
+# habits_shard_1, habits_shard_2, ... Порядок шардов менять нельзя, только
+# дописывать новые в конец.
+HABIT_SHARDS = []
+for index, shard in enumerate(
+    (
+        host.strip()
+        for host in os.environ.get("HABIT_SHARD_HOSTS", "").split(",")
+        if host.strip()
+    ),
+    start=1,
+):
+    shard_address, _, shard_name = shard.partition("/")
+    shard_host, _, shard_port = shard_address.partition(":")
+    DATABASES[f"habits_shard_{index}"] = {
+        **DATABASES["default"],
+        "NAME": shard_name or DATABASES["default"]["NAME"],
+        "HOST": shard_host,
+        "PORT": shard_port or DATABASES["default"]["PORT"],
+    }
+    HABIT_SHARDS.append(f"habits_shard_{index}")
+if HABIT_SHARDS:
+    HABIT_SHARDS.insert(0, "default")
+
+DATABASE_ROUTERS = [
+    "habits.sharding.HabitShardRouter",
+    "config.db_router.ReplicaRouter",
+]
+# Реплика, отставшая больше чем на столько секунд, не используется
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 1))
+# После записи пользователь столько секунд читает только с primary
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,11 +199,40 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "users.User"
 
 
+if find_spec("msgpack"):
+    MSGPACK_RENDERER_CLASSES = ("config.renderers.MessagePackRenderer",)
+    MSGPACK_PARSER_CLASSES = ("config.renderers.MessagePackParser",)
+else:
+    MSGPACK_RENDERER_CLASSES = MSGPACK_PARSER_CLASSES = ()
+
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+    # JSON через orjson (config.renderers); без пакета orjson — stdlib json.
+    # MessagePack (Accept/Content-Type: application/msgpack) — если
+    # установлен пакет msgpack
+    "DEFAULT_RENDERER_CLASSES": (
+        "config.renderers.FastJSONRenderer",
+        *MSGPACK_RENDERER_CLASSES,
+        "rest_framework.renderers.BrowsableAPIRenderer",
     ),
+    "DEFAULT_PARSER_CLASSES": (
+        "config.renderers.FastJSONParser",
+        *MSGPACK_PARSER_CLASSES,
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+    # JWT; в async-view пользователь загружается асинхронным ORM
+    "DEFAULT_AUTHENTICATION_CLASSES": ("users.authentication.AsyncJWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    # Сколько доверенных прокси перед приложением добавляют X-Forwarded-For:
+    # IP для троттлинга берётся оттуда, 0 — только REMOTE_ADDR
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 0)),
+    # У каждого эндпоинта свой бюджет: шторм логинов не съедает остальной API
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": os.environ.get("THROTTLE_LOGIN_IP", "30/min"),
+        "login_username": os.environ.get("THROTTLE_LOGIN_USERNAME", "5/min"),
+        "register_ip": os.environ.get("THROTTLE_REGISTER_IP", "10/hour"),
+        "register_username": os.environ.get("THROTTLE_REGISTER_USERNAME", "3/hour"),
+    },
 }
 
 SIMPLE_JWT = {
@@ -143,6 +241,129 @@ SIMPLE_JWT = {
 }
 
 
+# Пакетные запросы (habits.batch): элементов в пакете и потоков для
+# параллельного выполнения независимых GET
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+BATCH_READ_CONCURRENCY = int(os.environ.get("BATCH_READ_CONCURRENCY", 4))
+
+# Сжатие ответов (config.middleware.CompressionMiddleware): gzip или brotli
+# (если установлен пакет brotli) по Accept-Encoding
+RESPONSE_COMPRESSION_ENABLED = (
+    os.getenv("RESPONSE_COMPRESSION_ENABLED", "True") == "True"
+)
+RESPONSE_COMPRESSION_MIN_BYTES = int(
+    os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", 1024)
+)
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", 6))
+# 4–5: быстрые уровни для динамических ответов, 11 — только для статики
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", 4))
+
+# Схема OpenAPI (config.schema): генерируется командой
+# generate_openapi_schema или первым запросом и перегенерируется, только
+# когда меняется версия кода — CODE_VERSION (SHA коммита при деплое) или,
+# если она не задана, хэш исходников
+CODE_VERSION = os.environ.get("CODE_VERSION", "")
+OPENAPI_SCHEMA_PATH = os.environ.get(
+    "OPENAPI_SCHEMA_PATH", str(BASE_DIR / "var" / "openapi.json")
+)
+SWAGGER_SETTINGS = {"SPEC_URL": ("schema-file", {"format": "json"})}
+REDOC_SETTINGS = {"SPEC_URL": ("schema-file", {"format": "json"})}
+
+
+# Профилирование запросов (config/middleware.py)
+# Заголовок Server-Timing: SQL, аутентификация, сериализация, view, total
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED") == "True"
+# Профиль одного запроса по заголовку X-Profile: cprofile | sample (только staff)
+REQUEST_PROFILING_ENABLED = os.getenv("REQUEST_PROFILING_ENABLED") == "True"
+REQUEST_PROFILING_LIMIT = 50  # строк pstats в ответе
+REQUEST_PROFILING_SAMPLE_INTERVAL = 0.001  # секунд между снимками стека
+
+
+# Метрики в формате Prometheus (config/metrics.py), отдаются на /metrics/
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+# Общий Redis, куда сбрасывают метрики все web-процессы и воркеры Celery;
+# пустая строка — метрики только текущего процесса
+METRICS_REDIS_URL = os.environ.get("METRICS_REDIS_URL", "redis://localhost:6379/2")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+# Токен скрейпера; без него /metrics/ отвечает 403, если не включён
+# METRICS_PUBLIC (открытый доступ — только за закрытой сетью)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "False") == "True"
+
+
+# Cache (Redis) — общий для всех узлов, в нём хранятся счётчики троттлинга
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/1"),
+    }
+}
+
+
+# Кэш страниц списка привычек (habits.cache): LRU в памяти процесса перед
+# Redis, ключи версионируются по пользователю
+HABIT_LIST_CACHE_ENABLED = os.getenv("HABIT_LIST_CACHE_ENABLED", "True") == "True"
+HABIT_LIST_CACHE_TIMEOUT = int(os.environ.get("HABIT_LIST_CACHE_TIMEOUT", 300))
+HABIT_LIST_CACHE_LOCAL_ENTRIES = int(
+    os.environ.get("HABIT_LIST_CACHE_LOCAL_ENTRIES", 1024)
+)
+HABIT_LIST_CACHE_LOCAL_BYTES = int(
+    os.environ.get("HABIT_LIST_CACHE_LOCAL_BYTES", 16 * 1024 * 1024)
+)
+# Сколько секунд процесс верит своей копии версии списка без проверки
+# в Redis, пока слушатель шины инвалидации подключён
+HABIT_LIST_CACHE_VERSION_TTL = float(os.environ.get("HABIT_LIST_CACHE_VERSION_TTL", 30))
+
+
+# Шина инвалидации локальных кэшей (config.invalidation): postgres
+# (LISTEN/NOTIFY), redis (PUBLISH/SUBSCRIBE) или пустая строка — выключена,
+# и каждый процесс сверяет версии с Redis на каждом запросе
+CACHE_INVALIDATION_BACKEND = os.environ.get("CACHE_INVALIDATION_BACKEND", "")
+CACHE_INVALIDATION_REDIS_URL = os.environ.get(
+    "CACHE_INVALIDATION_REDIS_URL", CACHES["default"]["LOCATION"]
+)
+CACHE_INVALIDATION_CHANNEL = os.environ.get(
+    "CACHE_INVALIDATION_CHANNEL", "cache_invalidation"
+)
+if CACHE_INVALIDATION_BACKEND == "postgres" and DB_POOL_MODE == "pgbouncer":
+    # LISTEN не работает через PgBouncer в режиме пула транзакций
+    raise ImproperlyConfigured(
+        "CACHE_INVALIDATION_BACKEND=postgres несовместим с DB_POOL_MODE=pgbouncer"
+    )
+
+
+# SSE-поток напоминаний для веб-клиентов (habits.streams, только под ASGI):
+# send_habit_reminders публикует события в каналы пользователей Redis,
+# каждый узел подписан на каналы своих подключённых пользователей
+REMINDER_STREAM_ENABLED = os.getenv("REMINDER_STREAM_ENABLED", "True") == "True"
+REMINDER_STREAM_REDIS_URL = os.environ.get(
+    "REMINDER_STREAM_REDIS_URL", CACHES["default"]["LOCATION"]
+)
+REMINDER_STREAM_CHANNEL_PREFIX = os.environ.get(
+    "REMINDER_STREAM_CHANNEL_PREFIX", "reminders:"
+)
+# Секунды между heartbeat-комментариями в idle-потоке
+REMINDER_STREAM_HEARTBEAT = int(os.environ.get("REMINDER_STREAM_HEARTBEAT", 15))
+# Событий в очереди соединения; дальше старые вытесняются
+REMINDER_STREAM_QUEUE_SIZE = int(os.environ.get("REMINDER_STREAM_QUEUE_SIZE", 32))
+# Соединений на процесс; сверх лимита — 503 с Retry-After
+REMINDER_STREAM_MAX_CONNECTIONS = int(
+    os.environ.get("REMINDER_STREAM_MAX_CONNECTIONS", 20000)
+)
+# Время жизни потока в секундах, после которого клиент переподключается
+REMINDER_STREAM_MAX_AGE = int(os.environ.get("REMINDER_STREAM_MAX_AGE", 60 * 60))
+
+# Буфер отметок о выполнении привычек (habits.completions). Чтобы
+# подтверждённые отметки переживали перезапуск Redis, он должен работать
+# с appendonly yes и appendfsync always. Пустое значение — запись сразу в БД.
+COMPLETIONS_REDIS_URL = os.environ.get(
+    "COMPLETIONS_REDIS_URL", "redis://localhost:6379/3"
+)
+COMPLETIONS_FLUSH_INTERVAL = float(os.environ.get("COMPLETIONS_FLUSH_INTERVAL", 5))
+COMPLETIONS_FLUSH_BATCH = int(os.environ.get("COMPLETIONS_FLUSH_BATCH", 5000))
+COMPLETION_MAX_AGE_DAYS = int(os.environ.get("COMPLETION_MAX_AGE_DAYS", 7))
+
+
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
 
@@ -153,11 +374,97 @@ CELERY_BEAT_SCHEDULE = {
         "task": "habits.tasks.send_habit_reminders",
         "schedule": crontab(),
     },
+    "refresh-public-habit-catalog": {
+        "task": "habits.tasks.refresh_public_catalog",
+        "schedule": crontab(minute="*/15"),
+    },
+    "flush-habit-completions": {
+        "task": "habits.tasks.flush_habit_completions",
+        "schedule": COMPLETIONS_FLUSH_INTERVAL,
+    },
+    "create-habit-completion-partitions": {
+        "task": "habits.tasks.create_completion_partitions",
+        "schedule": crontab(hour=3, minute=0),
+    },
+}
+
+# Очереди Celery. Воркер без -Q слушает все; в продакшене на каждую
+# очередь — свои воркеры с профилем из WORKER_QUEUE_PROFILES
+# (config.workers): доставка и повторы — пул eventlet
+# (celery -A config worker -Q reminders.delivery -P eventlet), тысячи
+# одновременных запросов к Telegram на процесс; планирование и webhook —
+# prefork, там работа с БД.
+REMINDER_PLANNING_QUEUE = "reminders.planning"
+REMINDER_DELIVERY_QUEUE = "reminders.delivery"
+REMINDER_RETRY_QUEUE = "reminders.retries"
+TELEGRAM_WEBHOOK_QUEUE = "telegram.webhook"
+
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+CELERY_TASK_QUEUES = [
+    Queue(name)
+    for name in (
+        CELERY_TASK_DEFAULT_QUEUE,
+        REMINDER_PLANNING_QUEUE,
+        REMINDER_DELIVERY_QUEUE,
+        REMINDER_RETRY_QUEUE,
+        TELEGRAM_WEBHOOK_QUEUE,
+    )
+]
+# Повторы deliver_reminder идут в REMINDER_RETRY_QUEUE (habits.tasks)
+CELERY_TASK_ROUTES = {
+    "habits.tasks.send_habit_reminders": {"queue": REMINDER_PLANNING_QUEUE},
+    "habits.tasks.deliver_reminder": {"queue": REMINDER_DELIVERY_QUEUE},
+    "users.tasks.process_telegram_update": {"queue": TELEGRAM_WEBHOOK_QUEUE},
+}
+# Число задач, которые воркер забирает из брокера впрок, —
+# concurrency * prefetch_multiplier
+WORKER_QUEUE_PROFILES = {
+    REMINDER_PLANNING_QUEUE: {
+        "pool": "prefork",
+        "concurrency": int(os.environ.get("PLANNING_WORKER_CONCURRENCY", 2)),
+        "prefetch_multiplier": 1,
+    },
+    REMINDER_DELIVERY_QUEUE: {
+        "pool": "eventlet",
+        "concurrency": int(os.environ.get("DELIVERY_WORKER_CONCURRENCY", 1000)),
+        "prefetch_multiplier": 1,
+    },
+    REMINDER_RETRY_QUEUE: {
+        "pool": "eventlet",
+        "concurrency": int(os.environ.get("RETRY_WORKER_CONCURRENCY", 200)),
+        "prefetch_multiplier": 1,
+    },
+    TELEGRAM_WEBHOOK_QUEUE: {
+        "pool": "prefork",
+        "concurrency": int(os.environ.get("WEBHOOK_WORKER_CONCURRENCY", 4)),
+        "prefetch_multiplier": 4,
+    },
 }
+# Повторы доставки напоминания: сеть, 429 и 5xx от Telegram
+REMINDER_DELIVERY_MAX_RETRIES = int(os.environ.get("REMINDER_DELIVERY_MAX_RETRIES", 3))
+# Секунды до первого повтора, дальше задержка удваивается
+REMINDER_DELIVERY_RETRY_DELAY = int(os.environ.get("REMINDER_DELIVERY_RETRY_DELAY", 30))
+
+# Несколько экземпляров celery beat: задачи отправляет только ведущий
+# (config.beat.LeaderScheduler), остальные подхватывают при его падении
+CELERY_BEAT_SCHEDULER = "config.beat:LeaderScheduler"
+BEAT_REDIS_URL = os.environ.get("BEAT_REDIS_URL", CELERY_BROKER_URL)
+BEAT_LOCK_PREFIX = os.environ.get("BEAT_LOCK_PREFIX", "beat:")
+# Через сколько секунд без продления блокировку ведущего забирает другой узел
+BEAT_LEADER_LOCK_TTL = int(os.environ.get("BEAT_LEADER_LOCK_TTL", 30))
+BEAT_LEADER_RENEW_INTERVAL = int(os.environ.get("BEAT_LEADER_RENEW_INTERVAL", 10))
+# Сколько секунд помним обработанный такт (config.beat.tick_lock)
+BEAT_TICK_LOCK_TTL = int(os.environ.get("BEAT_TICK_LOCK_TTL", 10 * 60))
 
 # Telegram
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+# Сколько секунд помним update_id, чтобы не обрабатывать повторы от Telegram
+TELEGRAM_UPDATE_DEDUP_TTL = int(
+    os.environ.get("TELEGRAM_UPDATE_DEDUP_TTL", 24 * 60 * 60)
+)
+# Обрабатывать обновления в самом webhook (ASGI), а не в очереди Celery
+TELEGRAM_WEBHOOK_INLINE = os.getenv("TELEGRAM_WEBHOOK_INLINE", "False") == "True"
 
 
 frontend_origins = os.environ.get("FRONTEND_ORIGINS", "")
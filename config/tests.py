@@ -0,0 +1,781 @@
+import gzip
+import json
+import os
+import uuid
+import re
+from datetime import datetime, time, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from io import BytesIO, StringIO
+import tempfile
+import threading
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+import redis
+from celery.beat import PersistentScheduler
+from celery.signals import worker_process_shutdown
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import celery_app
+from config.beat import LeaderScheduler, tick_lock
+from config.database import copy_from, pooling_settings, process_role
+from config.db_router import (
+    MONITOR,
+    ReplicaRouter,
+    recent_write_key,
+    replica_reads,
+    replica_reads_active,
+)
+from config import schema
+from config.invalidation import InvalidationBus
+from config.middleware import CompressionMiddleware, accepted_encodings
+from config.workers import apply_queue_profile
+from config.renderers import FastJSONParser, FastJSONRenderer
+from config.metrics import HABIT_REMINDERS, REGISTRY, STORE, Histogram, render
+from habits.models import Habit
+from habits.tasks import send_habit_reminders
+from habits.views import HabitViewSet
+from users.models import User
+
+
+def parse_server_timing(value):
+    """
+    'sql;dur=1.20;desc="2 queries", total;dur=3.40' -> {"sql": (1.2, '2 queries'), ...}
+    """
+    metrics = {}
+    for item in value.split(", "):
+        name, *params = item.split(";")
+        params = dict(param.split("=", 1) for param in params)
+        metrics[name] = (float(params["dur"]), params.get("desc", "").strip('"'))
+    return metrics
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, REQUEST_PROFILING_ENABLED=True)
+class ServerTimingMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", password="pass12345")
+        self.staff = User.objects.create_user(
+            username="staff", password="pass12345", is_staff=True
+        )
+        Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time="08:00",
+            action="Выпить воды",
+            reward="Чай",
+            time_to_complete=60,
+        )
+        self.url = reverse("habits:habit-list")
+
+    def auth(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_server_timing_header_breaks_down_request(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        metrics = parse_server_timing(response["Server-Timing"])
+        self.assertTrue(
+            {"auth", "serialize", "render", "sql", "view", "total"} <= set(metrics)
+        )
+        self.assertEqual(metrics["sql"][1], "2 queries")
+        self.assertGreaterEqual(metrics["total"][0], metrics["view"][0])
+
+    def test_staff_gets_cprofile_report(self):
+        self.auth(self.staff)
+
+        response = self.client.get(self.url, HTTP_X_PROFILE="cprofile")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Profile"], "cprofile")
+        self.assertIn("function calls", response.content.decode())
+
+    def test_staff_gets_stack_samples(self):
+        self.auth(self.staff)
+
+        with override_settings(REQUEST_PROFILING_SAMPLE_INTERVAL=0.0001):
+            response = self.client.get(self.url, HTTP_X_PROFILE="sample")
+
+        self.assertEqual(response["X-Profile"], "sample")
+        for line in response.content.decode().splitlines():
+            self.assertRegex(line, re.compile(r"^\S.* \d+$"))
+
+    def test_non_staff_header_is_ignored(self):
+        self.auth(self.user)
+
+        response = self.client.get(self.url, HTTP_X_PROFILE="cprofile")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile", response)
+        self.assertEqual(response.json()["count"], 1)
+
+    async def test_async_chain_counts_queries_of_async_view(self):
+        # Под ASGI SQL async-view выполняется в потоке sync_to_async
+        token = RefreshToken.for_user(self.user).access_token
+
+        response = await self.async_client.get(
+            self.url, headers={"Authorization": f"Bearer {token}"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        metrics = parse_server_timing(response["Server-Timing"])
+        self.assertTrue({"auth", "serialize", "sql", "total"} <= set(metrics))
+        # пользователь, count и страница
+        self.assertEqual(metrics["sql"][1], "3 queries")
+
+    @override_settings(SERVER_TIMING_ENABLED=False, REQUEST_PROFILING_ENABLED=False)
+    def test_disabled_middleware_is_not_used(self):
+        self.auth(self.staff)
+
+        response = self.client.get(self.url, HTTP_X_PROFILE="cprofile")
+
+        self.assertNotIn("Server-Timing", response)
+        self.assertNotIn("X-Profile", response)
+
+
+@override_settings(
+    METRICS_REDIS_URL="", METRICS_FLUSH_INTERVAL=0, HABIT_LIST_CACHE_ENABLED=False
+)
+class MetricsTests(APITestCase):
+    def setUp(self):
+        STORE.clear()
+        self.user = User.objects.create_user(username="user", password="pass12345")
+
+    def test_request_latency_and_queries_per_view_action(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("habits:habit-list"))
+        self.client.get(reverse("habits:habit-list"))
+
+        metrics = render()
+
+        labels = 'action="list",method="GET",status="2xx",view="HabitViewSet"'
+        self.assertIn(f"http_request_duration_seconds_count{{{labels}}} 2", metrics)
+        self.assertIn(
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', metrics
+        )
+        self.assertIn(
+            'http_request_db_queries_sum{action="list",view="HabitViewSet"} 2',
+            metrics,
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("test_histogram", "Тест.", ("kind",), buckets=(1, 5))
+        self.addCleanup(REGISTRY.remove, histogram)
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value, kind="a")
+
+        lines = histogram.expose(STORE.snapshot())
+
+        self.assertEqual(
+            lines[2:],
+            [
+                'test_histogram_bucket{kind="a",le="1"} 2',
+                'test_histogram_bucket{kind="a",le="5"} 3',
+                'test_histogram_bucket{kind="a",le="+Inf"} 4',
+                'test_histogram_sum{kind="a"} 14.5',
+                'test_histogram_count{kind="a"} 4',
+            ],
+        )
+
+    def test_celery_task_duration_and_outcome(self):
+        send_habit_reminders.apply()
+
+        self.assertIn(
+            'celery_task_duration_seconds_count{outcome="success",'
+            'task="habits.tasks.send_habit_reminders"} 1',
+            render(),
+        )
+
+    @override_settings(METRICS_FLUSH_INTERVAL=60)
+    def test_redis_flush_uses_one_pipeline_and_keeps_deltas_on_error(self):
+        client = MagicMock()
+        pipe = client.pipeline.return_value
+        pipe.execute.side_effect = redis.ConnectionError
+        HABIT_REMINDERS.inc(3, result="sent")
+
+        with patch.object(STORE, "client", return_value=client):
+            STORE.flush()
+            pipe.hincrbyfloat.assert_called_once_with(
+                "metrics", 'habit_reminders_total||result="sent"', 3
+            )
+            self.assertEqual(STORE.pending['habit_reminders_total||result="sent"'], 3)
+
+            pipe.execute.side_effect = None
+            STORE.flush()
+            self.assertFalse(STORE.pending)
+
+    def test_record_does_not_flush_inline(self):
+        with patch.object(STORE, "flush") as flush:
+            HABIT_REMINDERS.inc(result="sent")
+
+        flush.assert_not_called()
+        self.assertEqual(STORE.pid, os.getpid())
+
+    def test_task_does_not_flush_until_worker_shutdown(self):
+        with patch.object(STORE, "flush") as flush:
+            send_habit_reminders.apply()
+            flush.assert_not_called()
+
+            worker_process_shutdown.send(sender=None, pid=os.getpid(), exitcode=0)
+        flush.assert_called_once_with()
+
+    def test_snapshot_falls_back_to_process_values_when_redis_is_down(self):
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError
+        client.hgetall.side_effect = redis.ConnectionError
+        HABIT_REMINDERS.inc(2, result="sent")
+
+        with patch.object(STORE, "client", return_value=client):
+            with self.assertLogs("config.metrics", "WARNING"):
+                metrics = render()
+
+        self.assertIn('habit_reminders_total{result="sent"} 2', metrics)
+
+    @override_settings(METRICS_TOKEN="", METRICS_PUBLIC=False)
+    def test_endpoint_is_closed_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        with self.settings(METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "# TYPE http_request_duration_seconds histogram", response.content.decode()
+        )
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0", "replica_1"], REPLICA_MAX_LAG=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.lags = {"replica_0": 1.0, "replica_1": 1.0}
+        patcher = patch.object(MONITOR, "lag", side_effect=self.lags.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_default_outside_replica_block(self):
+        self.assertIsNone(self.router.db_for_read(Habit))
+
+    def test_reads_go_to_fresh_replicas_only(self):
+        self.lags["replica_1"] = 30.0
+
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Habit), "replica_0")
+
+            self.lags["replica_0"] = None  # недоступна
+            self.assertIsNone(self.router.db_for_read(Habit))
+
+    def test_replica_is_pinned_for_the_whole_block(self):
+        chosen = set()
+        for _ in range(10):
+            with replica_reads():
+                aliases = {self.router.db_for_read(Habit) for _ in range(10)}
+            self.assertEqual(len(aliases), 1)
+            chosen |= aliases
+        self.assertLessEqual(chosen, {"replica_0", "replica_1"})
+
+    def test_block_stays_on_primary_after_pinned_replica_fails(self):
+        with patch("config.db_router.random.choice", return_value="replica_0"):
+            with replica_reads():
+                self.assertEqual(self.router.db_for_read(Habit), "replica_0")
+                self.lags["replica_0"] = None
+                self.assertIsNone(self.router.db_for_read(Habit))
+                self.lags["replica_0"] = 1.0
+                self.assertIsNone(self.router.db_for_read(Habit))
+
+    def test_writes_and_migrations_stay_on_default(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Habit), "default")
+        self.assertFalse(self.router.allow_migrate("replica_0", "habits"))
+        self.assertIsNone(self.router.allow_migrate("default", "habits"))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    HABIT_LIST_CACHE_ENABLED=False,
+)
+class ReplicaReadMixinTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user", password="pass12345")
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_reads_own_writes_from_primary(self):
+        seen = []
+        get_queryset = HabitViewSet.get_queryset
+
+        def spy(view):
+            seen.append(replica_reads_active())
+            return get_queryset(view)
+
+        with patch.object(HabitViewSet, "get_queryset", spy):
+            self.client.get(reverse("habits:habit-list"))
+            self.client.post(
+                reverse("habits:habit-list"),
+                {
+                    "place": "Дом",
+                    "time": "08:00",
+                    "action": "Зарядка",
+                    "reward": "Чай",
+                    "time_to_complete": 60,
+                },
+                format="json",
+            )
+            self.client.get(reverse("habits:habit-list"))
+            cache.delete(recent_write_key(self.user.pk))
+            self.client.get(reverse("habits:habit-list"))
+
+        self.assertEqual(seen, [True, False, True])
+        self.assertFalse(replica_reads_active())
+
+
+class PoolingSettingsTests(SimpleTestCase):
+    def test_process_role_detection(self):
+        self.assertEqual(
+            process_role(["/venv/bin/celery", "-A", "config"], {}), "celery"
+        )
+        self.assertEqual(process_role(["manage.py", "runserver"], {}), "web")
+        self.assertEqual(
+            process_role(["gunicorn"], {"PROCESS_ROLE": "celery"}), "celery"
+        )
+        with self.assertRaises(ImproperlyConfigured):
+            process_role(["gunicorn"], {"PROCESS_ROLE": "cron"})
+
+    def test_persistent_connections_use_role_defaults_and_overrides(self):
+        self.assertEqual(
+            pooling_settings("persistent", "web", {}),
+            {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True},
+        )
+        self.assertEqual(
+            pooling_settings(
+                "persistent",
+                "celery",
+                {"DB_CONN_MAX_AGE": "30", "DB_CONN_MAX_AGE_CELERY": "600"},
+            )["CONN_MAX_AGE"],
+            600,
+        )
+
+    @patch("config.database.find_spec", return_value=object())
+    def test_pool_is_sized_per_role(self, _):
+        settings = pooling_settings("pool", "celery", {"DB_POOL_MAX_SIZE_CELERY": "2"})
+
+        self.assertEqual(settings["CONN_MAX_AGE"], 0)
+        self.assertEqual(
+            settings["OPTIONS"]["pool"], {"min_size": 1, "max_size": 2, "timeout": 10}
+        )
+
+    @patch("config.database.find_spec", return_value=None)
+    def test_pool_requires_psycopg_pool(self, find_spec):
+        with self.assertRaises(ImproperlyConfigured):
+            pooling_settings("pool", "web", {})
+        find_spec.assert_called_once_with("psycopg_pool")
+
+    def test_copy_from_streams_chunks_without_copy_expert(self):
+        cursor = MagicMock(spec=["copy"])
+        copy = cursor.copy.return_value.__enter__.return_value
+
+        with patch("config.database.COPY_CHUNK_SIZE", 4):
+            copy_from(cursor, "COPY t FROM STDIN", StringIO("1,a\n2,b\n"))
+
+        cursor.copy.assert_called_once_with("COPY t FROM STDIN")
+        self.assertEqual(
+            "".join(call.args[0] for call in copy.write.call_args_list), "1,a\n2,b\n"
+        )
+
+    def test_pgbouncer_mode_disables_server_side_cursors(self):
+        settings = pooling_settings("pgbouncer", "web", {})
+
+        self.assertTrue(settings["DISABLE_SERVER_SIDE_CURSORS"])
+        self.assertNotIn("OPTIONS", settings)
+        with self.assertRaises(ImproperlyConfigured):
+            pooling_settings("pgpool", "web", {})
+
+
+class InvalidationBusTests(SimpleTestCase):
+    def setUp(self):
+        self.bus = InvalidationBus()
+        self.received = []
+        self.bus.subscribe("habits", self.received.append)
+
+    @override_settings(CACHE_INVALIDATION_BACKEND="")
+    def test_publish_dispatches_locally_when_disabled(self):
+        self.bus.publish("habits", 42)
+        self.bus.publish("users", 7)
+
+        self.assertEqual(self.received, ["42"])
+        self.assertFalse(self.bus.healthy())
+
+    @override_settings(CACHE_INVALIDATION_BACKEND="redis")
+    def test_redis_publish_failure_is_not_raised(self):
+        client = MagicMock()
+        client.publish.side_effect = redis.ConnectionError
+        with patch.object(self.bus, "redis", return_value=client):
+            self.bus.publish("habits", 42)
+
+        client.publish.assert_called_once_with("cache_invalidation", "habits:42")
+        self.assertEqual(self.received, ["42"])
+
+    def test_failing_handler_does_not_stop_others(self):
+        self.bus.subscribe("habits", MagicMock(side_effect=RuntimeError))
+        self.bus.subscribe("habits", self.received.append)
+
+        self.bus.dispatch("habits:5")
+
+        self.assertEqual(self.received, ["5", "5"])
+
+
+@skipUnless(connection.vendor == "postgresql", "LISTEN/NOTIFY есть только в PostgreSQL")
+@override_settings(CACHE_INVALIDATION_BACKEND="postgres")
+class PostgresInvalidationBusTests(TransactionTestCase):
+    def test_notify_reaches_listener_after_commit(self):
+        bus = InvalidationBus()
+        delivered = threading.Event()
+        resets = []
+        bus.subscribe("habits", lambda key: key == "42" and delivered.set())
+        bus.on_reset(lambda: resets.append(True))
+        bus.start()
+        self.addCleanup(bus.stop)
+        self.assertTrue(bus.connected.wait(5))
+        self.assertTrue(bus.healthy())
+        self.assertEqual(resets, [True])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)", ["cache_invalidation", "habits:42"]
+            )
+
+        self.assertTrue(delivered.wait(1))
+
+
+class OpenAPISchemaTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "openapi.json")
+        overrides = override_settings(CODE_VERSION="v1", OPENAPI_SCHEMA_PATH=self.path)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        schema._artifact = None
+        self.addCleanup(setattr, schema, "_artifact", None)
+        self.url = reverse("schema-file", kwargs={"format": "json"})
+
+    def test_schema_is_generated_once_and_served_with_etag(self):
+        with patch(
+            "config.schema.generate_document", wraps=schema.generate_document
+        ) as generate:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            yaml = self.client.get(reverse("schema-file", kwargs={"format": "yaml"}))
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        self.assertIn("/habits/", first.json()["paths"])
+        self.assertEqual(first.json()["x-code-version"], "v1")
+        self.assertTrue(yaml.content.startswith(b"swagger:"))
+        with open(self.path, encoding="utf-8") as file:
+            self.assertEqual(json.load(file)["x-code-version"], "v1")
+
+    def test_schema_file_of_current_version_is_reused(self):
+        call_command("generate_openapi_schema", stdout=StringIO())
+        with patch("config.schema.generate_document") as generate:
+            response = self.client.get(self.url)
+
+        generate.assert_not_called()
+        self.assertEqual(response.json()["x-code-version"], "v1")
+
+    def test_new_code_version_regenerates_schema(self):
+        first = self.client.get(self.url)
+
+        with override_settings(CODE_VERSION="v2"):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(response.json()["x-code-version"], "v2")
+
+    def test_ui_pages_do_not_generate_schema(self):
+        with patch("config.schema.generate_document") as generate:
+            swagger = self.client.get(reverse("schema-swagger-ui"))
+            redoc = self.client.get(reverse("schema-redoc"))
+            spec = self.client.get(reverse("schema-swagger-ui"), {"format": "openapi"})
+
+        generate.assert_not_called()
+        self.assertEqual(swagger.status_code, 200)
+        self.assertContains(swagger, "/swagger.json")
+        self.assertEqual(redoc.status_code, 200)
+        self.assertEqual(spec.status_code, 404)
+
+
+class FastJSONTests(SimpleTestCase):
+    data = {
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "created_at": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "time": time(8, 30),
+        "adherence": Decimal("0.75"),
+        "action": "Зарядка",
+        "results": [{"id": 1, "reward": None}],
+    }
+
+    def test_renders_like_drf_renderer(self):
+        rendered = FastJSONRenderer().render(self.data)
+
+        self.assertEqual(
+            json.loads(rendered), json.loads(JSONRenderer().render(self.data))
+        )
+        self.assertIn("Зарядка".encode(), rendered)
+
+    def test_falls_back_to_stdlib_json_without_orjson(self):
+        with patch("config.renderers.orjson", None):
+            rendered = FastJSONRenderer().render(self.data)
+            parsed = FastJSONParser().parse(BytesIO(rendered))
+
+        self.assertEqual(rendered, JSONRenderer().render(self.data))
+        self.assertEqual(parsed["action"], "Зарядка")
+
+    def test_parser_rejects_invalid_json(self):
+        parser = FastJSONParser()
+
+        self.assertEqual(parser.parse(BytesIO(b'{"a": [1, 2.5]}')), {"a": [1, 2.5]})
+        for body in (b"{", b'{"a": NaN}'):
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
+
+
+@override_settings(RESPONSE_COMPRESSION_MIN_BYTES=100)
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = json.dumps([{"action": "Зарядка", "place": "Дом"}] * 50).encode()
+
+    def respond(self, body=None, accept="gzip, deflate"):
+        response = HttpResponse(body or self.body, content_type="application/json")
+        response["ETag"] = '"abc"'
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept))
+
+    def test_large_response_is_gzipped(self):
+        response = self.respond()
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_small_or_unaccepted_responses_are_not_compressed(self):
+        for response in (
+            self.respond(body=b"[]"),
+            self.respond(accept=""),
+            self.respond(accept="gzip;q=0"),
+        ):
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_brotli_is_preferred_when_installed(self):
+        brotli = MagicMock()
+        brotli.compress.return_value = b"br-body"
+        with patch("config.middleware.brotli", brotli):
+            response = self.respond(accept="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response.content, b"br-body")
+
+        with patch("config.middleware.brotli", None):
+            response = self.respond(accept="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_accept_encoding_parsing(self):
+        self.assertEqual(
+            accepted_encodings("gzip;q=0.5, br;q=0, identity, deflate;q=x"),
+            {"gzip", "identity"},
+        )
+
+
+@override_settings(
+    METRICS_REDIS_URL="",
+    BEAT_LEADER_LOCK_TTL=30,
+    BEAT_LEADER_RENEW_INTERVAL=10,
+)
+class LeaderSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        STORE.clear()
+        self.client = MagicMock()
+        patcher = patch("config.beat.redis_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.scheduler = LeaderScheduler(
+            app=celery_app, schedule_filename=os.path.join(tmp.name, "schedule")
+        )
+        self.addCleanup(self.scheduler.close)
+
+    def test_only_leader_sends_tasks(self):
+        self.client.set.return_value = None
+        with patch.object(PersistentScheduler, "tick", return_value=0) as tick:
+            self.assertEqual(self.scheduler.tick(), 10)
+            tick.assert_not_called()
+
+            self.client.set.return_value = True
+            self.assertEqual(self.scheduler.tick(), 0)
+            tick.assert_called_once()
+
+        self.client.set.assert_called_with(
+            "beat:leader", self.scheduler.node, nx=True, px=30000
+        )
+        self.assertLessEqual(self.scheduler.max_interval, 10)
+        self.assertIn('beat_leadership_changes_total{result="acquired"} 1', render())
+
+    def test_leader_renews_and_steps_down_when_lock_is_lost(self):
+        self.client.set.return_value = True
+        self.assertTrue(self.scheduler.elect())
+
+        self.client.eval.return_value = 1
+        self.assertTrue(self.scheduler.elect())
+        self.client.eval.return_value = 0
+        self.assertFalse(self.scheduler.elect())
+
+        self.assertEqual(
+            self.client.eval.call_args.args[2:],
+            ("beat:leader", self.scheduler.node, 30000),
+        )
+        self.assertIn('beat_leadership_changes_total{result="lost"} 1', render())
+
+    def test_leader_keeps_lease_while_redis_is_down(self):
+        self.client.set.return_value = True
+        with patch("config.beat.time") as clock:
+            clock.monotonic.return_value = 100
+            self.scheduler.elect()
+
+        self.client.eval.side_effect = redis.ConnectionError
+        with patch("config.beat.time") as clock:
+            clock.monotonic.return_value = 129
+            self.assertTrue(self.scheduler.elect())
+        with patch("config.beat.time") as clock:
+            clock.monotonic.return_value = 131
+            self.assertFalse(self.scheduler.elect())
+
+    def test_close_releases_leadership(self):
+        self.client.set.return_value = True
+        self.scheduler.elect()
+
+        self.scheduler.close()
+
+        self.assertFalse(self.scheduler.leader)
+        self.assertIn(self.scheduler.node, self.client.eval.call_args.args)
+
+
+@override_settings(METRICS_REDIS_URL="", BEAT_TICK_LOCK_TTL=600)
+class TickLockTests(SimpleTestCase):
+    def setUp(self):
+        STORE.clear()
+        self.client = MagicMock()
+        patcher = patch("config.beat.redis_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tick_runs_once(self):
+        self.client.set.side_effect = [True, None]
+        runs = []
+        for _ in range(2):
+            with tick_lock("task", "2026-01-01T08:00", 60) as run:
+                runs.append(run)
+
+        self.assertEqual(runs, [True, False])
+        key = self.client.set.call_args.args[0]
+        self.assertEqual(key, "beat:tick:task:2026-01-01T08:00")
+        self.assertEqual(self.client.set.call_args.kwargs, {"nx": True, "ex": 600})
+        metrics = render()
+        self.assertIn('beat_tick_locks_total{result="acquired",task="task"} 1', metrics)
+        self.assertIn('beat_tick_locks_total{result="skipped",task="task"} 1', metrics)
+
+    def test_overrun_is_counted(self):
+        self.client.set.return_value = True
+        with patch("config.beat.time") as clock:
+            clock.monotonic.side_effect = [0, 61]
+            with tick_lock("task", "2026-01-01T08:00", 60):
+                pass
+
+        self.assertIn('beat_tick_overruns_total{task="task"} 1', render())
+
+    def test_runs_when_redis_is_down(self):
+        self.client.set.side_effect = redis.ConnectionError
+        with self.assertLogs("config.beat", "WARNING"):
+            with tick_lock("task", "2026-01-01T08:00", 60) as run:
+                self.assertTrue(run)
+
+
+class TaskRoutingTests(SimpleTestCase):
+    def test_tasks_are_routed_to_their_queues(self):
+        router = celery_app.amqp.router
+        for task, queue in (
+            ("habits.tasks.send_habit_reminders", "reminders.planning"),
+            ("habits.tasks.deliver_reminder", "reminders.delivery"),
+            ("users.tasks.process_telegram_update", "telegram.webhook"),
+            ("habits.tasks.refresh_public_catalog", "celery"),
+        ):
+            self.assertEqual(router.route({}, task)["queue"].name, queue)
+
+    def worker(self, queues, pool):
+        app = MagicMock()
+        app.amqp.queues.consume_from = dict.fromkeys(queues)
+        return SimpleNamespace(
+            app=app, pool_cls=pool, concurrency=8, prefetch_multiplier=4
+        )
+
+    @override_settings(
+        WORKER_QUEUE_PROFILES={
+            "reminders.delivery": {
+                "pool": "eventlet",
+                "concurrency": 1000,
+                "prefetch_multiplier": 1,
+            }
+        }
+    )
+    def test_worker_profile_is_applied_by_queue(self):
+        delivery = self.worker(["reminders.delivery"], "eventlet")
+        apply_queue_profile(sender=delivery)
+        self.assertEqual(
+            (delivery.concurrency, delivery.prefetch_multiplier), (1000, 1)
+        )
+
+        # Без профиля или с несколькими очередями — как в командной строке
+        for worker in (
+            self.worker(["celery"], "prefork"),
+            self.worker(["reminders.delivery", "celery"], "eventlet"),
+        ):
+            apply_queue_profile(sender=worker)
+            self.assertEqual((worker.concurrency, worker.prefetch_multiplier), (8, 4))
+
+        prefork = self.worker(["reminders.delivery"], "prefork")
+        with self.assertLogs("config.workers", "WARNING"):
+            apply_queue_profile(sender=prefork)
+        self.assertEqual(prefork.concurrency, 8)
@@ -1,18 +1,14 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from drf_yasg.renderers import ReDocRenderer, SwaggerUIRenderer
 from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework import permissions
 
+from config.metrics import metrics_view
+from config.schema import API_INFO, schema_file_view
+
 schema_view = get_schema_view(
-    openapi.Info(
-        title="Habit Tracker API",
-        default_version="v1",
-        description="API для сервиса отслеживания привычек",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="support@example.com"),
-        license=openapi.License(name="MIT License"),
-    ),
+    API_INFO,
     public=True,
     permission_classes=(permissions.AllowAny,),
 )
@@ -20,16 +16,24 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", metrics_view, name="metrics"),
     path("", include("habits.urls", namespace="habits")),
     path("", include("users.urls", namespace="users")),
+    # Сама схема отдаётся готовой из config.schema (SPEC_URL в SWAGGER_SETTINGS
+    # и REDOC_SETTINGS); страницы UI без рендереров схемы не интроспектируют API
+    re_path(
+        r"^swagger\.(?P<format>json|yaml)$",
+        schema_file_view,
+        name="schema-file",
+    ),
     path(
         "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
+        schema_view.as_cached_view(renderer_classes=[SwaggerUIRenderer]),
         name="schema-swagger-ui",
     ),
     path(
         "redoc/",
-        schema_view.with_ui("redoc", cache_timeout=0),
+        schema_view.as_cached_view(renderer_classes=[ReDocRenderer]),
         name="schema-redoc",
     ),
 ]
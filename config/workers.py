@@ -0,0 +1,57 @@
+import logging
+
+from celery.concurrency import ALIASES
+from celery.signals import worker_init
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def pool_name(pool):
+    """
+    "eventlet", "celery.concurrency.eventlet:TaskPool" или сам класс пула
+    -> "celery.concurrency.eventlet:TaskPool".
+    """
+    if isinstance(pool, str):
+        return ALIASES.get(pool, pool)
+    return f"{pool.__module__}:{pool.__name__}"
+
+
+def queue_profile(queues):
+    """
+    Профиль из WORKER_QUEUE_PROFILES, если воркер слушает ровно одну
+    очередь с профилем; иначе None.
+    """
+    queues = set(queues)
+    if len(queues) != 1:
+        return None
+    return settings.WORKER_QUEUE_PROFILES.get(queues.pop())
+
+
+@worker_init.connect
+def apply_queue_profile(sender=None, **kwargs):
+    """
+    Параметры воркера по очереди, которую он слушает (-Q): concurrency
+    и prefetch_multiplier из профиля заменяют значения командной строки,
+    пока пул ещё не создан.
+
+    Пул выбирается только в командной строке (-P eventlet): eventlet
+    подменяет модули стандартной библиотеки при старте процесса, до импорта
+    Django. Если пул воркера не совпадает с профилем, профиль не
+    применяется: тысяча процессов prefork вместо зелёных потоков положила бы
+    узел.
+    """
+    queues = sender.app.amqp.queues.consume_from
+    profile = queue_profile(queues)
+    if profile is None:
+        return
+    if pool_name(sender.pool_cls) != pool_name(profile["pool"]):
+        logger.warning(
+            "Воркер очереди %s запущен с пулом %s, а не %s: профиль не применён",
+            ", ".join(queues),
+            sender.pool_cls,
+            profile["pool"],
+        )
+        return
+    sender.concurrency = profile["concurrency"]
+    sender.prefetch_multiplier = profile["prefetch_multiplier"]
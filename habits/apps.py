@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class HabitsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "habits"
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_save, pre_delete
+
+        from .cache import habit_changed, habit_deleting
+        from .catalog import habit_deleted, habit_saved
+        from .models import Habit
+        from .sharding import delete_user_habits
+
+        pre_delete.connect(delete_user_habits, sender=get_user_model())
+        post_save.connect(habit_saved, sender=Habit)
+        post_delete.connect(habit_deleted, sender=Habit)
+        post_save.connect(habit_changed, sender=Habit)
+        post_delete.connect(habit_changed, sender=Habit)
+        pre_delete.connect(habit_deleting, sender=Habit)
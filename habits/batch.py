@@ -0,0 +1,249 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections, transaction
+from django.urls import Resolver404, resolve
+
+from config.renderers import (
+    MSGPACK_MEDIA_TYPE,
+    FastJSONRenderer,
+    MessagePackRenderer,
+    binary_request,
+)
+
+from .apps import HabitsConfig
+from .sharding import shard_for_user
+
+# Маршруты привычек, доступные из пакета (без самого пакета)
+BATCH_ROUTES = {
+    "habit-list",
+    "habit-detail",
+    "habit-complete",
+    "habit-stats",
+    "public-habits",
+}
+
+# "$0.id" — поле ответа элемента 0; в пути — подстрока, в теле — значение целиком
+REFERENCE = re.compile(r"\$(\d+)\.(\w+)")
+
+# Метаданные исходного запроса, которые наследуют элементы пакета
+INHERITED_META = (
+    "SERVER_NAME",
+    "SERVER_PORT",
+    "REMOTE_ADDR",
+    "HTTP_HOST",
+    "HTTP_X_FORWARDED_HOST",
+    "HTTP_X_FORWARDED_PROTO",
+    "HTTP_X_FORWARDED_FOR",
+)
+
+
+class BatchAborted(Exception):
+    pass
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+def references(item):
+    """
+    Номера элементов, на результаты которых ссылается item.
+    """
+    found = {int(index) for index, _ in REFERENCE.findall(item["path"])}
+    stack = [item.get("body")]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, str):
+            found |= {int(index) for index, _ in REFERENCE.findall(value)}
+    return found
+
+
+def referenced_value(results, index, field):
+    result = results[index] if index < len(results) else None
+    if result is None or result["status"] >= 400:
+        raise UnresolvedReference(f"Элемент {index} не выполнен.")
+    body = result["body"]
+    if not isinstance(body, dict) or field not in body:
+        raise UnresolvedReference(f"В ответе элемента {index} нет поля {field}.")
+    return body[field]
+
+
+def substitute(value, results):
+    if isinstance(value, dict):
+        return {key: substitute(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, results) for item in value]
+    if isinstance(value, str):
+        match = REFERENCE.fullmatch(value)
+        if match:
+            return referenced_value(results, int(match[1]), match[2])
+    return value
+
+
+def substitute_path(path, results):
+    return REFERENCE.sub(
+        lambda match: str(referenced_value(results, int(match[1]), match[2])), path
+    )
+
+
+class Batch:
+    """
+    Выполнение пакета подзапросов к маршрутам привычек от имени уже
+    аутентифицированного пользователя: JWT проверяется один раз, элементы
+    вызывают view напрямую, минуя middleware и повторную аутентификацию.
+
+    Подряд идущие GET без ссылок на результаты выполняются параллельно
+    (до BATCH_READ_CONCURRENCY потоков), остальные элементы — по порядку.
+    С atomic=True все элементы выполняются последовательно в одной
+    транзакции (шард пользователя и default): первый ответ с ошибкой
+    откатывает весь пакет, следующие элементы не выполняются.
+    """
+
+    def __init__(self, request, items, atomic=False):
+        self.request = request
+        self.items = items
+        self.atomic = atomic
+        self.results = [None] * len(items)
+        if binary_request({"request": request}):
+            self.content_type, self.renderer = MSGPACK_MEDIA_TYPE, MessagePackRenderer()
+        else:
+            self.content_type, self.renderer = "application/json", FastJSONRenderer()
+
+    def run(self):
+        if self.atomic:
+            return self.run_atomic()
+        for group in self.groups():
+            if len(group) > 1 and self.concurrency() > 1:
+                self.run_concurrently(group)
+            else:
+                for index in group:
+                    self.results[index] = self.execute(index)
+        return {"responses": self.results}
+
+    def run_atomic(self):
+        aliases = {shard_for_user(self.request.user) or "default", "default"}
+        try:
+            with ExitStack() as stack:
+                for alias in sorted(aliases):
+                    stack.enter_context(transaction.atomic(using=alias))
+                for index in range(len(self.items)):
+                    self.results[index] = self.execute(index)
+                    if self.results[index]["status"] >= 400:
+                        raise BatchAborted
+        except BatchAborted:
+            for index, result in enumerate(self.results):
+                if result is None:
+                    self.results[index] = {
+                        "status": 424,
+                        "body": {"detail": "Не выполнен: пакет откатан."},
+                    }
+            return {"responses": self.results, "committed": False}
+        return {"responses": self.results, "committed": True}
+
+    def concurrency(self):
+        # Внутри транзакции другие соединения не видят её изменений
+        if any(conn.in_atomic_block for conn in connections.all(initialized_only=True)):
+            return 1
+        return settings.BATCH_READ_CONCURRENCY
+
+    def groups(self):
+        """
+        Индексы элементов группами: независимые GET подряд — одна группа,
+        любой другой элемент — отдельная.
+        """
+        group = []
+        for index, item in enumerate(self.items):
+            if item["method"] == "GET" and not references(item):
+                group.append(index)
+                continue
+            if group:
+                yield group
+                group = []
+            yield [index]
+        if group:
+            yield group
+
+    def run_concurrently(self, group):
+        def task(index, context):
+            try:
+                return context.run(self.execute, index)
+            finally:
+                # Соединения потока пула не переживут его
+                for conn in connections.all(initialized_only=True):
+                    conn.close()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency()) as executor:
+            futures = {
+                index: executor.submit(task, index, contextvars.copy_context())
+                for index in group
+            }
+        for index, future in futures.items():
+            self.results[index] = future.result()
+
+    def execute(self, index):
+        item = self.items[index]
+        try:
+            path = substitute_path(item["path"], self.results)
+            body = substitute(item.get("body"), self.results)
+        except UnresolvedReference as exc:
+            return {"status": 424, "body": {"detail": str(exc)}}
+
+        url = urlsplit(path)
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            match = None
+        if (
+            match is None
+            or match.namespace != HabitsConfig.name
+            or match.url_name not in BATCH_ROUTES
+        ):
+            return {
+                "status": 404,
+                "body": {"detail": f"Маршрут {url.path} недоступен в пакете."},
+            }
+
+        request = self.build_request(item["method"], url, body)
+        view = match.func
+        if iscoroutinefunction(view):
+            # Async-view (list, retrieve): пакет выполняется синхронно
+            view = async_to_sync(view)
+        response = view(request, *match.args, **match.kwargs)
+        return {"status": response.status_code, "body": getattr(response, "data", None)}
+
+    def build_request(self, method, url, body):
+        content = b"" if body is None else self.renderer.render(body)
+        environ = {
+            key: self.request.META[key]
+            for key in INHERITED_META
+            if key in self.request.META
+        }
+        environ.update(
+            {
+                "REQUEST_METHOD": method,
+                "PATH_INFO": url.path,
+                "QUERY_STRING": url.query,
+                "CONTENT_TYPE": self.content_type,
+                "CONTENT_LENGTH": str(len(content)),
+                "HTTP_ACCEPT": self.request.accepted_media_type,
+                "wsgi.input": BytesIO(content),
+                "wsgi.url_scheme": self.request.scheme,
+            }
+        )
+        request = WSGIRequest(environ)
+        # Пользователь уже аутентифицирован пакетом (ForcedAuthentication DRF)
+        request._force_auth_user = self.request.user
+        request._force_auth_token = self.request.auth
+        return request
@@ -0,0 +1,313 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from config.invalidation import BUS
+from config.metrics import HABIT_LIST_CACHE
+
+from .models import Habit
+
+
+def version_key(user_id):
+    return f"habits:list_version:{user_id}"
+
+
+class LocalLRU:
+    """
+    Первый уровень кэша: LRU в памяти процесса, ограниченный числом записей
+    и суммарным размером (по длине pickle значения). Записи старых версий
+    никто не удаляет явно — они вытесняются как давно не использованные.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                self.size -= size
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def set(self, key, value, size, timeout):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (value, size, time.monotonic() + timeout)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted, _) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+LOCAL = LocalLRU(
+    settings.HABIT_LIST_CACHE_LOCAL_ENTRIES, settings.HABIT_LIST_CACHE_LOCAL_BYTES
+)
+
+# Версии списков, прочитанные из Redis: используются без повторной проверки,
+# только пока слушатель шины инвалидации подключён (размер записи — 1)
+VERSIONS = LocalLRU(
+    settings.HABIT_LIST_CACHE_LOCAL_ENTRIES, settings.HABIT_LIST_CACHE_LOCAL_ENTRIES
+)
+
+# Число полученных событий: версия, прочитанная из Redis до события,
+# не должна попасть в VERSIONS после него
+invalidations = 0
+
+
+def initial_version():
+    # Не 1: если Redis вытеснит счётчик, новая версия не совпадёт
+    # со старыми, ещё не истёкшими записями
+    return time.time_ns() // 1000
+
+
+def list_version(user_id):
+    """
+    Текущая версия списка пользователя; None — Redis недоступен.
+
+    Пока шина инвалидации подключена, версия берётся из памяти процесса:
+    любое изменение списка рассылается событием и удаляет её. Без шины
+    версия читается из Redis на каждом запросе.
+    """
+    listening = BUS.healthy()
+    if listening:
+        version = VERSIONS.get(str(user_id))
+        if version is not None:
+            return version
+
+    seen = invalidations
+    try:
+        version = cache.get_or_set(version_key(user_id), initial_version, timeout=None)
+    except Exception:
+        return None
+    remember_version(user_id, version, listening, seen)
+    return version
+
+
+async def alist_version(user_id):
+    """
+    list_version через асинхронный API кэша.
+    """
+    listening = BUS.healthy()
+    if listening:
+        version = VERSIONS.get(str(user_id))
+        if version is not None:
+            return version
+
+    seen = invalidations
+    try:
+        version = await cache.aget_or_set(
+            version_key(user_id), initial_version, timeout=None
+        )
+    except Exception:
+        return None
+    remember_version(user_id, version, listening, seen)
+    return version
+
+
+def remember_version(user_id, version, listening, seen):
+    if listening and seen == invalidations:
+        VERSIONS.set(str(user_id), version, 1, settings.HABIT_LIST_CACHE_VERSION_TTL)
+
+
+def forget_version(user_id):
+    """
+    Событие шины "habits:<user_id>" или "users:<user_id>".
+    """
+    global invalidations
+    invalidations += 1
+    VERSIONS.delete(user_id)
+
+
+def forget_all():
+    """
+    Переподключение слушателя: события за время разрыва могли быть потеряны.
+    """
+    global invalidations
+    invalidations += 1
+    VERSIONS.clear()
+    LOCAL.clear()
+
+
+BUS.subscribe("habits", forget_version)
+BUS.subscribe("users", forget_version)
+BUS.on_reset(forget_all)
+
+
+def cached_list(request, build):
+    """
+    Данные ответа HabitViewSet.list из кэша или build().
+
+    Ключ — пользователь (id и date_joined: id может быть выдан повторно,
+    например в SQLite), версия его списка, формат ответа и полный URL
+    запроса (страница, параметры, хост в ссылках next/previous). Сначала
+    проверяется LRU процесса, затем Redis; при промахе результат пишется
+    в оба уровня. Любое изменение привычек пользователя увеличивает версию,
+    и старые записи больше не читаются. Без Redis кэш не используется.
+    """
+    if not settings.HABIT_LIST_CACHE_ENABLED:
+        return build()
+    BUS.start()
+    version = list_version(request.user.pk)
+    if version is None:
+        return build()
+
+    key = list_key(request, version)
+    data = local_get(key)
+    if data is not None:
+        return data
+
+    try:
+        data = cache.get(key)
+    except Exception:
+        data = None
+    if data is not None:
+        HABIT_LIST_CACHE.inc(tier="redis", result="hit")
+    else:
+        HABIT_LIST_CACHE.inc(tier="redis", result="miss")
+        data = build()
+        try:
+            cache.set(key, data, settings.HABIT_LIST_CACHE_TIMEOUT)
+        except Exception:
+            pass
+
+    local_set(key, data)
+    return data
+
+
+async def acached_list(request, build):
+    """
+    cached_list для async-view: Redis — через асинхронный API кэша,
+    build — корутина.
+    """
+    if not settings.HABIT_LIST_CACHE_ENABLED:
+        return await build()
+    BUS.start()
+    version = await alist_version(request.user.pk)
+    if version is None:
+        return await build()
+
+    key = list_key(request, version)
+    data = local_get(key)
+    if data is not None:
+        return data
+
+    try:
+        data = await cache.aget(key)
+    except Exception:
+        data = None
+    if data is not None:
+        HABIT_LIST_CACHE.inc(tier="redis", result="hit")
+    else:
+        HABIT_LIST_CACHE.inc(tier="redis", result="miss")
+        data = await build()
+        try:
+            await cache.aset(key, data, settings.HABIT_LIST_CACHE_TIMEOUT)
+        except Exception:
+            pass
+
+    local_set(key, data)
+    return data
+
+
+def list_key(request, version):
+    user = request.user
+    url = hashlib.blake2b(request.build_absolute_uri().encode(), digest_size=12)
+    # Формат ответа: для MessagePack поля времени сериализуются иначе
+    return (
+        f"habits:list:{user.pk}:{user.date_joined.timestamp():.6f}:"
+        f"v{version}:{request.accepted_renderer.format}:{url.hexdigest()}"
+    )
+
+
+def local_get(key):
+    data = LOCAL.get(key)
+    HABIT_LIST_CACHE.inc(tier="local", result="miss" if data is None else "hit")
+    return data
+
+
+def local_set(key, data):
+    size = len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    LOCAL.set(key, data, size, settings.HABIT_LIST_CACHE_TIMEOUT)
+
+
+def bump_list_version(user_id, using=None):
+    """
+    Инвалидирует кэш списка пользователя и рассылает событие остальным
+    процессам. Внутри транзакции версия увеличивается ещё раз после коммита:
+    иначе параллельный запрос мог бы успеть закэшировать незакоммиченное
+    состояние под новой версией.
+    """
+
+    def bump():
+        key = version_key(user_id)
+        try:
+            # add + incr, а не set: параллельные изменения не теряются
+            cache.add(key, initial_version(), timeout=None)
+            cache.incr(key)
+        except Exception:
+            pass
+        BUS.publish("habits", user_id)
+
+    bump()
+    if connections[using or "default"].in_atomic_block:
+        transaction.on_commit(bump, using=using)
+
+
+def habit_changed(sender, instance, raw=False, **kwargs):
+    """
+    post_save/post_delete Habit: create, update и destroy из HabitViewSet,
+    а также изменения из админки и команд.
+    """
+    if not raw:
+        bump_list_version(instance.user_id, using=instance._state.db)
+
+
+def habit_deleting(sender, instance, **kwargs):
+    """
+    pre_delete Habit: удаление приятной привычки обнуляет related_habit
+    у ссылающихся привычек (SET_NULL — UPDATE без сигналов), в том числе
+    у привычек других пользователей. Их списки тоже устаревают.
+    """
+    if not instance.is_pleasant:
+        return
+    db = instance._state.db
+    user_ids = (
+        Habit.objects.using(db)
+        .filter(related_habit_id=instance.pk)
+        .exclude(user_id=instance.user_id)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    for user_id in user_ids:
+        bump_list_version(user_id, using=db)
@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Habit, PublicHabit
+
+# Поля Habit, копируемые в каталог (без id: в каталоге это habit_id)
+CATALOG_FIELDS = (
+    "user_id",
+    "place",
+    "time",
+    "action",
+    "is_pleasant",
+    "related_habit_id",
+    "periodicity",
+    "reward",
+    "time_to_complete",
+    "created_at",
+    "updated_at",
+)
+
+REFRESH_BATCH_SIZE = 5000
+
+
+def upsert_entries(habits, refreshed_at=None):
+    """
+    Записывает привычки в каталог одним INSERT ... ON CONFLICT DO UPDATE.
+    """
+    refreshed_at = refreshed_at or timezone.now()
+    entries = [
+        PublicHabit(
+            habit_id=habit.pk,
+            refreshed_at=refreshed_at,
+            **{field: getattr(habit, field) for field in CATALOG_FIELDS},
+        )
+        for habit in habits
+    ]
+    PublicHabit.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=["habit_id"],
+        update_fields=[*CATALOG_FIELDS, "refreshed_at"],
+    )
+    return len(entries)
+
+
+def sync_habits(habits):
+    """
+    Приводит строки каталога для переданных привычек к их текущему
+    состоянию: публичные записываются, остальные удаляются.
+    """
+    habits = list(habits)
+    public = [habit for habit in habits if habit.is_public]
+    private = [habit.pk for habit in habits if not habit.is_public]
+    if public:
+        upsert_entries(public)
+    if private:
+        PublicHabit.objects.filter(habit_id__in=private).delete()
+
+
+def habit_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    post_save Habit: инкрементальное обновление каталога.
+
+    Строка каталога пишется в default, поэтому для привычки из другого
+    шарда она не атомарна с сохранением привычки; расхождение после отката
+    исправит refresh_public_catalog.
+    """
+    if raw:
+        return
+    if instance.is_public:
+        upsert_entries([instance])
+    elif not created:
+        # Привычку могли сделать приватной
+        PublicHabit.objects.filter(habit_id=instance.pk).delete()
+
+
+def habit_deleted(sender, instance, **kwargs):
+    """
+    post_delete Habit. SET_NULL по related_habit Django выполняет
+    UPDATE без сигналов, поэтому ссылки в каталоге обнуляем сами
+    (связанной может быть только приятная привычка).
+    """
+    if instance.is_public:
+        PublicHabit.objects.filter(habit_id=instance.pk).delete()
+    if instance.is_pleasant:
+        PublicHabit.objects.filter(related_habit_id=instance.pk).update(
+            related_habit_id=None
+        )
+
+
+def refresh_catalog(shards=None):
+    """
+    Полное обновление каталога по всем шардам без блокировки читателей:
+    публичные привычки переносятся пачками по REFRESH_BATCH_SIZE
+    (keyset по id, каждая пачка — отдельный upsert), затем удаляются
+    строки, не обновлённые с начала прохода. Читатели всё это время видят
+    прежний каталог, а строки, записанные сигналами во время прохода,
+    не удаляются: их refreshed_at позже начала. Привычка, ставшая
+    приватной во время прохода, может остаться в каталоге до следующего.
+    """
+    started = timezone.now()
+    shards = list(shards or settings.HABIT_SHARDS or [None])
+    refreshed = 0
+    for alias in shards:
+        habits = Habit.objects.using(alias).filter(is_public=True).order_by("pk")
+        last_pk = 0
+        while True:
+            batch = list(habits.filter(pk__gt=last_pk)[:REFRESH_BATCH_SIZE])
+            if not batch:
+                break
+            refreshed += upsert_entries(batch, refreshed_at=started)
+            last_pk = batch[-1].pk
+
+    removed, _ = PublicHabit.objects.filter(refreshed_at__lt=started).delete()
+    return refreshed, removed
@@ -0,0 +1,205 @@
+import json
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Habit, HabitCompletion
+from .sharding import shards_for_user_ids
+from .stats import mark_completions
+
+logger = logging.getLogger(__name__)
+
+# Список Redis: endpoint дописывает отметки в хвост (RPUSH), задача
+# flush_habit_completions снимает пачки с головы после записи в БД
+BUFFER_KEY = "habits:completions"
+FLUSH_LOCK_KEY = "habits:completions:flush"
+FLUSH_LOCK_TIMEOUT = 60
+
+# Сколько месяцев вперёд держать созданные секции
+PARTITION_MONTHS_AHEAD = 2
+
+_clients = {}
+
+
+def redis_client():
+    url = settings.COMPLETIONS_REDIS_URL
+    if not url:
+        return None
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(
+            url, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+    return _clients[url]
+
+
+def record_completion(habit, completed_at):
+    """
+    Принимает отметку о выполнении. Возвращает (completion, buffered).
+
+    Отметка подтверждается после RPUSH в буфер Redis — без обращения к БД.
+    Сохранность подтверждённых отметок при перезапуске Redis обеспечивает
+    AOF (appendonly yes, appendfsync always). Если буфер не настроен или
+    Redis недоступен, отметка сразу пишется в БД.
+    """
+    completion = HabitCompletion(habit_id=habit.pk, completed_at=completed_at)
+    client = redis_client()
+    if client is not None:
+        entry = {
+            "id": str(completion.id),
+            "habit": habit.pk,
+            "user": habit.user_id,
+            "at": completed_at.isoformat(),
+        }
+        try:
+            client.rpush(BUFFER_KEY, json.dumps(entry))
+            return completion, True
+        except redis.RedisError:
+            pass
+    with transaction.atomic(using=habit._state.db):
+        completion.save(using=habit._state.db, force_insert=True)
+        mark_completions([completion], using=habit._state.db)
+    return completion, False
+
+
+def write_completions(entries):
+    """
+    Пишет пачку отметок из буфера в шарды их пользователей.
+
+    INSERT ... ON CONFLICT DO NOTHING: если задача упала между записью
+    и LTRIM, повторная запись той же пачки ничего не дублирует. Вместе
+    с отметками в той же транзакции обновляются битовые карты HabitActivity.
+    Отметки удалённых за это время привычек отбрасываются.
+    """
+    shards = shards_for_user_ids(entry["user"] for entry in entries)
+    by_shard = defaultdict(list)
+    for entry in entries:
+        by_shard[shards[entry["user"]]].append(entry)
+
+    written = 0
+    for alias, shard_entries in by_shard.items():
+        existing = set(
+            Habit.objects.using(alias)
+            .filter(pk__in={entry["habit"] for entry in shard_entries})
+            .values_list("pk", flat=True)
+        )
+        completions = [
+            HabitCompletion(
+                id=entry["id"],
+                habit_id=entry["habit"],
+                completed_at=parse_datetime(entry["at"]),
+            )
+            for entry in shard_entries
+            if entry["habit"] in existing
+        ]
+        with transaction.atomic(using=alias):
+            HabitCompletion.objects.using(alias).bulk_create(
+                completions, ignore_conflicts=True
+            )
+            mark_completions(completions, using=alias)
+        written += len(completions)
+    return written
+
+
+def decode_entry(item):
+    """
+    Отметка из буфера или None, если запись не разбирается (битый JSON,
+    чужое значение в списке).
+    """
+    try:
+        entry = json.loads(item)
+        uuid.UUID(entry["id"])
+        if not (isinstance(entry["habit"], int) and isinstance(entry["user"], int)):
+            raise TypeError("habit и user должны быть целыми")
+        if parse_datetime(entry["at"]) is None:
+            raise ValueError("некорректное время отметки")
+    except (ValueError, TypeError, KeyError, AttributeError):
+        logger.warning("Пропущена некорректная запись буфера: %r", item, exc_info=True)
+        return None
+    return entry
+
+
+def flush_completions():
+    """
+    Переносит буфер в БД пачками по COMPLETIONS_FLUSH_BATCH: LRANGE,
+    запись, затем LTRIM ровно прочитанного. Отметка покидает Redis только
+    после коммита в БД, поэтому перезапуск воркера её не теряет.
+
+    Снимать с головы списка может только один процесс, иначе два LTRIM
+    удалят лишнее, — отсюда блокировка; её TTL продлевается на каждой пачке.
+    """
+    client = redis_client()
+    if client is None:
+        return 0
+
+    lock = client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return 0
+    flushed = 0
+    try:
+        while True:
+            raw = client.lrange(BUFFER_KEY, 0, settings.COMPLETIONS_FLUSH_BATCH - 1)
+            if not raw:
+                break
+            # Некорректные записи пропускаются, но тоже снимаются LTRIM —
+            # иначе буфер перестал бы разбираться
+            entries = [entry for entry in map(decode_entry, raw) if entry]
+            flushed += write_completions(entries)
+            lock.reacquire()
+            client.ltrim(BUFFER_KEY, len(raw), -1)
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            pass
+    return flushed
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def ensure_partitions(shards=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Создаёт месячные секции habits_habitcompletion (PostgreSQL) с прошлого
+    месяца по months_ahead вперёд, операция идемпотентна. Возвращает
+    имена проверенных секций.
+    """
+    table = HabitCompletion._meta.db_table
+    first = add_months(timezone.now().date(), -1)
+    names = []
+    for alias in shards or settings.HABIT_SHARDS or ["default"]:
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            continue
+        with connection.cursor() as cursor:
+            for offset in range(months_ahead + 2):
+                start = add_months(first, offset)
+                end = add_months(start, 1)
+                name = f"{table}_{start:%Y_%m}"
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start:%Y-%m-%d} 00:00+00') "
+                    f"TO ('{end:%Y-%m-%d} 00:00+00')"
+                )
+                names.append(name)
+    return names
+
+
+def completion_window():
+    """
+    Допустимый диапазон completed_at: не в будущем (с запасом на расхождение
+    часов клиента) и не старше COMPLETION_MAX_AGE_DAYS.
+    """
+    now = timezone.now()
+    return (
+        now - timedelta(days=settings.COMPLETION_MAX_AGE_DAYS),
+        now + timedelta(minutes=5),
+    )
@@ -0,0 +1,242 @@
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dt_time
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from habits.models import Habit
+from habits.sharding import shard_for_user
+
+User = get_user_model()
+
+HOST = "testserver"
+
+
+class PeakThreads:
+    """
+    Максимум одновременно живых потоков за время замера (каждый поток —
+    ещё и стек, которого не видно в tracemalloc).
+    """
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopping.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+        # Сам сэмплер не считается
+        self.peak -= 1
+
+
+class Command(BaseCommand):
+    """
+    Сравнение ASGI и WSGI на async-view чтения: HabitViewSet.list/retrieve
+    и PublicHabitListView. Обработчики Django вызываются в процессе, без
+    сетевого сервера: WSGI — пулом из --concurrency потоков (как gthread
+    у gunicorn), ASGI — --concurrency корутинами в одном event loop.
+
+    Для каждого эндпоинта выводятся запросы в секунду и память на одно
+    одновременное соединение (пик tracemalloc во втором, отдельном прогоне
+    и пик числа потоков). Кэш списков выключен: измеряется путь через БД.
+
+    Данные создаются перед замером и удаляются после.
+
+    Пример:
+        python manage.py benchmark_asgi --concurrency 50 --requests 2000
+    """
+
+    help = "Сравнение пропускной способности и памяти ASGI и WSGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--habits", type=int, default=20)
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        per_worker = max(1, options["requests"] // concurrency)
+
+        self.stdout.write(
+            f"{'endpoint':<16}{'server':>8}{'req/s':>10}"
+            f"{'KiB/conn':>10}{'threads':>9}{'errors':>8}"
+        )
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST],
+            HABIT_LIST_CACHE_ENABLED=False,
+        ):
+            user, habit = self.seed(options["habits"])
+            try:
+                token = str(RefreshToken.for_user(user).access_token)
+                servers = {
+                    "wsgi": (self.run_wsgi, WSGIHandler()),
+                    "asgi": (self.run_asgi, ASGIHandler()),
+                }
+                for name, path in (
+                    ("habits-list", reverse("habits:habit-list")),
+                    ("habit-detail", reverse("habits:habit-detail", args=[habit.pk])),
+                    ("public-habits", reverse("habits:public-habits")),
+                ):
+                    for server, (run, handler) in servers.items():
+                        run = partial(
+                            run, handler, path, token, concurrency=concurrency
+                        )
+                        self.report(name, server, run, per_worker, concurrency)
+            finally:
+                self.cleanup(user)
+
+    def seed(self, count):
+        user = User.objects.create_user(username=f"benchmark_asgi_{time.time_ns()}")
+        shard = shard_for_user(user)
+        habits = Habit.objects.using(shard).bulk_create(
+            Habit(
+                user=user,
+                place=f"Место {i}",
+                time=dt_time(i // 60 % 24, i % 60),
+                action=f"Привычка номер {i}",
+                reward="Чай с печеньем",
+                time_to_complete=60,
+            )
+            for i in range(count)
+        )
+        return user, habits[0]
+
+    def cleanup(self, user):
+        Habit.objects.using(shard_for_user(user)).filter(user=user).delete()
+        user.delete()
+
+    def report(self, name, server, run, per_worker, concurrency):
+        run(1)  # прогрев: middleware, соединения с БД
+
+        started = time.perf_counter()
+        errors = run(per_worker)
+        rps = per_worker * concurrency / (time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            with PeakThreads() as threads:
+                run(2)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        per_connection = (peak - baseline) / concurrency / 1024
+
+        self.stdout.write(
+            f"{name:<16}{server:>8}{rps:>10.0f}"
+            f"{per_connection:>10.1f}{threads.peak:>9}{errors:>8}"
+        )
+
+    def run_wsgi(self, handler, path, token, per_worker, concurrency):
+        def worker():
+            errors = 0
+            try:
+                for _ in range(per_worker):
+                    errors += wsgi_request(handler, path, token) >= 400
+            finally:
+                for conn in connections.all(initialized_only=True):
+                    conn.close()
+            return errors
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(worker) for _ in range(concurrency)]
+        return sum(future.result() for future in futures)
+
+    def run_asgi(self, handler, path, token, per_worker, concurrency):
+        async def worker():
+            errors = 0
+            for _ in range(per_worker):
+                errors += await asgi_request(handler, path, token) >= 400
+            return errors
+
+        async def main():
+            return sum(await asyncio.gather(*(worker() for _ in range(concurrency))))
+
+        return asyncio.run(main())
+
+
+def wsgi_request(handler, path, token):
+    status = []
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": HOST,
+        "HTTP_AUTHORIZATION": f"Bearer {token}",
+        "wsgi.version": (1, 0),
+        "wsgi.input": BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.url_scheme": "http",
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    response = handler(environ, lambda code, headers: status.append(code))
+    try:
+        b"".join(response)
+    finally:
+        response.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_request(handler, path, token):
+    status = []
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Клиент не отключается: Django отменит ожидание после ответа
+        await asyncio.get_running_loop().create_future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", HOST.encode()),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": (HOST, 80),
+    }
+    await handler(scope, receive, send)
+    return status[0]
@@ -0,0 +1,364 @@
+import json
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import time as dt_time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.celery import app as celery_app
+from habits.catalog import refresh_catalog
+from habits.models import Habit
+from habits.tasks import plan_reminders
+from users.views import RegisterView, ThrottledTokenObtainPairView
+
+User = get_user_model()
+
+BENCHMARK_PASSWORD = "benchmark-password"
+
+# Таблицы, последовательное сканирование которых на большом наборе — регрессия
+WATCHED_TABLES = ("habits_habit", "habits_publichabit", "users_user")
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def without_throttling():
+    """
+    Бенчмарк многократно вызывает логин и регистрацию — лимиты отключаем.
+    """
+    views = (RegisterView, ThrottledTokenObtainPairView)
+    saved = [view.throttle_classes for view in views]
+    for view in views:
+        view.throttle_classes = ()
+    try:
+        yield
+    finally:
+        for view, throttle_classes in zip(views, saved):
+            view.throttle_classes = throttle_classes
+
+
+def seq_scans(plan, min_rows):
+    """
+    Узлы Seq Scan по WATCHED_TABLES из EXPLAIN (FORMAT JSON), которые
+    прочитали не меньше min_rows строк.
+    """
+    found = set()
+    stack = [plan["Plan"]]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get("Plans", []))
+        if node.get("Node Type") != "Seq Scan":
+            continue
+        if node.get("Relation Name") not in WATCHED_TABLES:
+            continue
+        scanned = node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)
+        if scanned >= min_rows:
+            found.add(node["Relation Name"])
+    return found
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк и регрессионная проверка эндпоинтов API и задачи напоминаний.
+
+    Для каждого сценария измеряются p50/p95 латентности и число SQL-запросов,
+    а на PostgreSQL дополнительно снимаются планы EXPLAIN (ANALYZE, BUFFERS)
+    всех SELECT-запросов. Результат сравнивается с сохранённым baseline:
+    команда завершается с ошибкой, если выросло число запросов, p95 превысил
+    baseline больше чем на --tolerance или в плане появился Seq Scan по
+    habits_habit/users_user.
+
+    Все изменения выполняются в транзакции и откатываются в конце.
+
+    Пример:
+        python manage.py benchmark_endpoints --seed-users 100000
+        python manage.py benchmark_endpoints --update-baseline
+    """
+
+    help = "Бенчмарк эндпоинтов с проверкой бюджетов запросов и планов."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--baseline",
+            default=str(Path(settings.BASE_DIR) / "benchmark_baseline.json"),
+            help="Путь к JSON-файлу с baseline.",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Записать текущие результаты как новый baseline.",
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Допустимый рост p95 относительно baseline (0.5 = +50%%).",
+        )
+        parser.add_argument(
+            "--seed-users",
+            type=int,
+            default=0,
+            help="Сгенерировать столько пользователей через generate_habits.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--seq-scan-min-rows",
+            type=int,
+            default=1000,
+            help="Seq Scan по меньшему числу строк не считается регрессией.",
+        )
+        parser.add_argument(
+            "--explain-dir",
+            help="Куда сохранить планы EXPLAIN (JSON) по сценариям.",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.explain = connection.vendor == "postgresql"
+
+        results = {}
+        try:
+            with (
+                transaction.atomic(),
+                without_throttling(),
+                override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                    TELEGRAM_API_URL="http://127.0.0.1:9",
+                    TELEGRAM_BOT_TOKEN="benchmark",
+                    # Бюджеты запросов — для пути без кэша списка
+                    HABIT_LIST_CACHE_ENABLED=False,
+                ),
+            ):
+                if options["seed_users"]:
+                    call_command(
+                        "generate_habits",
+                        users=options["seed_users"],
+                        seed=options["seed"],
+                        prefix="benchmark_seed_",
+                        stdout=self.stdout,
+                    )
+                    if self.explain:
+                        with connection.cursor() as cursor:
+                            cursor.execute("ANALYZE habits_habit, users_user")
+
+                for name, scenario in self.scenarios():
+                    results[name] = self.measure(name, scenario)
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.print_results(results)
+
+        baseline_path = Path(options["baseline"])
+        if options["update_baseline"]:
+            baseline_path.write_text(
+                json.dumps(results, indent=2, ensure_ascii=False, sort_keys=True)
+            )
+            self.stdout.write(self.style.SUCCESS(f"Baseline сохранён: {baseline_path}"))
+            return
+
+        failures = self.compare(results, baseline_path)
+        if failures:
+            for failure in failures:
+                self.stderr.write(f"  {failure}")
+            raise CommandError(f"Обнаружено регрессий: {len(failures)}")
+        self.stdout.write(self.style.SUCCESS("Регрессий не обнаружено."))
+
+    def scenarios(self):
+        user = User.objects.create_user(
+            username="benchmark_user", password=BENCHMARK_PASSWORD
+        )
+        pleasant = Habit.objects.create(
+            user=user,
+            place="Дом",
+            time=dt_time(8, 0),
+            action="Кофе",
+            is_pleasant=True,
+            time_to_complete=60,
+            is_public=True,
+        )
+        Habit.objects.bulk_create(
+            Habit(
+                user=user,
+                place=f"Место {i}",
+                time=dt_time(7, i),
+                action=f"Привычка {i}",
+                related_habit=pleasant,
+                time_to_complete=60,
+                is_public=True,
+            )
+            for i in range(20)
+        )
+        # bulk_create обходит сигналы каталога
+        refresh_catalog()
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        anonymous = APIClient()
+        refresh = str(RefreshToken.for_user(user))
+        detail = reverse("habits:habit-detail", args=[pleasant.pk])
+        counter = iter(range(10**9))
+
+        def create_and_destroy():
+            response = client.post(
+                reverse("habits:habit-list"),
+                {
+                    "place": "Офис",
+                    "time": "09:00:00",
+                    "action": "Встать из-за стола",
+                    "related_habit": pleasant.pk,
+                    "time_to_complete": 30,
+                },
+                format="json",
+            )
+            client.delete(reverse("habits:habit-detail", args=[response.data["id"]]))
+
+        yield "habits-list", lambda: client.get(reverse("habits:habit-list"))
+        yield "habits-retrieve", lambda: client.get(detail)
+        yield "habits-partial-update", lambda: client.patch(
+            detail, {"place": "Дом"}, format="json"
+        )
+        yield "habits-create-destroy", create_and_destroy
+        yield "public-habits", lambda: client.get(reverse("habits:public-habits"))
+        yield "register", lambda: anonymous.post(
+            reverse("users:register"),
+            {"username": f"benchmark_new_{next(counter)}", "password": "strongpass123"},
+            format="json",
+        )
+        yield "token-obtain", lambda: anonymous.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "benchmark_user", "password": BENCHMARK_PASSWORD},
+            format="json",
+        )
+        yield "token-refresh", lambda: anonymous.post(
+            reverse("users:token_refresh"), {"refresh": refresh}, format="json"
+        )
+        yield "telegram-webhook", self.eager(
+            lambda: anonymous.post(
+                reverse("users:telegram-webhook"),
+                {
+                    "update_id": next(counter),
+                    "message": {
+                        "chat": {"id": 1, "username": "benchmark_user"},
+                        "text": "hello",
+                    },
+                },
+                format="json",
+            )
+        )
+        # Без tick_lock: иначе повторы в пределах минуты пропускаются
+        yield "send-habit-reminders", self.eager(
+            lambda: plan_reminders(timezone.localtime())
+        )
+
+    def eager(self, func):
+        """
+        Webhook и планирование напоминаний только ставят задачи в очередь;
+        в бенчмарке выполняем их сразу, чтобы учесть и их запросы.
+        """
+
+        def wrapper():
+            previous = celery_app.conf.task_always_eager
+            celery_app.conf.task_always_eager = True
+            try:
+                return func()
+            finally:
+                celery_app.conf.task_always_eager = previous
+
+        return wrapper
+
+    def measure(self, name, scenario):
+        scenario()  # прогрев
+
+        timings = []
+        queries = 0
+        for _ in range(self.options["iterations"]):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                scenario()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured.captured_queries))
+
+        result = {
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(sorted(timings)[max(int(len(timings) * 0.95) - 1, 0)], 3),
+            "queries": queries,
+            "seq_scans": [],
+        }
+
+        if self.explain:
+            result["seq_scans"] = sorted(self.explain_queries(name, captured))
+        return result
+
+    def explain_queries(self, name, captured):
+        found = set()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in captured.captured_queries:
+                sql = query["sql"]
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+                found |= seq_scans(plan, self.options["seq_scan_min_rows"])
+                plans.append({"sql": sql, "plan": plan})
+
+        if self.options["explain_dir"]:
+            directory = Path(self.options["explain_dir"])
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"{name}.json").write_text(
+                json.dumps(plans, indent=2, ensure_ascii=False)
+            )
+        return found
+
+    def compare(self, results, baseline_path):
+        if not baseline_path.exists():
+            raise CommandError(
+                f"Нет baseline {baseline_path}; запустите с --update-baseline."
+            )
+        baseline = json.loads(baseline_path.read_text())
+        tolerance = 1 + self.options["tolerance"]
+
+        failures = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result["queries"] > expected["queries"]:
+                failures.append(
+                    f"{name}: запросов {result['queries']} > {expected['queries']}"
+                )
+            if result["p95_ms"] > expected["p95_ms"] * tolerance:
+                failures.append(
+                    f"{name}: p95 {result['p95_ms']} мс > "
+                    f"{expected['p95_ms']} мс * {tolerance}"
+                )
+            new_scans = set(result["seq_scans"]) - set(expected.get("seq_scans", []))
+            if new_scans:
+                failures.append(f"{name}: Seq Scan по {', '.join(sorted(new_scans))}")
+        return failures
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'scenario':<24}{'p50, мс':>10}{'p95, мс':>10}{'queries':>9}  seq scans"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['queries']:>9}  {', '.join(result['seq_scans']) or '-'}"
+            )
@@ -0,0 +1,133 @@
+import gzip
+import time
+from contextlib import contextmanager
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from config.middleware import brotli
+from config.renderers import FastJSONRenderer, orjson
+from habits.catalog import refresh_catalog
+from habits.models import Habit
+from habits.pagination import HabitPagination
+
+from .benchmark_endpoints import Rollback
+
+User = get_user_model()
+
+
+@contextmanager
+def page_size(size):
+    saved = HabitPagination.page_size
+    HabitPagination.page_size = size
+    try:
+        yield
+    finally:
+        HabitPagination.page_size = saved
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк сериализации ответов HabitViewSet.list и PublicHabitListView
+    на больших страницах: пропускная способность рендереров JSON (байт/с)
+    и размер ответа без сжатия, с gzip и brotli.
+
+    Данные создаются в транзакции и откатываются в конце.
+
+    Пример:
+        python manage.py benchmark_serialization --page-size 100 --page-size 1000
+    """
+
+    help = "Бенчмарк рендеринга JSON и сжатия списков привычек."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            action="append",
+            dest="page_sizes",
+            help="Размер страницы (можно повторять; по умолчанию 100, 500, 1000).",
+        )
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        page_sizes = options["page_sizes"] or [100, 500, 1000]
+        renderers = [("json", JSONRenderer())]
+        if orjson is not None:
+            renderers.append(("orjson", FastJSONRenderer()))
+        else:
+            self.stderr.write("orjson не установлен: FastJSONRenderer = json.")
+
+        self.stdout.write(
+            f"{'endpoint':<16}{'page':>6}{'renderer':>10}{'MB/s':>10}"
+            f"{'bytes':>10}{'gzip':>10}{'br':>10}"
+        )
+        try:
+            with (
+                transaction.atomic(),
+                override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                    HABIT_LIST_CACHE_ENABLED=False,
+                ),
+            ):
+                client = self.seed(max(page_sizes))
+                for size in page_sizes:
+                    for name, url in (
+                        ("habits-list", reverse("habits:habit-list")),
+                        ("public-habits", reverse("habits:public-habits")),
+                    ):
+                        with page_size(size):
+                            data = client.get(url).data
+                        for renderer_name, renderer in renderers:
+                            self.report(
+                                name, size, renderer_name, renderer, data, options
+                            )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        user = User.objects.create_user(username="benchmark_serialization")
+        Habit.objects.bulk_create(
+            Habit(
+                user=user,
+                place=f"Место {i}",
+                time=dt_time(i // 60 % 24, i % 60),
+                action=f"Привычка номер {i}",
+                reward="Чай с печеньем",
+                time_to_complete=60,
+                is_public=True,
+            )
+            for i in range(count)
+        )
+        # bulk_create обходит сигналы каталога
+        refresh_catalog()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def report(self, name, size, renderer_name, renderer, data, options):
+        renderer.render(data)  # прогрев
+        started = time.perf_counter()
+        for _ in range(options["iterations"]):
+            body = renderer.render(data)
+        elapsed = time.perf_counter() - started
+        throughput = len(body) * options["iterations"] / elapsed / 1e6
+
+        gzipped = len(gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL))
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+            brotli_size = str(len(compressed))
+        else:
+            brotli_size = "-"
+        self.stdout.write(
+            f"{name:<16}{size:>6}{renderer_name:>10}{throughput:>10.1f}"
+            f"{len(body):>10}{gzipped:>10}{brotli_size:>10}"
+        )
@@ -0,0 +1,406 @@
+import csv
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import time as dt_time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from config.database import copy_from
+from habits.catalog import refresh_catalog
+from habits.models import Habit
+
+User = get_user_model()
+
+PLACES = ("Дом", "Офис", "Парк", "Спортзал", "Кухня", "Балкон", "Метро")
+USEFUL_ACTIONS = (
+    "Выпить стакан воды",
+    "Сделать зарядку",
+    "Прочитать 10 страниц",
+    "Пройти 1000 шагов",
+    "Помедитировать",
+    "Разобрать почту",
+    "Сделать растяжку",
+)
+PLEASANT_ACTIONS = (
+    "Выпить кофе",
+    "Посмотреть серию",
+    "Съесть десерт",
+    "Поиграть в игру",
+    "Послушать музыку",
+)
+REWARDS = ("Шоколадка", "10 минут соцсетей", "Чай с печеньем")
+
+TELEGRAM_CHAT_ID_BASE = 9_000_000_000
+
+
+def parse_weights(value):
+    """
+    "1=70,2=10,7=20" -> (["1", "2", "7"], [70.0, 10.0, 20.0])
+    """
+    keys, weights = [], []
+    for item in value.split(","):
+        key, _, weight = item.partition("=")
+        keys.append(key.strip())
+        weights.append(float(weight or 1))
+    return keys, weights
+
+
+@contextmanager
+def preserve_created_at():
+    """
+    Отключаем auto_now_add, чтобы сохранить сгенерированные created_at
+    (от них зависит проверка periodicity в send_habit_reminders).
+    """
+    field = Habit._meta.get_field("created_at")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+HABIT_COLUMNS = (
+    "user_id",
+    "place",
+    "time",
+    "action",
+    "is_pleasant",
+    "related_habit_id",
+    "periodicity",
+    "reward",
+    "time_to_complete",
+    "is_public",
+    "created_at",
+)
+
+
+class BulkCreateWriter:
+    """
+    Запись через bulk_create (любая БД).
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def write_users(self, rows):
+        users = User.objects.bulk_create(
+            [User(**row) for row in rows], batch_size=self.batch_size
+        )
+        return [user.pk for user in users]
+
+    def write_habits(self, rows):
+        with preserve_created_at():
+            habits = Habit.objects.bulk_create(
+                [Habit(**row) for row in rows], batch_size=self.batch_size
+            )
+        return [habit.pk for habit in habits]
+
+
+class CopyWriter:
+    """
+    Запись через COPY FROM STDIN (PostgreSQL). id выделяются из
+    последовательностей заранее, чтобы сразу проставлять related_habit_id.
+    """
+
+    def write_users(self, rows):
+        ids = self.allocate_ids(User, len(rows))
+        now = timezone.now()
+        self.copy(
+            User,
+            (
+                "id",
+                "username",
+                "password",
+                "telegram_chat_id",
+                "is_superuser",
+                "is_staff",
+                "is_active",
+                "first_name",
+                "last_name",
+                "email",
+                "date_joined",
+            ),
+            (
+                (pk, row["username"], row["password"], row["telegram_chat_id"])
+                + (False, False, True, "", "", "", now)
+                for pk, row in zip(ids, rows)
+            ),
+        )
+        return ids
+
+    def write_habits(self, rows):
+        ids = self.allocate_ids(Habit, len(rows))
+        self.copy(
+            Habit,
+            ("id",) + HABIT_COLUMNS + ("updated_at",),
+            (
+                (pk,)
+                + tuple(row[column] for column in HABIT_COLUMNS)
+                + (row["created_at"],)
+                for pk, row in zip(ids, rows)
+            ),
+        )
+        return ids
+
+    def allocate_ids(self, model, count):
+        if not count:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                "FROM generate_series(1, %s)",
+                [model._meta.db_table, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def copy(self, model, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for row in rows:
+            writer.writerow(["\\N" if value is None else value for value in row])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            copy_from(
+                cursor,
+                f"COPY {model._meta.db_table} ({', '.join(columns)}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+
+
+class Command(BaseCommand):
+    """
+    Генерация синтетических пользователей и привычек для нагрузочных тестов.
+
+    Данные детерминированы значением --seed: одинаковые параметры дают
+    одинаковый набор строк, поэтому бенчмарки воспроизводимы. Запись идёт
+    пачками через COPY на PostgreSQL или bulk_create на остальных БД,
+    пароль хэшируется один раз на всех.
+
+    Пример:
+        python manage.py generate_habits --users 100000 --habits-per-user 6 \\
+            --time-clusters "07:00=5,13:00=2,21:30=3" --seed 42
+    """
+
+    help = "Генерация синтетических пользователей и привычек."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--habits-per-user",
+            type=float,
+            default=5,
+            help="Среднее число привычек на пользователя.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--prefix",
+            default="synthetic_",
+            help="Префикс username сгенерированных пользователей.",
+        )
+        parser.add_argument(
+            "--time-clusters",
+            default="07:00=5,12:30=2,19:00=2,22:00=3",
+            help="Пики времени HH:MM=вес, вокруг которых группируются привычки.",
+        )
+        parser.add_argument(
+            "--time-spread",
+            type=float,
+            default=20,
+            help="Стандартное отклонение времени от пика, минут.",
+        )
+        parser.add_argument(
+            "--uniform-time-share",
+            type=float,
+            default=0.1,
+            help="Доля привычек со временем, равномерно распределённым по суткам.",
+        )
+        parser.add_argument(
+            "--periodicity",
+            default="1=70,2=10,3=5,7=15",
+            help="Распределение periodicity в формате дни=вес.",
+        )
+        parser.add_argument("--pleasant-share", type=float, default=0.3)
+        parser.add_argument(
+            "--related-share",
+            type=float,
+            default=0.5,
+            help="Доля полезных привычек со связанной приятной привычкой.",
+        )
+        parser.add_argument(
+            "--reward-share",
+            type=float,
+            default=0.3,
+            help="Доля полезных привычек с вознаграждением (без связанной).",
+        )
+        parser.add_argument("--public-share", type=float, default=0.05)
+        parser.add_argument("--telegram-share", type=float, default=0.6)
+        parser.add_argument(
+            "--chat-id-offset",
+            type=int,
+            default=0,
+            help="Сдвиг telegram_chat_id (для нескольких прогонов в одной БД).",
+        )
+        parser.add_argument(
+            "--created-days",
+            type=int,
+            default=90,
+            help="created_at распределяется по последним N дням.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--method",
+            choices=("auto", "copy", "bulk_create"),
+            default="auto",
+            help="Способ записи: COPY (PostgreSQL) или bulk_create.",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        self.now = timezone.now().replace(second=0, microsecond=0)
+
+        try:
+            clusters, self.cluster_weights = parse_weights(options["time_clusters"])
+            self.clusters = [
+                int(hours) * 60 + int(minutes)
+                for hours, minutes in (key.split(":") for key in clusters)
+            ]
+            periodicity, self.periodicity_weights = parse_weights(
+                options["periodicity"]
+            )
+            self.periodicities = [int(value) for value in periodicity]
+        except ValueError as exc:
+            raise CommandError(f"Некорректное распределение: {exc}")
+
+        if any(not 1 <= value <= 7 for value in self.periodicities):
+            raise CommandError("periodicity должна быть в диапазоне 1..7.")
+
+        self.password = make_password(None)
+        use_copy = options["method"] == "copy" or (
+            options["method"] == "auto" and connection.vendor == "postgresql"
+        )
+        if use_copy and connection.vendor != "postgresql":
+            raise CommandError("--method copy работает только с PostgreSQL.")
+        self.writer = (
+            CopyWriter() if use_copy else BulkCreateWriter(options["batch_size"])
+        )
+        started = time.monotonic()
+        users_created = habits_created = 0
+        batch_users = max(
+            1, int(options["batch_size"] / max(options["habits_per_user"], 1))
+        )
+
+        for start in range(0, options["users"], batch_users):
+            stop = min(start + batch_users, options["users"])
+            with transaction.atomic():
+                user_ids = self.create_users(start, stop)
+                habits_created += self.create_habits(user_ids)
+            users_created += len(user_ids)
+
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(
+                f"  users {users_created}/{options['users']}, habits {habits_created} "
+                f"({(users_created + habits_created) / elapsed:,.0f} строк/с)"
+            )
+
+        # COPY и bulk_create обходят сигналы каталога публичных привычек
+        refreshed, _ = refresh_catalog()
+        self.stdout.write(f"  каталог публичных привычек: {refreshed}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано пользователей: {users_created}, привычек: {habits_created}."
+            )
+        )
+
+    def create_users(self, start, stop):
+        rows = []
+        for index in range(start, stop):
+            has_telegram = self.rng.random() < self.options["telegram_share"]
+            rows.append(
+                {
+                    "username": f"{self.options['prefix']}{index:07d}",
+                    "password": self.password,
+                    "telegram_chat_id": (
+                        TELEGRAM_CHAT_ID_BASE + self.options["chat_id_offset"] + index
+                        if has_telegram
+                        else None
+                    ),
+                }
+            )
+        return self.writer.write_users(rows)
+
+    def create_habits(self, user_ids):
+        plans = []
+        for user_id in user_ids:
+            count = max(0, round(self.rng.gauss(self.options["habits_per_user"], 2)))
+            pleasant_count = sum(
+                self.rng.random() < self.options["pleasant_share"] for _ in range(count)
+            )
+            plans.append((user_id, pleasant_count, count - pleasant_count))
+
+        # Сначала приятные привычки: useful ссылаются на их id
+        pleasant = []
+        for user_id, pleasant_count, _ in plans:
+            for _ in range(pleasant_count):
+                pleasant.append(self.build_habit(user_id, PLEASANT_ACTIONS, True))
+        pleasant_ids = self.writer.write_habits(pleasant)
+
+        by_user = {}
+        for row, pk in zip(pleasant, pleasant_ids):
+            by_user.setdefault(row["user_id"], []).append(pk)
+
+        useful = []
+        for user_id, _, useful_count in plans:
+            rewards_for = by_user.get(user_id, [])
+            for _ in range(useful_count):
+                row = self.build_habit(user_id, USEFUL_ACTIONS, False)
+                roll = self.rng.random()
+                if rewards_for and roll < self.options["related_share"]:
+                    row["related_habit_id"] = self.rng.choice(rewards_for)
+                elif (
+                    roll < self.options["related_share"] + self.options["reward_share"]
+                ):
+                    row["reward"] = self.rng.choice(REWARDS)
+                useful.append(row)
+        self.writer.write_habits(useful)
+
+        return len(pleasant) + len(useful)
+
+    def build_habit(self, user_id, actions, is_pleasant):
+        created_at = self.now - timedelta(
+            days=self.rng.randrange(max(self.options["created_days"], 1)),
+            minutes=self.rng.randrange(24 * 60),
+        )
+        return {
+            "user_id": user_id,
+            "place": self.rng.choice(PLACES),
+            "time": self.random_time(),
+            "action": self.rng.choice(actions),
+            "is_pleasant": is_pleasant,
+            "related_habit_id": None,
+            "periodicity": self.rng.choices(
+                self.periodicities, weights=self.periodicity_weights
+            )[0],
+            "reward": None,
+            "time_to_complete": self.rng.randint(10, 120),
+            "is_public": self.rng.random() < self.options["public_share"],
+            "created_at": created_at,
+        }
+
+    def random_time(self):
+        if self.rng.random() < self.options["uniform_time_share"]:
+            minute = self.rng.randrange(24 * 60)
+        else:
+            center = self.rng.choices(self.clusters, weights=self.cluster_weights)[0]
+            minute = round(self.rng.gauss(center, self.options["time_spread"])) % (
+                24 * 60
+            )
+        return dt_time(minute // 60, minute % 60)
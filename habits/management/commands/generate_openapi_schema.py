@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.schema import code_version, read_schema, write_schema
+
+
+class Command(BaseCommand):
+    """
+    Генерация схемы OpenAPI в OPENAPI_SCHEMA_PATH — шаг деплоя, чтобы
+    web-процессы не интроспектировали API при первом запросе к swagger.
+
+    Если файл уже построен для текущей версии кода, команда ничего
+    не делает (--force — сгенерировать заново).
+
+    Пример:
+        CODE_VERSION=$(git rev-parse HEAD) python manage.py generate_openapi_schema
+    """
+
+    help = "Генерация схемы OpenAPI для swagger/redoc."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.OPENAPI_SCHEMA_PATH,
+            help="Путь к файлу схемы (по умолчанию OPENAPI_SCHEMA_PATH).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Сгенерировать, даже если схема текущей версии уже есть.",
+        )
+
+    def handle(self, *args, **options):
+        version = code_version()
+        current = read_schema(options["output"])
+        if (
+            not options["force"]
+            and current is not None
+            and current.get("x-code-version") == version
+        ):
+            self.stdout.write(f"Схема версии {version} уже сгенерирована.")
+            return
+        document = write_schema(options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Схема версии {version} записана в {options['output']} "
+                f"({len(document['paths'])} путей)."
+            )
+        )
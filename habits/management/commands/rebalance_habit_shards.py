@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from habits.catalog import sync_habits
+from habits.models import Habit, HabitActivity, HabitCompletion
+from habits.sharding import (
+    placement,
+    prepare_shards,
+    preserve_timestamps,
+    sharding_enabled,
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Подготовка шардов и перенос пользователей (их привычек) между шардами.
+
+    Каждый запуск сначала выполняет идемпотентную подготовку
+    (habits.sharding.prepare_shards) и закрепляет за default пользователей,
+    чьи привычки лежат в default, хотя хэш указывает на другой шард, —
+    так включение шардирования не "теряет" существующие данные.
+
+    Перенос пользователя: копия привычек, отметок о выполнении и их битовых
+    карт в целевой шард (с теми же id), переключение User.habit_shard,
+    удаление из исходного шарда. Если команда прервётся, повторный запуск перенесёт
+    пользователя заново. Изменения привычек пользователя во время переноса
+    могут потеряться, поэтому запускать лучше в период низкой нагрузки.
+
+    Пример:
+        python manage.py rebalance_habit_shards --prepare
+        python manage.py rebalance_habit_shards --auto --dry-run
+        python manage.py rebalance_habit_shards --user 42 --to habits_shard_2
+    """
+
+    help = "Перенос пользователей между шардами привычек."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prepare",
+            action="store_true",
+            help="Только подготовить шарды, никого не переносить.",
+        )
+        parser.add_argument(
+            "--auto",
+            action="store_true",
+            help="Вернуть закреплённых пользователей в шард по хэшу.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="users",
+            default=[],
+            help="id пользователя для переноса в --to (можно повторять).",
+        )
+        parser.add_argument("--to", help="Целевой шард для --user.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError("Шардирование выключено: задайте HABIT_SHARD_HOSTS.")
+        if options["users"] and options["to"] not in settings.HABIT_SHARDS:
+            raise CommandError(
+                f"--to должен быть одним из: {', '.join(settings.HABIT_SHARDS)}"
+            )
+
+        if not options["dry_run"]:
+            prepare_shards()
+            pinned = self.pin_legacy_users()
+            self.stdout.write(f"Закреплено за default: {pinned}")
+        if options["prepare"]:
+            return
+
+        moved_users = moved_habits = 0
+        for user_id, source, target in self.plan(options):
+            if options["dry_run"]:
+                self.stdout.write(f"  user {user_id}: {source} -> {target}")
+                continue
+            moved_habits += self.move_user(user_id, source, target)
+            moved_users += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Перенесено пользователей: {moved_users}, привычек: {moved_habits}."
+            )
+        )
+
+    def pin_legacy_users(self):
+        user_ids = [
+            user_id
+            for user_id in User.objects.filter(
+                habit_shard__isnull=True, habits__isnull=False
+            )
+            .values_list("pk", flat=True)
+            .distinct()
+            if placement(user_id) != "default"
+        ]
+        return User.objects.filter(pk__in=user_ids).update(habit_shard="default")
+
+    def plan(self, options):
+        if options["users"]:
+            users = User.objects.filter(pk__in=options["users"])
+            for user_id, shard in users.values_list("pk", "habit_shard"):
+                yield user_id, shard or placement(user_id), options["to"]
+
+        if options["auto"]:
+            users = User.objects.filter(habit_shard__isnull=False)
+            for user_id, shard in users.values_list("pk", "habit_shard").iterator():
+                if shard != placement(user_id):
+                    yield user_id, shard, placement(user_id)
+
+    def move_user(self, user_id, source, target):
+        # В шарде по хэшу пользователь не закрепляется
+        pinned = None if target == placement(user_id) else target
+        if source == target:
+            User.objects.filter(pk=user_id).update(habit_shard=pinned)
+            return 0
+
+        rows = list(Habit.objects.using(source).filter(user_id=user_id).values())
+        completions = list(
+            HabitCompletion.objects.using(source)
+            .filter(habit__user_id=user_id)
+            .values()
+        )
+        activity = list(
+            HabitActivity.objects.using(source).filter(habit__user_id=user_id).values()
+        )
+        with transaction.atomic(using=target), preserve_timestamps():
+            # Остатки прерванного переноса
+            Habit.objects.using(target).filter(user_id=user_id).delete()
+            Habit.objects.using(target).bulk_create(Habit(**row) for row in rows)
+            HabitCompletion.objects.using(target).bulk_create(
+                HabitCompletion(**row) for row in completions
+            )
+            HabitActivity.objects.using(target).bulk_create(
+                HabitActivity(**row) for row in activity
+            )
+
+        User.objects.filter(pk=user_id).update(habit_shard=pinned)
+        Habit.objects.using(source).filter(user_id=user_id).delete()
+        # Удаление из исходного шарда убрало публичные привычки из каталога
+        sync_habits(Habit.objects.using(target).filter(user_id=user_id))
+        self.stdout.write(f"  user {user_id}: {source} -> {target}, {len(rows)} шт.")
+        return len(rows)
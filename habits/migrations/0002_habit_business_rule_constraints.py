@@ -0,0 +1,120 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Межстрочное правило (related_habit должна быть приятной) нельзя выразить
+# через CHECK, поэтому на PostgreSQL ставим constraint trigger. Ошибка
+# поднимается как check_violation с именем ограничения, чтобы её можно было
+# сопоставить с полем (habits.validators.HABIT_CONSTRAINT_ERRORS).
+RELATED_HABIT_IS_PLEASANT_SQL = """
+CREATE OR REPLACE FUNCTION habits_habit_related_habit_is_pleasant()
+RETURNS trigger AS $$
+BEGIN
+    IF NEW.related_habit_id IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM habits_habit
+        WHERE id = NEW.related_habit_id AND is_pleasant
+    ) THEN
+        RAISE EXCEPTION 'related habit % is not pleasant', NEW.related_habit_id
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND OLD.is_pleasant AND NOT NEW.is_pleasant AND EXISTS (
+        SELECT 1 FROM habits_habit WHERE related_habit_id = NEW.id
+    ) THEN
+        RAISE EXCEPTION 'habit % is used as a related habit', NEW.id
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE CONSTRAINT TRIGGER habit_related_habit_is_pleasant
+AFTER INSERT OR UPDATE OF related_habit_id, is_pleasant ON habits_habit
+DEFERRABLE INITIALLY IMMEDIATE
+FOR EACH ROW EXECUTE FUNCTION habits_habit_related_habit_is_pleasant();
+"""
+
+DROP_RELATED_HABIT_IS_PLEASANT_SQL = """
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant ON habits_habit;
+DROP FUNCTION IF EXISTS habits_habit_related_habit_is_pleasant();
+"""
+
+
+def create_related_habit_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(RELATED_HABIT_IS_PLEASANT_SQL, params=None)
+
+
+def drop_related_habit_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_RELATED_HABIT_IS_PLEASANT_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("reward__isnull", True),
+                    ("reward", ""),
+                    ("related_habit__isnull", True),
+                    _connector="OR",
+                ),
+                name="habit_reward_xor_related_habit",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("periodicity__gte", 1), ("periodicity__lte", 7)),
+                name="habit_periodicity_range",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("time_to_complete__lte", 120)),
+                name="habit_time_to_complete_max",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("is_pleasant", False),
+                    ("reward__isnull", True),
+                    ("reward", ""),
+                    _connector="OR",
+                ),
+                name="habit_pleasant_without_reward",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("is_pleasant", False),
+                    ("related_habit__isnull", True),
+                    _connector="OR",
+                ),
+                name="habit_pleasant_without_related_habit",
+            ),
+        ),
+        migrations.RunPython(
+            create_related_habit_trigger,
+            drop_related_habit_trigger,
+        ),
+    ]
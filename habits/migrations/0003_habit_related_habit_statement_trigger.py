@@ -0,0 +1,81 @@
+from importlib import import_module
+
+from django.db import migrations
+
+row_trigger = import_module("habits.migrations.0002_habit_business_rule_constraints")
+
+# Построчный constraint trigger из 0002 делает отдельный запрос на каждую
+# вставленную строку, что заметно тормозит массовый импорт (COPY/INSERT ...
+# SELECT). Заменяем его на statement-level триггеры с transition tables:
+# правило проверяется одним set-based запросом на весь оператор.
+STATEMENT_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant ON habits_habit;
+DROP FUNCTION IF EXISTS habits_habit_related_habit_is_pleasant();
+
+CREATE FUNCTION habits_habit_related_habit_is_pleasant()
+RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM new_rows AS n
+        JOIN habits_habit AS h ON h.id = n.related_habit_id
+        WHERE NOT h.is_pleasant
+    ) THEN
+        RAISE EXCEPTION 'related habit is not pleasant'
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND EXISTS (
+        SELECT 1 FROM new_rows AS n
+        JOIN habits_habit AS h ON h.related_habit_id = n.id
+        WHERE NOT n.is_pleasant
+    ) THEN
+        RAISE EXCEPTION 'habit is used as a related habit'
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER habit_related_habit_is_pleasant_insert
+AFTER INSERT ON habits_habit
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION habits_habit_related_habit_is_pleasant();
+
+CREATE TRIGGER habit_related_habit_is_pleasant_update
+AFTER UPDATE ON habits_habit
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION habits_habit_related_habit_is_pleasant();
+"""
+
+DROP_STATEMENT_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant_insert ON habits_habit;
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant_update ON habits_habit;
+DROP FUNCTION IF EXISTS habits_habit_related_habit_is_pleasant();
+"""
+
+
+def replace_row_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(STATEMENT_TRIGGER_SQL, params=None)
+
+
+def restore_row_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_STATEMENT_TRIGGER_SQL, params=None)
+        schema_editor.execute(row_trigger.RELATED_HABIT_IS_PLEASANT_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0002_habit_business_rule_constraints"),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_row_trigger, restore_row_trigger),
+    ]
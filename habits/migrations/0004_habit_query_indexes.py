@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0003_habit_related_habit_statement_trigger"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(
+                fields=["user", "time", "place"], name="habit_user_time_place_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["time", "place"],
+                name="habit_public_time_place_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(fields=["time"], name="habit_time_idx"),
+        ),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:44
+
+from django.db import migrations, models
+from django.utils import timezone
+
+CATALOG_FIELDS = (
+    "user_id",
+    "place",
+    "time",
+    "action",
+    "is_pleasant",
+    "related_habit_id",
+    "periodicity",
+    "reward",
+    "time_to_complete",
+    "created_at",
+    "updated_at",
+)
+
+
+def fill_catalog(apps, schema_editor):
+    """
+    Начальное наполнение из публичных привычек этой БД. Привычки других
+    шардов подберёт задача refresh_public_catalog.
+    """
+    Habit = apps.get_model("habits", "Habit")
+    PublicHabit = apps.get_model("habits", "PublicHabit")
+    using = schema_editor.connection.alias
+    now = timezone.now()
+    habits = (
+        Habit.objects.using(using).filter(is_public=True).values(*CATALOG_FIELDS, "id")
+    )
+    PublicHabit.objects.using(using).bulk_create(
+        (
+            PublicHabit(habit_id=row.pop("id"), refreshed_at=now, **row)
+            for row in habits.iterator(chunk_size=5000)
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0004_habit_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PublicHabit",
+            fields=[
+                (
+                    "habit_id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="Привычка"
+                    ),
+                ),
+                ("user_id", models.BigIntegerField(verbose_name="Пользователь")),
+                ("place", models.CharField(max_length=255, verbose_name="Место")),
+                ("time", models.TimeField(verbose_name="Время")),
+                ("action", models.CharField(max_length=255, verbose_name="Действие")),
+                ("is_pleasant", models.BooleanField(verbose_name="Приятная привычка")),
+                (
+                    "related_habit_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Связанная привычка"
+                    ),
+                ),
+                (
+                    "periodicity",
+                    models.PositiveSmallIntegerField(
+                        verbose_name="Периодичность (дни)"
+                    ),
+                ),
+                (
+                    "reward",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        null=True,
+                        verbose_name="Вознаграждение",
+                    ),
+                ),
+                (
+                    "time_to_complete",
+                    models.PositiveSmallIntegerField(
+                        verbose_name="Время на выполнение (секунды)"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Создана")),
+                ("updated_at", models.DateTimeField(verbose_name="Обновлена")),
+                (
+                    "refreshed_at",
+                    models.DateTimeField(
+                        help_text="Момент последней записи строки в каталог.",
+                        verbose_name="Обновлена в каталоге",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Публичная привычка",
+                "verbose_name_plural": "Каталог публичных привычек",
+                "ordering": ("time", "place", "habit_id"),
+                "indexes": [
+                    models.Index(
+                        fields=["time", "place", "habit_id"],
+                        include=(
+                            "user_id",
+                            "action",
+                            "is_pleasant",
+                            "related_habit_id",
+                            "periodicity",
+                            "reward",
+                            "time_to_complete",
+                            "created_at",
+                            "updated_at",
+                        ),
+                        name="public_habit_catalog_idx",
+                    ),
+                    models.Index(
+                        fields=["refreshed_at"], name="public_habit_refreshed_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(
+            fill_catalog,
+            migrations.RunPython.noop,
+            hints={"model_name": "publichabit"},
+        ),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:49
+
+import django.db.models.deletion
+import uuid
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# На PostgreSQL таблица секционирована по месяцам completed_at. Ключ
+# секционированной таблицы обязан включать колонку секционирования, поэтому
+# первичный ключ — (id, completed_at). DEFAULT-секция принимает строки вне
+# созданных месяцев, чтобы пачка из буфера не застревала; следующие месяцы
+# создаёт задача create_completion_partitions.
+PARTITIONED_TABLE_SQL = """
+CREATE TABLE habits_habitcompletion (
+    id uuid NOT NULL,
+    completed_at timestamp with time zone NOT NULL,
+    habit_id bigint NOT NULL
+        REFERENCES habits_habit (id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (id, completed_at)
+) PARTITION BY RANGE (completed_at);
+
+CREATE INDEX habit_completion_habit_idx
+    ON habits_habitcompletion (habit_id, completed_at);
+
+CREATE TABLE habits_habitcompletion_default
+    PARTITION OF habits_habitcompletion DEFAULT;
+"""
+
+MONTH_PARTITION_SQL = """
+CREATE TABLE IF NOT EXISTS habits_habitcompletion_{start:%Y_%m}
+    PARTITION OF habits_habitcompletion
+    FOR VALUES FROM ('{start:%Y-%m-%d} 00:00+00') TO ('{end:%Y-%m-%d} 00:00+00')
+"""
+
+
+def month_starts(first, count):
+    year, month = first.year, first.month
+    for _ in range(count):
+        yield first.replace(year=year, month=month, day=1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def create_completion_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.create_model(apps.get_model("habits", "HabitCompletion"))
+        return
+
+    schema_editor.execute(PARTITIONED_TABLE_SQL, params=None)
+    today = timezone.now().date()
+    previous = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+    months = list(month_starts(previous, 5))
+    for start, end in zip(months, months[1:]):
+        schema_editor.execute(
+            MONTH_PARTITION_SQL.format(start=start, end=end), params=None
+        )
+
+
+def drop_completion_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model("habits", "HabitCompletion"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0005_public_habit_catalog"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="HabitCompletion",
+                    fields=[
+                        (
+                            "id",
+                            models.UUIDField(
+                                default=uuid.uuid4,
+                                editable=False,
+                                primary_key=True,
+                                serialize=False,
+                            ),
+                        ),
+                        (
+                            "completed_at",
+                            models.DateTimeField(
+                                help_text="Когда привычка была выполнена.",
+                                verbose_name="Выполнена",
+                            ),
+                        ),
+                        (
+                            "habit",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="completions",
+                                to="habits.habit",
+                                verbose_name="Привычка",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "Выполнение привычки",
+                        "verbose_name_plural": "Выполнения привычек",
+                        "ordering": ("-completed_at",),
+                        "indexes": [
+                            models.Index(
+                                fields=["habit", "completed_at"],
+                                name="habit_completion_habit_idx",
+                            )
+                        ],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_completion_table, drop_completion_table),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:53
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_activity(apps, schema_editor):
+    """
+    Битовые карты по уже записанным отметкам о выполнении.
+    """
+    HabitCompletion = apps.get_model("habits", "HabitCompletion")
+    HabitActivity = apps.get_model("habits", "HabitActivity")
+    using = schema_editor.connection.alias
+
+    marks = defaultdict(int)
+    completions = HabitCompletion.objects.using(using).values_list(
+        "habit_id", "completed_at"
+    )
+    for habit_id, completed_at in completions.iterator(chunk_size=10000):
+        day = timezone.localtime(completed_at).date()
+        marks[habit_id, day.year] |= 1 << (day.timetuple().tm_yday - 1)
+    HabitActivity.objects.using(using).bulk_create(
+        (
+            HabitActivity(
+                habit_id=habit_id, year=year, days=bits.to_bytes(46, "little")
+            )
+            for (habit_id, year), bits in marks.items()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0006_habit_completion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HabitActivity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField(verbose_name="Год")),
+                (
+                    "days",
+                    models.BinaryField(
+                        default=bytes,
+                        help_text="Битовая карта дней года с выполнением привычки.",
+                        max_length=46,
+                        verbose_name="Дни выполнения",
+                    ),
+                ),
+                (
+                    "habit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity",
+                        to="habits.habit",
+                        verbose_name="Привычка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Активность привычки",
+                "verbose_name_plural": "Активность привычек",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("habit", "year"), name="habit_activity_habit_year_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,134 @@
+from importlib import import_module
+
+from django.db import migrations
+
+statement_trigger = import_module(
+    "habits.migrations.0003_habit_related_habit_statement_trigger"
+)
+
+# Триггеры из 0003 проверяли правило без блокировок. При READ COMMITTED две
+# транзакции — одна вставляет привычку со ссылкой на X, другая снимает с X
+# is_pleasant — не видели изменений друг друга, и обе фиксировались (FK берёт
+# на X только KEY SHARE, который с NO KEY UPDATE не конфликтует). Теперь
+# проверка вставки сначала берёт FOR SHARE на связанные привычки: параллельное
+# изменение is_pleasant ждёт её фиксации, а если оно уже прошло, повторная
+# проверка (новый снимок) его видит.
+#
+# Кроме того, триггер на UPDATE проверяет только строки, у которых
+# действительно поменялись is_pleasant или related_habit_id, — обычное
+# редактирование привычки больше не делает лишних соединений.
+LOCKING_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant_insert ON habits_habit;
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant_update ON habits_habit;
+DROP FUNCTION IF EXISTS habits_habit_related_habit_is_pleasant();
+
+CREATE FUNCTION habits_habit_related_habit_is_pleasant_insert()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM 1 FROM habits_habit AS h
+    WHERE h.id IN (SELECT related_habit_id FROM new_rows)
+    FOR SHARE;
+
+    IF EXISTS (
+        SELECT 1 FROM new_rows AS n
+        JOIN habits_habit AS h ON h.id = n.related_habit_id
+        WHERE NOT h.is_pleasant
+    ) THEN
+        RAISE EXCEPTION 'related habit is not pleasant'
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION habits_habit_related_habit_is_pleasant_update()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM 1 FROM habits_habit AS h
+    WHERE h.id IN (
+        SELECT n.related_habit_id FROM new_rows AS n
+        WHERE NOT EXISTS (
+            SELECT 1 FROM old_rows AS o
+            WHERE o.id = n.id
+              AND o.related_habit_id IS NOT DISTINCT FROM n.related_habit_id
+        )
+    )
+    FOR SHARE;
+
+    IF EXISTS (
+        SELECT 1 FROM new_rows AS n
+        JOIN habits_habit AS h ON h.id = n.related_habit_id
+        WHERE NOT h.is_pleasant
+          AND NOT EXISTS (
+              SELECT 1 FROM old_rows AS o
+              WHERE o.id = n.id
+                AND o.related_habit_id IS NOT DISTINCT FROM n.related_habit_id
+          )
+    ) THEN
+        RAISE EXCEPTION 'related habit is not pleasant'
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM new_rows AS n
+        JOIN habits_habit AS h ON h.related_habit_id = n.id
+        WHERE NOT n.is_pleasant
+          AND NOT EXISTS (
+              SELECT 1 FROM old_rows AS o
+              WHERE o.id = n.id AND NOT o.is_pleasant
+          )
+    ) THEN
+        RAISE EXCEPTION 'habit is used as a related habit'
+            USING ERRCODE = 'check_violation',
+                  CONSTRAINT = 'habit_related_habit_is_pleasant',
+                  TABLE = 'habits_habit';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER habit_related_habit_is_pleasant_insert
+AFTER INSERT ON habits_habit
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION habits_habit_related_habit_is_pleasant_insert();
+
+CREATE TRIGGER habit_related_habit_is_pleasant_update
+AFTER UPDATE ON habits_habit
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION habits_habit_related_habit_is_pleasant_update();
+"""
+
+DROP_LOCKING_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant_insert ON habits_habit;
+DROP TRIGGER IF EXISTS habit_related_habit_is_pleasant_update ON habits_habit;
+DROP FUNCTION IF EXISTS habits_habit_related_habit_is_pleasant_insert();
+DROP FUNCTION IF EXISTS habits_habit_related_habit_is_pleasant_update();
+"""
+
+
+def add_trigger_locks(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(LOCKING_TRIGGER_SQL, params=None)
+
+
+def remove_trigger_locks(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_LOCKING_TRIGGER_SQL, params=None)
+        schema_editor.execute(statement_trigger.STATEMENT_TRIGGER_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0007_habit_activity"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_trigger_locks, remove_trigger_locks),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
@@ -105,7 +107,194 @@ class Habit(models.Model):
         verbose_name = "Привычка"
         verbose_name_plural = "Привычки"
         ordering = ("time", "place")
+        indexes = [
+            # HabitViewSet.list: WHERE user_id = ? ORDER BY time, place
+            models.Index(
+                fields=["user", "time", "place"], name="habit_user_time_place_idx"
+            ),
+            # PublicHabitListView: только публичные привычки, ORDER BY time, place
+            models.Index(
+                fields=["time", "place"],
+                condition=models.Q(is_public=True),
+                name="habit_public_time_place_idx",
+            ),
+            # send_habit_reminders: диапазон по time в пределах одной минуты
+            models.Index(fields=["time"], name="habit_time_idx"),
+        ]
+        # Бизнес-правила, выражаемые в БД: на них могут полагаться массовые
+        # пути записи (bulk_create, COPY) без HabitSerializer.
+        # Правило "связанная привычка — приятная" проверяется триггером
+        # habit_related_habit_is_pleasant (см. миграции 0002, 0003).
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(reward__isnull=True)
+                | models.Q(reward="")
+                | models.Q(related_habit__isnull=True),
+                name="habit_reward_xor_related_habit",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(periodicity__gte=1, periodicity__lte=7),
+                name="habit_periodicity_range",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(time_to_complete__lte=120),
+                name="habit_time_to_complete_max",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(is_pleasant=False)
+                | models.Q(reward__isnull=True)
+                | models.Q(reward=""),
+                name="habit_pleasant_without_reward",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(is_pleasant=False)
+                | models.Q(related_habit__isnull=True),
+                name="habit_pleasant_without_related_habit",
+            ),
+        ]
 
     def __str__(self) -> str:
         habit_type = "приятная" if self.is_pleasant else "полезная"
         return f"{self.user} — {habit_type} привычка: {self.action}"
+
+
+class PublicHabit(models.Model):
+    """
+    Каталог публичных привычек: денормализованная копия полей Habit
+    с is_public=True. Хранится в default и охватывает все шарды.
+
+    Обновляется сигналами Habit (habits.catalog) и периодической задачей
+    refresh_public_catalog, которая подбирает массовые записи без сигналов
+    (bulk_create, COPY, QuerySet.update). Внешних ключей нет: привычка
+    может жить в другом шарде, а пользователи — только в default.
+    """
+
+    # Каталог только для чтения, is_public всегда True
+    is_public = True
+
+    habit_id = models.BigIntegerField(primary_key=True, verbose_name="Привычка")
+    user_id = models.BigIntegerField(verbose_name="Пользователь")
+    place = models.CharField(max_length=255, verbose_name="Место")
+    time = models.TimeField(verbose_name="Время")
+    action = models.CharField(max_length=255, verbose_name="Действие")
+    is_pleasant = models.BooleanField(verbose_name="Приятная привычка")
+    related_habit_id = models.BigIntegerField(
+        null=True, blank=True, verbose_name="Связанная привычка"
+    )
+    periodicity = models.PositiveSmallIntegerField(verbose_name="Периодичность (дни)")
+    reward = models.CharField(
+        max_length=255, null=True, blank=True, verbose_name="Вознаграждение"
+    )
+    time_to_complete = models.PositiveSmallIntegerField(
+        verbose_name="Время на выполнение (секунды)"
+    )
+    created_at = models.DateTimeField(verbose_name="Создана")
+    updated_at = models.DateTimeField(verbose_name="Обновлена")
+    refreshed_at = models.DateTimeField(
+        verbose_name="Обновлена в каталоге",
+        help_text="Момент последней записи строки в каталог.",
+    )
+
+    class Meta:
+        verbose_name = "Публичная привычка"
+        verbose_name_plural = "Каталог публичных привычек"
+        ordering = ("time", "place", "habit_id")
+        indexes = [
+            # PublicHabitListView: ORDER BY time, place, habit_id; все поля
+            # ответа в INCLUDE — страница читается index-only scan (PostgreSQL)
+            models.Index(
+                fields=["time", "place", "habit_id"],
+                include=[
+                    "user_id",
+                    "action",
+                    "is_pleasant",
+                    "related_habit_id",
+                    "periodicity",
+                    "reward",
+                    "time_to_complete",
+                    "created_at",
+                    "updated_at",
+                ],
+                name="public_habit_catalog_idx",
+            ),
+            # Удаление устаревших строк после полного обновления
+            models.Index(fields=["refreshed_at"], name="public_habit_refreshed_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.action} ({self.time:%H:%M})"
+
+
+class HabitCompletion(models.Model):
+    """
+    Отметка о выполнении привычки.
+
+    Пишется пачками из буфера Redis (habits.completions). На PostgreSQL
+    таблица секционирована по месяцам completed_at (PARTITION BY RANGE)
+    с первичным ключом (id, completed_at); Django видит ключом только id,
+    уникальность которого обеспечивает uuid4, выданный ещё при приёме
+    отметки, — повторная запись той же пачки ничего не дублирует.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="completions",
+        verbose_name="Привычка",
+    )
+    completed_at = models.DateTimeField(
+        verbose_name="Выполнена",
+        help_text="Когда привычка была выполнена.",
+    )
+
+    class Meta:
+        verbose_name = "Выполнение привычки"
+        verbose_name_plural = "Выполнения привычек"
+        ordering = ("-completed_at",)
+        indexes = [
+            # История и статистика привычки за период
+            models.Index(
+                fields=["habit", "completed_at"], name="habit_completion_habit_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.habit_id} — {self.completed_at:%Y-%m-%d %H:%M}"
+
+
+class HabitActivity(models.Model):
+    """
+    Дни выполнения привычки за год в виде битовой карты: бит n (байт n // 8,
+    маска 1 << n % 8) — выполнение в день года n (0 — 1 января, по
+    TIME_ZONE). До 366 бит, 46 байт на привычку в год.
+
+    Обновляется вместе с записью HabitCompletion, по ней считаются серии
+    и доля выполнения (habits.stats).
+    """
+
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="activity",
+        verbose_name="Привычка",
+    )
+    year = models.PositiveSmallIntegerField(verbose_name="Год")
+    days = models.BinaryField(
+        max_length=46,
+        default=bytes,
+        verbose_name="Дни выполнения",
+        help_text="Битовая карта дней года с выполнением привычки.",
+    )
+
+    class Meta:
+        verbose_name = "Активность привычки"
+        verbose_name_plural = "Активность привычек"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["habit", "year"], name="habit_activity_habit_year_uniq"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.habit_id} — {self.year}"
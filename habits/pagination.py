@@ -1,6 +1,6 @@
-from rest_framework.pagination import PageNumberPagination
+from config.async_views import AsyncPageNumberPagination
 
 
-class HabitPagination(PageNumberPagination):
+class HabitPagination(AsyncPageNumberPagination):
     page_size = 2
     page_query_param = "page"
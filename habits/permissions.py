@@ -4,4 +4,5 @@ from rest_framework.permissions import BasePermission
 class IsOwnerOrReadOnly(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        # Сравниваем id, а не объекты: obj.user вызвал бы лишний запрос к users_user
+        return obj.user_id == request.user.pk
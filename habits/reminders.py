@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import weakref
+from collections import defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from config.metrics import REMINDER_STREAM_EVENTS
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+
+
+def reminder_channel(user_id):
+    return f"{settings.REMINDER_STREAM_CHANNEL_PREFIX}{user_id}"
+
+
+def redis_client():
+    url = settings.REMINDER_STREAM_REDIS_URL
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(
+            url, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+    return _clients[url]
+
+
+def reminder_event(habit, today):
+    """
+    Событие напоминания; id одинаков у повторов за одну и ту же минуту.
+    """
+    return {
+        "id": f"{habit.pk}:{today.isoformat()}T{habit.time:%H:%M}",
+        "habit": habit.pk,
+        "action": habit.action,
+        "place": habit.place,
+        "time": f"{habit.time:%H:%M}",
+    }
+
+
+def publish_reminders(habits, today):
+    """
+    Рассылает напоминания в каналы пользователей одним pipeline.
+    Возвращает число подписок узлов, получивших события (PUBLISH
+    в канал без подписчиков ничего не стоит). Redis недоступен — 0:
+    Telegram-напоминания от этого не зависят.
+    """
+    if not settings.REMINDER_STREAM_ENABLED or not habits:
+        return 0
+    pipe = redis_client().pipeline(transaction=False)
+    for habit in habits:
+        event = reminder_event(habit, today)
+        pipe.publish(reminder_channel(habit.user_id), json.dumps(event))
+    try:
+        return sum(pipe.execute())
+    except redis.RedisError:
+        logger.warning("Не удалось разослать напоминания в SSE", exc_info=True)
+        return 0
+
+
+class ReminderHub:
+    """
+    Подписка узла на напоминания для SSE-соединений (habits.streams).
+
+    На процесс (event loop) — одно соединение pub/sub с Redis, сколько бы
+    ни было клиентов: канал пользователя подписан, пока у него есть хотя бы
+    одно соединение с этим узлом, и любой узел может обслужить любого
+    пользователя. У каждого соединения своя очередь на
+    REMINDER_STREAM_QUEUE_SIZE событий: если клиент не успевает читать,
+    старые события вытесняются новыми, а не копятся в памяти.
+
+    После разрыва с Redis читатель переподключается и заново подписывает
+    все каналы; события за время разрыва теряются.
+    """
+
+    def __init__(self):
+        self.queues = defaultdict(set)
+        self.pubsub = None
+        self.reader = None
+        self.connected = asyncio.Event()
+
+    def __len__(self):
+        return sum(len(queues) for queues in self.queues.values())
+
+    async def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=settings.REMINDER_STREAM_QUEUE_SIZE)
+        first = not self.queues[user_id]
+        self.queues[user_id].add(queue)
+        self.start()
+        if first and self.connected.is_set():
+            await self.execute("subscribe", reminder_channel(user_id))
+        return queue
+
+    async def unsubscribe(self, user_id, queue):
+        queues = self.queues.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.queues[user_id]
+            if self.connected.is_set():
+                await self.execute("unsubscribe", reminder_channel(user_id))
+
+    async def execute(self, command, channel):
+        try:
+            await getattr(self.pubsub, command)(channel)
+        except Exception:
+            # Читатель переподключится и подпишет каналы заново
+            logger.warning("Ошибка %s %s", command, channel, exc_info=True)
+
+    def deliver(self, channel, data):
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        try:
+            user_id = int(channel.removeprefix(settings.REMINDER_STREAM_CHANNEL_PREFIX))
+            event = json.loads(data)
+        except ValueError:
+            return
+        for queue in self.queues.get(user_id, ()):
+            if queue.full():
+                # Медленный клиент: вытесняем самое старое событие
+                queue.get_nowait()
+                REMINDER_STREAM_EVENTS.inc(result="dropped")
+            queue.put_nowait(event)
+            REMINDER_STREAM_EVENTS.inc(result="queued")
+
+    def start(self):
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        backoff = 0.5
+        while self.queues:
+            client = aioredis.Redis.from_url(
+                settings.REMINDER_STREAM_REDIS_URL,
+                socket_connect_timeout=1,
+                health_check_interval=settings.REMINDER_STREAM_HEARTBEAT,
+            )
+            self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await self.pubsub.connect()
+                # Сначала connected: каналы, добавленные во время subscribe
+                # ниже, подписываются самими subscribe (повтор безвреден)
+                self.connected.set()
+                channels = [reminder_channel(user_id) for user_id in self.queues]
+                if channels:
+                    await self.pubsub.subscribe(*channels)
+                backoff = 0.5
+                await self.listen()
+            except Exception:
+                logger.warning("Подписка на напоминания прервана", exc_info=True)
+            finally:
+                self.connected.clear()
+                await self.pubsub.aclose()
+                await client.aclose()
+            if self.queues:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    async def listen(self):
+        while self.queues:
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.REMINDER_STREAM_HEARTBEAT,
+            )
+            if message is not None and message["type"] == "message":
+                self.deliver(message["channel"], message["data"])
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def reminder_hub():
+    """
+    Хаб текущего event loop (соединения redis.asyncio привязаны к loop).
+    """
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = ReminderHub()
+    return hub
@@ -1,10 +1,21 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
-from .models import Habit
-from .validators import validate_habit_business_rules
+from config.renderers import CompactTimesMixin
+
+from .completions import completion_window
+from .models import Habit, HabitCompletion, PublicHabit
+from .sharding import shard_for_user
+from .validators import (
+    habit_integrity_error_to_validation_error,
+    validate_habit_business_rules,
+)
 
 
-class HabitSerializer(serializers.ModelSerializer):
+class HabitSerializer(CompactTimesMixin, serializers.ModelSerializer):
     class Meta:
         model = Habit
         fields = (
@@ -24,6 +35,18 @@ class HabitSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("id", "user", "created_at", "updated_at")
 
+    def get_fields(self):
+        """
+        При шардировании связанная привычка ищется в шарде пользователя:
+        ссылки между шардами невозможны.
+        """
+        fields = super().get_fields()
+        request = self.context.get("request")
+        shard = shard_for_user(getattr(request, "user", None))
+        if shard is not None:
+            fields["related_habit"].queryset = Habit.objects.using(shard)
+        return fields
+
     def validate(self, attrs):
         """
         Общая валидация с применением всех бизнес-правил.
@@ -39,11 +62,116 @@ class HabitSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if request is not None and request.user and not request.user.is_anonymous:
             validated_data["user"] = request.user
-        return super().create(validated_data)
+        # Не Habit.objects.create(): БД (шард) роутер выбирает по user
+        # экземпляра, а у create() без экземпляра подсказки нет
+        habit = Habit(**validated_data)
+        with self.constraint_errors(using=habit._state.db):
+            habit.save()
+        return habit
 
     def update(self, instance, validated_data):
         """
         На всякий случай не даём поменять пользователя через PATCH/PUT.
         """
         validated_data.pop("user", None)
-        return super().update(instance, validated_data)
+        with self.constraint_errors(using=instance._state.db):
+            return super().update(instance, validated_data)
+
+    @contextmanager
+    def constraint_errors(self, using=None):
+        """
+        Если бизнес-правило всё же нарушено на уровне БД (например, гонка
+        с параллельным изменением related_habit), отдаём те же ошибки по полям,
+        что и validate_habit_business_rules, вместо 500.
+        """
+        try:
+            with transaction.atomic(using=using):
+                yield
+        except IntegrityError as exc:
+            error = habit_integrity_error_to_validation_error(exc)
+            if error is None:
+                raise
+            raise error from exc
+
+
+class PublicHabitSerializer(CompactTimesMixin, serializers.ModelSerializer):
+    """
+    Запись каталога публичных привычек в том же формате, что и HabitSerializer.
+    """
+
+    id = serializers.IntegerField(source="habit_id", read_only=True)
+    user = serializers.IntegerField(source="user_id", read_only=True)
+    related_habit = serializers.IntegerField(source="related_habit_id", read_only=True)
+    is_public = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = PublicHabit
+        fields = HabitSerializer.Meta.fields
+        read_only_fields = fields
+
+
+class HabitCompletionSerializer(CompactTimesMixin, serializers.ModelSerializer):
+    """
+    Отметка о выполнении привычки. completed_at по умолчанию — сейчас.
+    """
+
+    class Meta:
+        model = HabitCompletion
+        fields = ("id", "habit", "completed_at")
+        read_only_fields = ("id", "habit")
+        extra_kwargs = {"completed_at": {"required": False}}
+
+    def validate_completed_at(self, value):
+        earliest, latest = completion_window()
+        if value > latest:
+            raise serializers.ValidationError("Нельзя отметить выполнение в будущем.")
+        if value < earliest:
+            raise serializers.ValidationError(
+                "Нельзя отметить выполнение старше "
+                f"{settings.COMPLETION_MAX_AGE_DAYS} дней."
+            )
+        return value
+
+
+class HabitStatsQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+
+
+class HabitStatsSerializer(serializers.Serializer):
+    """
+    Серии и доля выполнения привычки (habits.stats.habit_stats).
+    Период — periodicity дней от даты создания привычки.
+    """
+
+    habit = serializers.IntegerField()
+    periodicity = serializers.IntegerField()
+    window_days = serializers.IntegerField()
+    streak = serializers.IntegerField(help_text="Текущая серия засчитанных периодов.")
+    best_streak = serializers.IntegerField(help_text="Самая длинная серия.")
+    completed_periods = serializers.IntegerField(
+        help_text="Засчитанные периоды за последние window_days дней."
+    )
+    due_periods = serializers.IntegerField(
+        help_text="Периоды к выполнению за последние window_days дней."
+    )
+    adherence = serializers.FloatField(
+        allow_null=True, help_text="completed_periods / due_periods."
+    )
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=("GET", "POST", "PUT", "PATCH", "DELETE"))
+    path = serializers.RegexField(
+        r"^/", help_text='Путь маршрута привычек; "$0.id" — поле ответа элемента 0.'
+    )
+    body = serializers.JSONField(required=False, allow_null=True)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(
+        many=True, min_length=1, max_length=settings.BATCH_MAX_REQUESTS
+    )
+    atomic = serializers.BooleanField(
+        default=False,
+        help_text="Все элементы в одной транзакции; ошибка любого откатывает пакет.",
+    )
@@ -0,0 +1,229 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from .models import Habit
+
+# Шаг последовательностей id привычек на шардах: шард с индексом i выдаёт
+# id, дающие остаток i + 1 по модулю SHARD_ID_STRIDE, поэтому id уникальны
+# во всех шардах и сохраняются при переносе пользователя. Это же предел
+# числа шардов.
+SHARD_ID_STRIDE = 1024
+
+
+def sharding_enabled():
+    return bool(settings.HABIT_SHARDS)
+
+
+def placement(user_id):
+    """
+    Шард по хэшу user_id (rendezvous hashing): при добавлении шарда
+    переезжает только ~1/N пользователей.
+    """
+
+    def weight(alias):
+        digest = hashlib.blake2b(f"{alias}:{user_id}".encode(), digest_size=8)
+        return int.from_bytes(digest.digest(), "big")
+
+    return max(settings.HABIT_SHARDS, key=weight)
+
+
+def shard_for_user(user):
+    """
+    Шард с привычками пользователя: явно закреплённый (User.habit_shard,
+    выставляется при ребалансировке) или по хэшу. None — шардирование
+    выключено, БД выбирают остальные роутеры.
+    """
+    if not sharding_enabled() or user is None or not user.is_authenticated:
+        return None
+    return user.habit_shard or placement(user.pk)
+
+
+def shard_for_user_id(user_id):
+    if not sharding_enabled():
+        return None
+    User = get_user_model()
+    pinned = (
+        User.objects.using("default")
+        .filter(pk=user_id)
+        .values_list("habit_shard", flat=True)
+        .first()
+    )
+    return pinned or placement(user_id)
+
+
+def shards_for_user_ids(user_ids):
+    """
+    {user_id: шард} для набора пользователей одним запросом к default.
+    Без шардирования — None для всех.
+    """
+    user_ids = set(user_ids)
+    if not sharding_enabled():
+        return dict.fromkeys(user_ids)
+    User = get_user_model()
+    pinned = dict(
+        User.objects.using("default")
+        .filter(pk__in=user_ids)
+        .values_list("pk", "habit_shard")
+    )
+    return {user_id: pinned.get(user_id) or placement(user_id) for user_id in user_ids}
+
+
+class HabitShardRouter:
+    """
+    Habit читается и пишется в шард своего пользователя. Экземпляр,
+    загруженный из шарда, остаётся в нём; новый получает шард из user.
+    Запросы без экземпляра (Habit.objects.filter(...)) нужно явно
+    направлять через .using(shard_for_user(user)).
+
+    Пользователи, каталог публичных привычек и остальные модели всегда
+    живут в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get("instance")
+        if model is Habit:
+            return self.habit_shard(instance)
+        if instance is not None and isinstance(instance, Habit):
+            # habit.user с привычки из шарда
+            return "default"
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled() or model is not Habit:
+            return None
+        return self.habit_shard(hints.get("instance"))
+
+    def habit_shard(self, instance):
+        if isinstance(instance, get_user_model()):
+            return shard_for_user(instance)
+        if not isinstance(instance, Habit):
+            return None
+        if instance._state.db in settings.HABIT_SHARDS:
+            return instance._state.db
+        user = instance._state.fields_cache.get("user")
+        if user is not None:
+            return shard_for_user(user)
+        if instance.user_id is not None:
+            return shard_for_user_id(instance.user_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding_enabled():
+            return None
+        models = {type(obj1), type(obj2)}
+        if models == {Habit, get_user_model()}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Каталог публичных привычек один на все шарды
+        if model_name == "publichabit" and db != "default":
+            return False
+        return None
+
+
+def fan_out(func, shards=None):
+    """
+    Вызывает func(alias) для каждого шарда параллельно и возвращает
+    результаты в порядке шардов.
+
+    Внутри транзакции вызывающего потока шарды обходятся последовательно
+    в этом же потоке: соединения других потоков незакоммиченных данных
+    не видят.
+    """
+    shards = list(shards or settings.HABIT_SHARDS)
+    if len(shards) <= 1 or any(connections[alias].in_atomic_block for alias in shards):
+        return [func(alias) for alias in shards]
+
+    def call(alias):
+        try:
+            return func(alias)
+        finally:
+            # Соединения потоков пула не переиспользуются Django
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        return list(executor.map(call, shards))
+
+
+@contextmanager
+def preserve_timestamps():
+    """
+    При переносе привычек между шардами сохраняем created_at/updated_at
+    (от created_at зависит periodicity в send_habit_reminders).
+    """
+    created_at = Habit._meta.get_field("created_at")
+    updated_at = Habit._meta.get_field("updated_at")
+    created_at.auto_now_add = updated_at.auto_now = False
+    try:
+        yield
+    finally:
+        created_at.auto_now_add = updated_at.auto_now = True
+
+
+def prepare_shards(shards=None):
+    """
+    Готовит шарды (PostgreSQL) к работе, операция идемпотентна:
+
+    - на шардах кроме default удаляется внешний ключ habits_habit.user_id:
+      пользователи живут только в default;
+    - последовательность id каждого шарда переводится на шаг SHARD_ID_STRIDE
+      со своим остатком и стартом выше максимального id во всех шардах.
+    """
+    shards = list(shards or settings.HABIT_SHARDS)
+    global_max = max(
+        fan_out(
+            lambda alias: Habit.objects.using(alias)
+            .order_by("-pk")
+            .values_list("pk", flat=True)
+            .first()
+            or 0,
+            shards,
+        )
+    )
+
+    for alias in shards:
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            continue
+        index = settings.HABIT_SHARDS.index(alias)
+        with connection.cursor() as cursor:
+            if alias != "default":
+                constraints = connection.introspection.get_constraints(
+                    cursor, Habit._meta.db_table
+                )
+                for name, info in constraints.items():
+                    if info["foreign_key"] and info["columns"] == ["user_id"]:
+                        cursor.execute(
+                            f"ALTER TABLE {Habit._meta.db_table} "
+                            f"DROP CONSTRAINT {connection.ops.quote_name(name)}"
+                        )
+
+            cursor.execute(
+                "SELECT pg_get_serial_sequence(%s, 'id')", [Habit._meta.db_table]
+            )
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f"SELECT last_value FROM {sequence}")
+            last_value = max(cursor.fetchone()[0], global_max)
+            # Ближайшее значение > last_value с остатком index + 1
+            start = last_value + 1
+            start += (index + 1 - start) % SHARD_ID_STRIDE
+            cursor.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY {SHARD_ID_STRIDE}")
+            cursor.execute("SELECT setval(%s, %s, false)", [sequence, start])
+
+
+def delete_user_habits(sender, instance, using, **kwargs):
+    """
+    Каскад User -> Habit работает только внутри одной БД; привычки
+    в других шардах удаляем сами.
+    """
+    shard = shard_for_user(instance)
+    if shard is not None and shard != using:
+        Habit.objects.using(shard).filter(user_id=instance.pk).delete()
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import HabitActivity
+
+# Размер битовой карты года в байтах (366 дней)
+YEAR_BYTES = 46
+
+
+def day_of_year(moment):
+    """
+    (год, номер дня года с 0) для момента в TIME_ZONE.
+    """
+    day = timezone.localtime(moment).date()
+    return day.year, day.timetuple().tm_yday - 1
+
+
+def mark_completions(completions, using=None):
+    """
+    Ставит биты дней выполнения в HabitActivity для пачки HabitCompletion:
+    INSERT недостающих строк (ON CONFLICT DO NOTHING), SELECT ... FOR UPDATE,
+    OR в Python и один bulk_update. Повторная отметка того же дня ничего
+    не меняет, поэтому повтор пачки из буфера безопасен.
+    """
+    marks = defaultdict(int)
+    for completion in completions:
+        year, day = day_of_year(completion.completed_at)
+        marks[completion.habit_id, year] |= 1 << day
+    if not marks:
+        return
+
+    activity = HabitActivity.objects.using(using)
+    with transaction.atomic(using=using):
+        activity.bulk_create(
+            [HabitActivity(habit_id=habit_id, year=year) for habit_id, year in marks],
+            ignore_conflicts=True,
+        )
+        rows = (
+            activity.select_for_update()
+            .filter(
+                habit_id__in={habit_id for habit_id, _ in marks},
+                year__in={year for _, year in marks},
+            )
+            .order_by("habit_id", "year")
+        )
+        changed = []
+        for row in rows:
+            bits = marks.get((row.habit_id, row.year))
+            current = int.from_bytes(row.days, "little")
+            if bits is not None and current | bits != current:
+                row.days = (current | bits).to_bytes(YEAR_BYTES, "little")
+                changed.append(row)
+        activity.bulk_update(changed, ["days"])
+
+
+def span(start, stop):
+    """
+    Маска битов [start, stop).
+    """
+    if stop <= start:
+        return 0
+    return ((1 << (stop - start)) - 1) << start
+
+
+def every_nth(step, length):
+    """
+    Маска битов 0, step, 2*step, ... меньше length: удвоением за O(log n)
+    операций над целым.
+    """
+    mask, width = 1, step
+    while width < length:
+        mask |= mask << width
+        width *= 2
+    return mask & span(0, length)
+
+
+def period_stats(days, start, today, periodicity, window_start=None):
+    """
+    Серии и доля выполнения по битовой карте дней (целое: бит n — день n).
+
+    Период k длиной periodicity начинается в день start + k * periodicity
+    и засчитан, если в нём есть хотя бы одно выполнение. Текущий период
+    учитывается, только если уже засчитан, — незавершённый не обрывает
+    серию и не снижает долю.
+
+    Всё считается операциями над целыми (сдвиги, AND/OR, bit_count) —
+    по машинным словам, без цикла по дням.
+    """
+    stats = {
+        "streak": 0,
+        "best_streak": 0,
+        "completed_periods": 0,
+        "due_periods": 0,
+        "adherence": None,
+    }
+    if today < start:
+        return stats
+
+    # Бит i: выполнение в одном из дней [i, i + periodicity)
+    any_in_period = days
+    for shift in range(1, periodicity):
+        any_in_period |= days >> shift
+
+    current = start + (today - start) // periodicity * periodicity
+    due = every_nth(periodicity, current - start + 1) << start
+    done = any_in_period & due
+    last = current if done >> current & 1 else current - periodicity
+    if last < start:
+        return stats
+
+    missed = due & ~done & span(start, last + 1)
+    if missed:
+        stats["streak"] = (last - (missed.bit_length() - 1)) // periodicity
+    else:
+        stats["streak"] = (last - start) // periodicity + 1
+
+    runs = done
+    while runs:
+        runs &= runs >> periodicity
+        stats["best_streak"] += 1
+
+    window = span(max(start, window_start or start), last + 1)
+    stats["completed_periods"] = (done & window).bit_count()
+    stats["due_periods"] = (due & window).bit_count()
+    if stats["due_periods"]:
+        stats["adherence"] = round(stats["completed_periods"] / stats["due_periods"], 4)
+    return stats
+
+
+def habit_stats(habit, window_days=30, today=None):
+    """
+    Статистика привычки: одна выборка битовых карт всех лет и расчёт
+    по period_stats. Отсчёт периодов — от даты создания привычки, как
+    в send_habit_reminders.
+    """
+    today = today or timezone.localdate()
+    created = timezone.localtime(habit.created_at).date()
+    years = dict(
+        HabitActivity.objects.using(habit._state.db)
+        .filter(habit_id=habit.pk)
+        .values_list("year", "days")
+    )
+
+    origin = date(min([created.year, *years]), 1, 1)
+    days = 0
+    for year, bits in years.items():
+        days |= int.from_bytes(bits, "little") << (date(year, 1, 1) - origin).days
+
+    window_start = today - timedelta(days=window_days - 1)
+    stats = period_stats(
+        days,
+        start=(created - origin).days,
+        today=(today - origin).days,
+        periodicity=habit.periodicity,
+        window_start=(window_start - origin).days,
+    )
+    return {
+        "habit": habit.pk,
+        "periodicity": habit.periodicity,
+        "window_days": window_days,
+        **stats,
+    }
@@ -0,0 +1,194 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from config.metrics import REMINDER_STREAM_CONNECTIONS
+from users.authentication import AsyncJWTAuthentication
+
+from .reminders import reminder_hub
+
+STREAM_PATH = "/reminders/stream/"
+
+# Через сколько миллисекунд EventSource переподключается после разрыва
+RETRY_MS = 5000
+
+
+def sse_event(event):
+    return (
+        f"id: {event['id']}\nevent: reminder\n"
+        f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    ).encode()
+
+
+def cors_headers(scope):
+    origin = dict(scope["headers"]).get(b"origin", b"").decode("latin-1")
+    if not origin or origin not in settings.CORS_ALLOWED_ORIGINS:
+        return []
+    return [
+        (b"access-control-allow-origin", origin.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"origin"),
+    ]
+
+
+def raw_token(scope):
+    """
+    Токен из Authorization: Bearer или ?access_token= (EventSource
+    в браузере не умеет передавать заголовки).
+    """
+    header = dict(scope["headers"]).get(b"authorization")
+    if header:
+        parts = header.split()
+        if len(parts) == 2 and parts[0] == b"Bearer":
+            return parts[1]
+        return None
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    token = query.get("access_token", [None])[0]
+    return token.encode() if token else None
+
+
+async def authenticate(scope):
+    token = raw_token(scope)
+    if token is None:
+        return None
+    authentication = AsyncJWTAuthentication()
+    try:
+        validated = authentication.get_validated_token(token)
+        # Вне цикла запроса Django: соединение потока закрываем сами
+        await sync_to_async(close_old_connections)()
+        return await authentication.aget_user(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def respond(send, scope, status, body=b"", headers=()):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                *headers,
+                *cors_headers(scope),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def reminder_stream(scope, receive, send):
+    """
+    GET /reminders/stream/ — Server-Sent Events с напоминаниями о привычках
+    текущего пользователя (события "reminder", см. habits.reminders).
+
+    ASGI-приложение вне обработчика Django (config/asgi.py): Django держит
+    на каждый ASGI-запрос поток для sync_to_async, а соединение SSE живёт
+    часами. Здесь же idle-соединение — корутина и очередь, поэтому узел
+    держит десятки тысяч клиентов. Раз в REMINDER_STREAM_HEARTBEAT секунд
+    уходит комментарий-heartbeat (прокси не рвут соединение, разрыв
+    обнаруживается), через REMINDER_STREAM_MAX_AGE секунд поток
+    закрывается: клиент переподключается, токен проверяется заново,
+    соединения перераспределяются между узлами.
+    """
+    if scope["method"] == "OPTIONS":
+        await respond(
+            send,
+            scope,
+            204,
+            headers=[
+                (b"access-control-allow-methods", b"GET, OPTIONS"),
+                (b"access-control-allow-headers", b"authorization, last-event-id"),
+            ],
+        )
+        return
+    if scope["method"] != "GET":
+        await respond(send, scope, 405, b'{"detail": "Method not allowed."}')
+        return
+
+    user = await authenticate(scope)
+    if user is None:
+        REMINDER_STREAM_CONNECTIONS.inc(result="unauthorized")
+        await respond(
+            send,
+            scope,
+            401,
+            b'{"detail": "Authentication credentials were not provided."}',
+            [(b"www-authenticate", b'Bearer realm="api"')],
+        )
+        return
+
+    hub = reminder_hub()
+    if len(hub) >= settings.REMINDER_STREAM_MAX_CONNECTIONS:
+        REMINDER_STREAM_CONNECTIONS.inc(result="rejected")
+        retry_after = str(RETRY_MS // 1000).encode()
+        await respond(
+            send,
+            scope,
+            503,
+            b'{"detail": "Too many streams on this node."}',
+            [(b"retry-after", retry_after)],
+        )
+        return
+
+    REMINDER_STREAM_CONNECTIONS.inc(result="opened")
+    queue = await hub.subscribe(user.pk)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    # nginx: не буферизовать поток
+                    (b"x-accel-buffering", b"no"),
+                    *cors_headers(scope),
+                ],
+            }
+        )
+        await send_chunk(send, f"retry: {RETRY_MS}\n\n".encode())
+        await stream_events(send, queue, disconnected)
+        if not disconnected.done():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        await hub.unsubscribe(user.pk, queue)
+
+
+async def stream_events(send, queue, disconnected):
+    loop = asyncio.get_running_loop()
+    closes_at = loop.time() + settings.REMINDER_STREAM_MAX_AGE
+    while not disconnected.done():
+        timeout = min(settings.REMINDER_STREAM_HEARTBEAT, closes_at - loop.time())
+        if timeout <= 0:
+            return
+        event = asyncio.ensure_future(queue.get())
+        await asyncio.wait(
+            {event, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if event.done():
+            chunk = sse_event(event.result())
+        else:
+            event.cancel()
+            if disconnected.done():
+                return
+            chunk = b": heartbeat\n\n"
+        # send ждёт, пока сервер примет данные: медленный клиент
+        # не копит буфер, а вытесняет события в своей очереди
+        await send_chunk(send, chunk)
+
+
+async def send_chunk(send, chunk):
+    await send({"type": "http.response.body", "body": chunk, "more_body": True})
@@ -1,9 +1,26 @@
+from datetime import datetime, time, timedelta
+
 import requests
-from celery import shared_task
+from celery import current_app, shared_task
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 
+from config.beat import tick_lock
+from config.db_router import replica_reads
+from config.metrics import (
+    HABIT_REMINDERS,
+    HABIT_REMINDERS_LAST_TICK,
+    TELEGRAM_API_LATENCY,
+)
+
+from .catalog import refresh_catalog
+from .completions import ensure_partitions, flush_completions
 from .models import Habit
+from .reminders import publish_reminders
+from .sharding import fan_out, sharding_enabled
+
+User = get_user_model()
 
 
 @shared_task
@@ -13,44 +30,191 @@ def send_habit_reminders():
 
     Логика простая:
     - Берём текущее локальное время.
-    - Ищем привычки с таким же часом и минутой.
+    - Ищем привычки с таким же часом и минутой (диапазон по time, чтобы
+      работал индекс habit_time_idx).
     - Проверяем periodicity: ((сегодня - дата создания) % periodicity == 0).
-    - Для каждого пользователя с telegram_chat_id отправляем сообщение в Telegram.
+    - Публикуем напоминания в SSE-поток веб-клиентов (habits.reminders),
+      если он включён: там нужны привычки всех пользователей.
+    - Для каждого пользователя с telegram_chat_id ставим в очередь доставки
+      задачу deliver_reminder — по одной на сообщение.
+
+    Выборка привычек читается с реплики: отставание в пределах
+    REPLICA_MAX_LAG секунд для поминутного планирования допустимо.
+    При шардировании шарды опрашиваются параллельно.
+
+    Итоги запуска (queued/skipped/streamed) пишутся в метрики
+    habit_reminders_*, итоги доставки — в deliver_reminder.
+
+    Запуски за одну и ту же минуту не пересекаются и не повторяются
+    (config.beat.tick_lock), даже если предыдущий запуск не уложился
+    в минуту или beat сменил ведущего.
     """
     now = timezone.localtime()
+    with tick_lock("send_habit_reminders", f"{now:%Y-%m-%dT%H:%M}", 60) as run:
+        if run:
+            plan_reminders(now)
+
+
+def plan_reminders(now):
+    """
+    Планирование напоминаний за минуту now (тело send_habit_reminders).
+    """
     today = now.date()
+    streaming = settings.REMINDER_STREAM_ENABLED
 
-    # Фильтруем по времени
-    habits = Habit.objects.filter(
-        time__hour=now.hour,
-        time__minute=now.minute,
-    )
+    # Фильтруем по времени: [HH:MM:00, HH:MM+1:00)
+    minute_start = time(now.hour, now.minute)
+    habits = Habit.objects.filter(time__gte=minute_start)
+    if minute_start != time(23, 59):
+        next_minute = datetime.combine(today, minute_start) + timedelta(minutes=1)
+        habits = habits.filter(time__lt=next_minute.time())
+    if sharding_enabled():
+        habits = habits_from_shards(habits, telegram_only=not streaming)
+    else:
+        if not streaming:
+            habits = habits.filter(user__telegram_chat_id__isnull=False)
+        with replica_reads():
+            habits = list(habits.select_related("user"))
 
+    results = {"queued": 0, "skipped": 0, "streamed": 0}
+    due = []
     for habit in habits:
         # Проверка периодичности
         days_diff = (today - habit.created_at.date()).days
-        if days_diff < 0:
-            continue
-        if days_diff % habit.periodicity != 0:
+        if days_diff < 0 or days_diff % habit.periodicity != 0:
+            # Без Telegram пропуск заметен только в потоке
+            if habit.user.telegram_chat_id:
+                results["skipped"] += 1
             continue
+        due.append(habit)
 
-        user = habit.user
-        chat_id = getattr(user, "telegram_chat_id", None)
-        if not chat_id:
-            continue
+    results["streamed"] = publish_reminders(due, today)
 
-        text = (
-            f"Напоминание о привычке:\n"
-            f"{habit.action}\n"
-            f"Место: {habit.place}\n"
-            f"Время: {habit.time.strftime('%H:%M')}"
-        )
+    messages = [
+        (habit.user.telegram_chat_id, reminder_text(habit))
+        for habit in due
+        if habit.user.telegram_chat_id
+    ]
+    # Одно соединение с брокером на все сообщения минуты
+    with current_app.producer_or_acquire() as producer:
+        for chat_id, text in messages:
+            deliver_reminder.apply_async((chat_id, text), producer=producer)
+    results["queued"] = len(messages)
+
+    for result, count in results.items():
+        HABIT_REMINDERS.inc(count, result=result)
+        HABIT_REMINDERS_LAST_TICK.set(count, result=result)
+
+
+def reminder_text(habit):
+    return (
+        f"Напоминание о привычке:\n"
+        f"{habit.action}\n"
+        f"Место: {habit.place}\n"
+        f"Время: {habit.time.strftime('%H:%M')}"
+    )
+
+
+@shared_task(bind=True, ignore_result=True)
+def deliver_reminder(self, chat_id, text):
+    """
+    Отправка одного напоминания в Telegram.
+
+    Задача только ждёт ответа Bot API, поэтому её очередь обслуживают
+    воркеры с пулом eventlet: тысячи одновременных запросов на процесс
+    (WORKER_QUEUE_PROFILES). Сетевые ошибки, 429 и 5xx повторяются
+    с нарастающей задержкой (или через retry_after из ответа 429) до
+    REMINDER_DELIVERY_MAX_RETRIES раз в отдельной очереди
+    REMINDER_RETRY_QUEUE — повторы не задерживают свежие напоминания.
+    Остальные ошибки (бот заблокирован, чат удалён) не повторяются.
+
+    Итоги пишутся в habit_reminders_total: sent, retried, failed.
+    """
+    url = f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+    try:
+        with TELEGRAM_API_LATENCY.time(method="sendMessage"):
+            response = requests.post(
+                url, json={"chat_id": chat_id, "text": text}, timeout=5
+            )
+    except requests.RequestException:
+        response = None
+    if response is not None and response.ok:
+        HABIT_REMINDERS.inc(result="sent")
+        return
+
+    transient = response is None or response.status_code in (429, *range(500, 600))
+    if not transient or self.request.retries >= settings.REMINDER_DELIVERY_MAX_RETRIES:
+        HABIT_REMINDERS.inc(result="failed")
+        return
+    HABIT_REMINDERS.inc(result="retried")
+    raise self.retry(
+        countdown=retry_delay(response, self.request.retries),
+        queue=settings.REMINDER_RETRY_QUEUE,
+        max_retries=settings.REMINDER_DELIVERY_MAX_RETRIES,
+    )
 
-        url = (
-            f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-        )
 
+def retry_delay(response, retries):
+    """
+    Секунды до повтора: retry_after из ответа 429 или экспоненциальная
+    задержка от REMINDER_DELIVERY_RETRY_DELAY.
+    """
+    if response is not None and response.status_code == 429:
         try:
-            requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=5)
-        except requests.RequestException:
-            continue
+            return int(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            pass
+    return settings.REMINDER_DELIVERY_RETRY_DELAY * 2**retries
+
+
+@shared_task
+def refresh_public_catalog():
+    """
+    Периодическое полное обновление каталога публичных привычек
+    (habits.catalog.refresh_catalog): подбирает изменения, прошедшие мимо
+    сигналов Habit, — bulk_create, COPY, QuerySet.update.
+    """
+    refreshed, removed = refresh_catalog()
+    return {"refreshed": refreshed, "removed": removed}
+
+
+@shared_task
+def flush_habit_completions():
+    """
+    Переносит отметки о выполнении из буфера Redis в БД пачками
+    (habits.completions.flush_completions).
+    """
+    return flush_completions()
+
+
+@shared_task
+def create_completion_partitions():
+    """
+    Заранее создаёт месячные секции habits_habitcompletion на всех шардах.
+    """
+    return ensure_partitions()
+
+
+def habits_from_shards(queryset, telegram_only=True):
+    """
+    Пользователи живут только в default, поэтому join с users_user в шардах
+    невозможен: привычки собираем со всех шардов, а пользователей
+    (при telegram_only — только с telegram_chat_id) подгружаем одним запросом.
+    """
+    habits = [
+        habit
+        for part in fan_out(lambda alias: list(queryset.using(alias)))
+        for habit in part
+    ]
+    users = User.objects.filter(pk__in={habit.user_id for habit in habits})
+    if telegram_only:
+        users = users.filter(telegram_chat_id__isnull=False)
+    users = users.in_bulk()
+
+    due = []
+    for habit in habits:
+        user = users.get(habit.user_id)
+        if user is not None:
+            habit.user = user
+            due.append(habit)
+    return due
@@ -1,24 +1,88 @@
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import time as dt_time
 from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import skipUnless
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+import redis
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase, override_settings
-from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Q
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import resolve, reverse
 from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
-
-from habits.models import Habit
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    APITestCase,
+    force_authenticate,
+)
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.celery import app as celery_app
+from config.metrics import STORE, render
+from config.renderers import MSGPACK_MEDIA_TYPE, MessagePackRenderer, msgpack
+from habits.management.commands.benchmark_endpoints import seq_scans
+from habits.management.commands.import_habits import IMPORT_COLUMNS, NDJSONCopyStream
+from habits.cache import LOCAL, VERSIONS, LocalLRU
+from habits.completions import BUFFER_KEY, ensure_partitions, flush_completions
+from habits.catalog import refresh_catalog
+from habits.models import Habit, HabitActivity, HabitCompletion, PublicHabit
 from habits.permissions import IsOwnerOrReadOnly
+from habits.reminders import ReminderHub, reminder_hub
 from habits.serializers import HabitSerializer
-from habits.tasks import send_habit_reminders
-from habits.validators import validate_habit_business_rules
+from habits.sharding import SHARD_ID_STRIDE, placement, shard_for_user
+from habits.stats import mark_completions, period_stats
+from habits.streams import STREAM_PATH, reminder_stream, sse_event
+from habits.tasks import (
+    deliver_reminder,
+    refresh_public_catalog,
+    send_habit_reminders,
+)
+from habits.validators import (
+    habit_integrity_error_to_validation_error,
+    validate_habit_business_rules,
+)
 from habits.views import HabitViewSet
 
 User = get_user_model()
 
 
+@contextmanager
+def eager_tasks():
+    """
+    Задачи, поставленные в очередь (deliver_reminder), выполняются сразу.
+    """
+    previous = celery_app.conf.task_always_eager
+    celery_app.conf.task_always_eager = True
+    try:
+        yield
+    finally:
+        celery_app.conf.task_always_eager = previous
+
+
 class HabitModelTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="user1", password="strongpass123")
@@ -184,6 +248,194 @@ class HabitBusinessRulesValidatorTests(TestCase):
                 raise
 
 
+class HabitDatabaseConstraintTests(TestCase):
+    """
+    Бизнес-правила продублированы ограничениями в БД, чтобы массовые пути
+    записи (bulk_create, COPY) могли обходиться без сериализатора.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="constraint_user", password="strongpass123"
+        )
+        self.pleasant_habit = Habit.objects.create(
+            user=self.user,
+            place="Кино",
+            time=timezone.now().time(),
+            action="Посмотреть фильм",
+            is_pleasant=True,
+            periodicity=1,
+            time_to_complete=60,
+        )
+
+    def build_habit(self, **kwargs):
+        values = {
+            "user": self.user,
+            "place": "Дом",
+            "time": timezone.now().time(),
+            "action": "Сделать зарядку",
+            "is_pleasant": False,
+            "periodicity": 1,
+            "time_to_complete": 60,
+        }
+        values.update(kwargs)
+        return Habit(**values)
+
+    def assert_violates(self, expected_errors, **kwargs):
+        with self.assertRaises(IntegrityError) as ctx:
+            with transaction.atomic():
+                Habit.objects.bulk_create([self.build_habit(**kwargs)])
+
+        error = habit_integrity_error_to_validation_error(ctx.exception)
+        self.assertIsNotNone(error)
+        for field, message in expected_errors.items():
+            self.assertEqual(str(error.detail[field]), message)
+
+    def test_reward_and_related_habit_are_mutually_exclusive(self):
+        self.assert_violates(
+            {
+                "reward": "Нельзя одновременно указывать вознаграждение и связанную привычку.",
+                "related_habit": "Нельзя одновременно указывать связанную привычку и вознаграждение.",
+            },
+            reward="Шоколад",
+            related_habit=self.pleasant_habit,
+        )
+
+    def test_periodicity_range(self):
+        self.assert_violates(
+            {"periodicity": "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."},
+            periodicity=8,
+        )
+
+    def test_time_to_complete_max(self):
+        self.assert_violates(
+            {
+                "time_to_complete": "Время на выполнение привычки не может превышать 120 секунд."
+            },
+            time_to_complete=121,
+        )
+
+    def test_pleasant_habit_without_reward(self):
+        self.assert_violates(
+            {"reward": "У приятной привычки не может быть вознаграждения."},
+            is_pleasant=True,
+            reward="Шоколад",
+        )
+
+    def test_pleasant_habit_without_related_habit(self):
+        self.assert_violates(
+            {"related_habit": "У приятной привычки не может быть связанной привычки."},
+            is_pleasant=True,
+            related_habit=self.pleasant_habit,
+        )
+
+    def test_valid_rows_pass_bulk_create(self):
+        Habit.objects.bulk_create(
+            [
+                self.build_habit(related_habit=self.pleasant_habit),
+                self.build_habit(reward="Шоколад", periodicity=7),
+            ]
+        )
+        self.assertEqual(Habit.objects.count(), 3)
+
+    @skipUnless(connection.vendor == "postgresql", "Триггер есть только в PostgreSQL")
+    def test_related_habit_must_be_pleasant(self):
+        useful = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=timezone.now().time(),
+            action="Читать книгу",
+            periodicity=1,
+            time_to_complete=60,
+        )
+        self.assert_violates(
+            {
+                "related_habit": "В связанные привычки могут попадать только приятные привычки."
+            },
+            related_habit=useful,
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "Триггер есть только в PostgreSQL")
+    def test_referenced_habit_cannot_become_useful(self):
+        Habit.objects.bulk_create([self.build_habit(related_habit=self.pleasant_habit)])
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Habit.objects.filter(pk=self.pleasant_habit.pk).update(
+                    is_pleasant=False
+                )
+
+    @skipUnless(connection.vendor == "postgresql", "Триггер есть только в PostgreSQL")
+    def test_related_habit_cannot_be_switched_to_useful(self):
+        useful, habit = Habit.objects.bulk_create(
+            [self.build_habit(), self.build_habit(related_habit=self.pleasant_habit)]
+        )
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Habit.objects.filter(pk=habit.pk).update(related_habit=useful)
+
+    @patch("habits.serializers.validate_habit_business_rules")
+    def test_serializer_maps_constraint_violation_to_field_errors(self, _):
+        serializer = HabitSerializer(
+            data={
+                "place": "Дом",
+                "time": "08:00:00",
+                "action": "Сделать зарядку",
+                "is_pleasant": False,
+                "related_habit": self.pleasant_habit.pk,
+                "reward": "Шоколад",
+                "periodicity": 1,
+                "time_to_complete": 60,
+            }
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        with self.assertRaises(ValidationError) as ctx:
+            serializer.save(user=self.user)
+
+        self.assertIn("reward", ctx.exception.detail)
+        self.assertIn("related_habit", ctx.exception.detail)
+
+
+@skipUnless(connection.vendor == "postgresql", "Триггер есть только в PostgreSQL")
+class HabitRelatedHabitRaceTests(TransactionTestCase):
+    """
+    Правило «связанная привычка приятная» не обходится двумя параллельными
+    транзакциями при READ COMMITTED.
+    """
+
+    def test_concurrent_unpleasant_update_waits_for_insert(self):
+        user = User.objects.create_user(username="race_user", password="pass12345")
+        values = {
+            "user": user,
+            "place": "Дом",
+            "time": dt_time(8, 0),
+            "periodicity": 1,
+            "time_to_complete": 60,
+        }
+        pleasant = Habit.objects.create(action="Кофе", is_pleasant=True, **values)
+
+        def make_useless():
+            try:
+                with transaction.atomic():
+                    Habit.objects.filter(pk=pleasant.pk).update(is_pleasant=False)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with transaction.atomic():
+                Habit.objects.create(action="Зарядка", related_habit=pleasant, **values)
+                # Обновление из другого соединения ждёт фиксации вставки
+                update = executor.submit(make_useless)
+                with self.assertRaises(TimeoutError):
+                    update.result(timeout=0.3)
+
+            with self.assertRaises(IntegrityError):
+                update.result(timeout=10)
+
+        pleasant.refresh_from_db()
+        self.assertTrue(pleasant.is_pleasant)
+
+
 class HabitSerializerTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -431,126 +683,1840 @@ class PublicHabitListViewTests(APITestCase):
         self.assertEqual(actions, {"Публичная 1", "Публичная 2"})
 
 
-class HabitViewSetDirectCallTests(TestCase):
-    """
-    Небольшой прямой тест ViewSet через APIRequestFactory,
-    чтобы убедиться, что get_queryset фильтрует по пользователю.
-    """
-
+class PublicHabitCatalogTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
-            username="factory_user", password="strongpass123"
-        )
-        self.other_user = User.objects.create_user(
-            username="factory_other", password="strongpass123"
+            username="catalog_user", password="strongpass123"
         )
-        Habit.objects.create(
+        self.pleasant = Habit.objects.create(
             user=self.user,
             place="Дом",
-            time=timezone.now().time(),
-            action="Моя привычка",
-            is_pleasant=False,
-            periodicity=1,
+            time="08:00",
+            action="Кофе",
+            is_pleasant=True,
             time_to_complete=60,
-            is_public=False,
+            is_public=True,
         )
-        Habit.objects.create(
-            user=self.other_user,
-            place="Офис",
-            time=timezone.now().time(),
-            action="Чужая привычка",
-            is_pleasant=False,
-            periodicity=1,
+        self.useful = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time="07:00",
+            action="Зарядка",
+            related_habit=self.pleasant,
             time_to_complete=60,
-            is_public=False,
+            is_public=True,
         )
-        self.factory = APIRequestFactory()
 
-    def test_get_queryset_returns_only_user_habits(self):
-        view = HabitViewSet.as_view({"get": "list"})
-        request = self.factory.get("/habits/")
-        force_authenticate(request, user=self.user)
-        response = view(request)
+    def test_public_list_matches_habit_serializer_format(self):
+        self.client.force_authenticate(user=self.user)
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data["count"], 1)
-        self.assertEqual(response.data["results"][0]["action"], "Моя привычка")
+        response = self.client.get(reverse("habits:public-habits"))
+
+        self.assertEqual(
+            response.data["results"],
+            [
+                HabitSerializer(habit).data
+                for habit in Habit.objects.order_by("time", "place")
+            ],
+        )
 
+    def test_signals_keep_catalog_in_sync(self):
+        self.useful.is_public = False
+        self.useful.save()
+        self.assertFalse(PublicHabit.objects.filter(habit_id=self.useful.pk).exists())
 
-class SendHabitRemindersTaskTests(TestCase):
+        self.pleasant.action = "Чай"
+        self.pleasant.save()
+        self.assertEqual(
+            PublicHabit.objects.get(habit_id=self.pleasant.pk).action, "Чай"
+        )
+
+        self.useful.is_public = True
+        self.useful.save()
+        self.pleasant.delete()
+        self.assertEqual(
+            list(PublicHabit.objects.values_list("habit_id", "related_habit_id")),
+            [(self.useful.pk, None)],
+        )
+
+    def test_scheduled_refresh_picks_up_writes_without_signals(self):
+        Habit.objects.filter(pk=self.useful.pk).update(is_public=False)
+        Habit.objects.bulk_create(
+            [
+                Habit(
+                    user=self.user,
+                    place="Парк",
+                    time="09:00",
+                    action="Прогулка",
+                    reward="Кино",
+                    time_to_complete=60,
+                    is_public=True,
+                )
+            ]
+        )
+
+        result = refresh_public_catalog()
+
+        self.assertEqual(result, {"refreshed": 2, "removed": 1})
+        self.assertEqual(
+            list(PublicHabit.objects.values_list("action", flat=True)),
+            ["Кофе", "Прогулка"],
+        )
+
+
+@override_settings(COMPLETIONS_REDIS_URL="")
+class HabitCompletionTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
-            username="task_user",
-            password="strongpass123",
-            telegram_chat_id=123456,
+            username="completion_user", password="strongpass123"
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time="08:00",
+            action="Зарядка",
+            reward="Чай",
+            time_to_complete=60,
         )
+        self.url = reverse("habits:habit-complete", args=[self.habit.pk])
+        self.client.force_authenticate(user=self.user)
 
-    @override_settings(
-        TELEGRAM_API_URL="https://test-api", TELEGRAM_BOT_TOKEN="TEST_TOKEN"
-    )
-    @patch("habits.tasks.requests.post")
-    @patch("django.utils.timezone.localtime")
-    def test_send_habit_reminders_sends_message_for_matching_habit(
-        self,
-        mock_localtime,
-        mock_post,
-    ):
-        now = timezone.now().replace(second=0, microsecond=0)
-        if timezone.is_naive(now):
-            now = timezone.make_aware(now, timezone.get_current_timezone())
-        mock_localtime.return_value = now
+    def buffered_entry(self, habit, completed_at):
+        return json.dumps(
+            {
+                "id": str(uuid.uuid4()),
+                "habit": habit.pk,
+                "user": habit.user_id,
+                "at": completed_at.isoformat(),
+            }
+        ).encode()
 
-        habit = Habit.objects.create(
+    def test_without_buffer_completion_is_written_immediately(self):
+        response = self.client.post(self.url, {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["habit"], self.habit.pk)
+        self.assertTrue(HabitCompletion.objects.filter(pk=response.data["id"]).exists())
+
+    def test_completion_time_is_validated(self):
+        future = timezone.now() + timedelta(hours=1)
+        too_old = timezone.now() - timedelta(days=30)
+
+        for completed_at in (future, too_old):
+            response = self.client.post(
+                self.url, {"completed_at": completed_at.isoformat()}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(HabitCompletion.objects.exists())
+
+    def test_cannot_complete_someone_elses_habit(self):
+        other = User.objects.create_user(username="other", password="strongpass123")
+        self.client.force_authenticate(user=other)
+
+        response = self.client.post(self.url, {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_buffered_completion_is_acknowledged_without_db_write(self):
+        client = MagicMock()
+
+        with patch("habits.completions.redis_client", return_value=client):
+            with self.assertNumQueries(1):  # только выборка привычки
+                response = self.client.post(self.url, {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        key, payload = client.rpush.call_args.args
+        self.assertEqual(key, BUFFER_KEY)
+        self.assertEqual(json.loads(payload)["id"], response.data["id"])
+        self.assertFalse(HabitCompletion.objects.exists())
+
+    def test_flush_writes_batch_once_and_trims_buffer(self):
+        now = timezone.now()
+        deleted = Habit.objects.create(
             user=self.user,
             place="Дом",
-            time=now.time(),
-            action="Выпить воду",
-            is_pleasant=False,
-            periodicity=1,
+            time="09:00",
+            action="Удалённая",
+            reward="Чай",
             time_to_complete=60,
-            is_public=False,
         )
+        batch = [
+            self.buffered_entry(self.habit, now),
+            self.buffered_entry(self.habit, now - timedelta(days=1)),
+            self.buffered_entry(deleted, now),
+        ]
+        deleted.delete()
+        client = MagicMock()
+        # Повтор той же пачки: задача упала между INSERT и LTRIM
+        client.lrange.side_effect = [batch, batch, []]
+
+        with patch("habits.completions.redis_client", return_value=client):
+            self.assertEqual(flush_completions(), 4)
+
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 2)
+        client.ltrim.assert_called_with(BUFFER_KEY, 3, -1)
+        client.lock.return_value.release.assert_called_once()
+
+    def test_flush_skips_malformed_entries_and_trims_them(self):
+        now = timezone.now()
+        batch = [
+            b"{not json",
+            self.buffered_entry(self.habit, now),
+            b'{"foreign": "value"}',
+            self.buffered_entry(self.habit, now - timedelta(days=1)),
+        ]
+        client = MagicMock()
+        client.lrange.side_effect = [batch, []]
+
+        with patch("habits.completions.redis_client", return_value=client):
+            with self.assertLogs("habits.completions", "WARNING") as logs:
+                self.assertEqual(flush_completions(), 2)
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 2)
+        client.ltrim.assert_called_once_with(BUFFER_KEY, 4, -1)
+
+    def test_flush_skips_when_another_worker_holds_lock(self):
+        client = MagicMock()
+        client.lock.return_value.acquire.return_value = False
+
+        with patch("habits.completions.redis_client", return_value=client):
+            self.assertEqual(flush_completions(), 0)
+
+        client.lrange.assert_not_called()
+
+    @skipUnless(connection.vendor == "postgresql", "секции есть только в PostgreSQL")
+    def test_completions_are_routed_to_monthly_partitions(self):
+        partitions = ensure_partitions()
+        self.client.post(self.url, {}, format="json")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM habits_habitcompletion"
+            )
+            (partition,) = cursor.fetchone()
 
-        send_habit_reminders()
+        self.assertEqual(partition, f"habits_habitcompletion_{timezone.now():%Y_%m}")
+        self.assertIn(partition, partitions)
 
-        self.assertTrue(mock_post.called)
-        args, kwargs = mock_post.call_args
-        url = args[0]
-        self.assertIn("https://test-api", url)
-        self.assertIn("botTEST_TOKEN/sendMessage", url)
-        self.assertEqual(kwargs["json"]["chat_id"], self.user.telegram_chat_id)
-        self.assertIn("Выпить воду", kwargs["json"]["text"])
-        self.assertIn(habit.place, kwargs["json"]["text"])
 
-    @override_settings(
-        TELEGRAM_API_URL="https://test-api", TELEGRAM_BOT_TOKEN="TEST_TOKEN"
-    )
-    @patch("habits.tasks.requests.post")
-    @patch("django.utils.timezone.localtime")
-    def test_send_habit_reminders_respects_periodicity(
-        self,
-        mock_localtime,
-        mock_post,
-    ):
-        now = timezone.now().replace(second=0, microsecond=0)
-        if timezone.is_naive(now):
-            now = timezone.make_aware(now, timezone.get_current_timezone())
-        mock_localtime.return_value = now
+def day_bits(*days):
+    return sum(1 << day for day in days)
 
-        habit = Habit.objects.create(
+
+class PeriodStatsTests(SimpleTestCase):
+    def test_daily_streak_ignores_unfinished_today(self):
+        # Дни 0..9, выполнено 2..8, сегодня (9) ещё нет
+        stats = period_stats(day_bits(0, *range(2, 9)), start=0, today=9, periodicity=1)
+
+        self.assertEqual(stats["streak"], 7)
+        self.assertEqual(stats["best_streak"], 7)
+        self.assertEqual((stats["completed_periods"], stats["due_periods"]), (8, 9))
+
+    def test_period_counts_any_completion_inside_it(self):
+        # Периоды по 3 дня от дня 1: [1,3] [4,6] [7,9] [10,12]; пропущен [4,6]
+        stats = period_stats(day_bits(2, 9, 10), start=1, today=11, periodicity=3)
+
+        self.assertEqual(stats["streak"], 2)
+        self.assertEqual(stats["best_streak"], 2)
+        self.assertEqual(stats["adherence"], 0.75)
+
+    def test_window_limits_adherence_but_not_streak(self):
+        stats = period_stats(
+            day_bits(*range(0, 100)), start=0, today=99, periodicity=1, window_start=70
+        )
+
+        self.assertEqual(stats["streak"], 100)
+        self.assertEqual((stats["completed_periods"], stats["due_periods"]), (30, 30))
+
+    def test_nothing_due_before_start(self):
+        stats = period_stats(0, start=10, today=5, periodicity=1)
+
+        self.assertEqual(stats["streak"], 0)
+        self.assertIsNone(stats["adherence"])
+
+
+@override_settings(COMPLETIONS_REDIS_URL="")
+class HabitStatsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="stats_user", password="strongpass123"
+        )
+        self.habit = Habit.objects.create(
             user=self.user,
             place="Дом",
-            time=now.time(),
-            action="Привычка с периодичностью 2 дня",
-            is_pleasant=False,
+            time="08:00",
+            action="Зарядка",
+            reward="Чай",
             periodicity=2,
             time_to_complete=60,
-            is_public=False,
         )
-        # сделаем так, чтобы с даты создания прошёл 1 день → напоминания быть не должно
-        habit.created_at = now - timedelta(days=1)
-        habit.save(update_fields=["created_at"])
+        self.now = timezone.now()
+        Habit.objects.filter(pk=self.habit.pk).update(
+            created_at=self.now - timedelta(days=6)
+        )
+        self.client.force_authenticate(user=self.user)
 
-        send_habit_reminders()
+    def complete(self, days_ago):
+        completed_at = self.now - timedelta(days=days_ago)
+        response = self.client.post(
+            reverse("habits:habit-complete", args=[self.habit.pk]),
+            {"completed_at": completed_at.isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-        mock_post.assert_not_called()
+    def test_stats_follow_completions_and_periodicity(self):
+        # Периоды по 2 дня: [6,5] [4,3] [2,1] [0] дней назад; пропущен [4,3]
+        for days_ago in (6, 5, 2, 0):
+            self.complete(days_ago)
+
+        with self.assertNumQueries(2):  # привычка + битовые карты
+            response = self.client.get(
+                reverse("habits:habit-stats", args=[self.habit.pk]), {"days": 7}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["streak"], 2)
+        self.assertEqual(response.data["best_streak"], 2)
+        self.assertEqual(response.data["completed_periods"], 3)
+        self.assertEqual(response.data["due_periods"], 4)
+        self.assertEqual(response.data["adherence"], 0.75)
+
+    def test_marking_is_idempotent(self):
+        completion = HabitCompletion(habit=self.habit, completed_at=self.now)
+
+        mark_completions([completion, completion])
+        mark_completions([completion])
+
+        activity = HabitActivity.objects.get(habit=self.habit)
+        day = timezone.localtime(self.now).timetuple().tm_yday - 1
+        self.assertEqual(int.from_bytes(activity.days, "little"), 1 << day)
+
+    def test_invalid_window_is_rejected(self):
+        response = self.client.get(
+            reverse("habits:habit-stats", args=[self.habit.pk]), {"days": 0}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    METRICS_REDIS_URL="",
+    METRICS_FLUSH_INTERVAL=0,
+)
+class HabitListCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        LOCAL.clear()
+        STORE.clear()
+        self.user = User.objects.create_user(
+            username="cached_user", password="strongpass123"
+        )
+        self.pleasant = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time="08:00",
+            action="Кофе",
+            is_pleasant=True,
+            time_to_complete=60,
+        )
+        self.url = reverse("habits:habit-list")
+        self.client.force_authenticate(user=self.user)
+
+    def actions(self, response):
+        return [habit["action"] for habit in response.data["results"]]
+
+    def test_repeated_list_is_served_from_cache(self):
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            local = self.client.get(self.url)
+        LOCAL.clear()
+        with self.assertNumQueries(0):
+            shared = self.client.get(self.url)
+
+        self.assertEqual(first.data, local.data)
+        self.assertEqual(first.data, shared.data)
+        metrics = render()
+        for tier, result, count in (
+            ("local", "hit", 1),
+            ("local", "miss", 2),
+            ("redis", "hit", 1),
+            ("redis", "miss", 1),
+        ):
+            self.assertIn(
+                f'habit_list_cache_requests_total{{result="{result}",tier="{tier}"}}'
+                f" {count}",
+                metrics,
+            )
+
+    def test_create_update_and_destroy_invalidate_list(self):
+        self.client.get(self.url)
+        response = self.client.post(
+            self.url,
+            {
+                "place": "Дом",
+                "time": "07:00",
+                "action": "Зарядка",
+                "reward": "Чай",
+                "time_to_complete": 60,
+            },
+            format="json",
+        )
+        self.assertEqual(self.actions(self.client.get(self.url)), ["Зарядка", "Кофе"])
+
+        detail = reverse("habits:habit-detail", args=[response.data["id"]])
+        self.client.patch(detail, {"action": "Растяжка"}, format="json")
+        self.assertEqual(self.actions(self.client.get(self.url)), ["Растяжка", "Кофе"])
+
+        self.client.delete(detail)
+        self.assertEqual(self.actions(self.client.get(self.url)), ["Кофе"])
+
+    def test_set_null_cascade_invalidates_other_users_list(self):
+        other = User.objects.create_user(username="other", password="strongpass123")
+        Habit.objects.create(
+            user=other,
+            place="Парк",
+            time="07:00",
+            action="Бег",
+            related_habit=self.pleasant,
+            time_to_complete=60,
+        )
+        self.client.force_authenticate(user=other)
+        before = self.client.get(self.url)
+        pleasant_id = self.pleasant.id
+
+        self.pleasant.delete()
+        after = self.client.get(self.url)
+
+        self.assertEqual(before.data["results"][0]["related_habit"], pleasant_id)
+        self.assertIsNone(after.data["results"][0]["related_habit"])
+
+    def test_local_tier_is_bounded_by_entries_and_bytes(self):
+        lru = LocalLRU(max_entries=2, max_bytes=100)
+
+        lru.set("a", "A", 10, timeout=60)
+        lru.set("b", "B", 10, timeout=60)
+        lru.get("a")
+        lru.set("c", "C", 10, timeout=60)
+        self.assertEqual(list(lru.entries), ["a", "c"])
+
+        lru.set("d", "D", 95, timeout=60)
+        self.assertEqual((list(lru.entries), lru.size), (["d"], 95))
+
+        lru.set("huge", "X", 101, timeout=60)
+        self.assertIsNone(lru.get("huge"))
+
+    def test_version_is_kept_in_process_while_bus_is_connected(self):
+        VERSIONS.clear()
+        self.addCleanup(VERSIONS.clear)
+        with patch("habits.cache.BUS.healthy", return_value=True):
+            self.client.get(self.url)
+            with patch("habits.cache.cache.get_or_set") as get_or_set:
+                self.client.get(self.url)
+            get_or_set.assert_not_called()
+
+            Habit.objects.create(
+                user=self.user,
+                place="Дом",
+                time="07:00",
+                action="Зарядка",
+                reward="Чай",
+                time_to_complete=60,
+            )
+            self.assertNotIn(str(self.user.pk), VERSIONS.entries)
+            self.assertEqual(
+                self.actions(self.client.get(self.url)), ["Зарядка", "Кофе"]
+            )
+
+
+class MessagePackTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        LOCAL.clear()
+        self.user = User.objects.create_user(
+            username="mobile_user", password="strongpass123"
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=dt_time(8, 30),
+            action="Кофе",
+            is_pleasant=True,
+            time_to_complete=60,
+        )
+        self.url = reverse("habits:habit-list")
+        self.client.force_authenticate(user=self.user)
+
+    def context(self, content_type=""):
+        request = SimpleNamespace(
+            accepted_renderer=MessagePackRenderer(),
+            content_type=content_type,
+            user=self.user,
+        )
+        return {"request": request}
+
+    def test_times_are_compact_only_for_msgpack(self):
+        compact = HabitSerializer(self.habit, context=self.context()).data
+        regular = HabitSerializer(self.habit).data
+
+        self.assertEqual(compact["time"], 8 * 60 + 30)
+        self.assertEqual(compact["created_at"], self.habit.created_at)
+        self.assertEqual(regular["time"], "08:30:00")
+        self.assertIsInstance(regular["created_at"], str)
+
+    def test_minute_of_day_is_accepted_from_msgpack_body(self):
+        data = {"place": "Парк", "time": 7 * 60 + 5, "action": "Бег", "reward": "Чай"}
+        data["time_to_complete"] = 60
+
+        compact = HabitSerializer(data=data, context=self.context(MSGPACK_MEDIA_TYPE))
+        self.assertTrue(compact.is_valid(), compact.errors)
+        self.assertEqual(compact.validated_data["time"], dt_time(7, 5))
+
+        for context in ({}, self.context(MSGPACK_MEDIA_TYPE)):
+            invalid = HabitSerializer(
+                data={**data, "time": 24 * 60 if context else 425}, context=context
+            )
+            self.assertFalse(invalid.is_valid())
+            self.assertIn("time", invalid.errors)
+
+    @skipUnless(msgpack, "пакет msgpack не установлен")
+    def test_list_and_create_in_msgpack(self):
+        response = self.client.get(self.url, HTTP_ACCEPT=MSGPACK_MEDIA_TYPE)
+        self.assertEqual(response["Content-Type"], MSGPACK_MEDIA_TYPE)
+        page = msgpack.unpackb(response.content, timestamp=3)
+        self.assertEqual(page["results"][0]["time"], 8 * 60 + 30)
+        self.assertEqual(page["results"][0]["created_at"], self.habit.created_at)
+
+        body = {
+            "place": "Парк",
+            "time": 7 * 60,
+            "action": "Бег",
+            "reward": "Чай",
+            "time_to_complete": 60,
+        }
+        response = self.client.post(
+            self.url,
+            msgpack.packb(body),
+            content_type=MSGPACK_MEDIA_TYPE,
+            HTTP_ACCEPT=MSGPACK_MEDIA_TYPE,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)["time"], 7 * 60)
+
+        # Кэш списка различает форматы
+        json_page = self.client.get(self.url).json()
+        self.assertEqual(
+            [habit["time"] for habit in json_page["results"]], ["07:00:00", "08:30:00"]
+        )
+
+
+@override_settings(BATCH_READ_CONCURRENCY=1)
+class BatchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        LOCAL.clear()
+        self.user = User.objects.create_user(
+            username="batch_user", password="strongpass123"
+        )
+        self.useful = Habit.objects.create(
+            user=self.user,
+            place="Парк",
+            time=dt_time(7, 0),
+            action="Бег",
+            reward="Чай",
+            time_to_complete=60,
+        )
+        self.url = reverse("habits:batch")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def batch(self, *requests, atomic=False):
+        return self.client.post(
+            self.url, {"requests": requests, "atomic": atomic}, format="json"
+        )
+
+    def test_dependent_requests_share_one_authentication(self):
+        pleasant = {
+            "place": "Дом",
+            "time": "08:00",
+            "action": "Кофе",
+            "is_pleasant": True,
+            "time_to_complete": 60,
+        }
+        with patch.object(
+            JWTAuthentication,
+            "authenticate",
+            autospec=True,
+            side_effect=JWTAuthentication.authenticate,
+        ) as authenticate:
+            response = self.batch(
+                {"method": "POST", "path": "/habits/", "body": pleasant},
+                {
+                    "method": "PATCH",
+                    "path": f"/habits/{self.useful.pk}/",
+                    "body": {"related_habit": "$0.id", "reward": None},
+                },
+                {"method": "GET", "path": "/habits/?page=1"},
+            )
+
+        self.assertEqual(authenticate.call_count, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        created, patched, listed = response.data["responses"]
+        self.assertEqual(
+            [created["status"], patched["status"], listed["status"]], [201, 200, 200]
+        )
+        self.assertEqual(patched["body"]["related_habit"], created["body"]["id"])
+        self.assertEqual(listed["body"]["count"], 2)
+        self.useful.refresh_from_db()
+        self.assertEqual(self.useful.related_habit_id, created["body"]["id"])
+
+    def test_atomic_batch_is_rolled_back_on_first_error(self):
+        response = self.batch(
+            {
+                "method": "PATCH",
+                "path": f"/habits/{self.useful.pk}/",
+                "body": {"action": "Пробежка"},
+            },
+            {"method": "PATCH", "path": "/habits/$0.id/", "body": {"periodicity": 9}},
+            {"method": "GET", "path": "/habits/"},
+            atomic=True,
+        )
+
+        self.assertFalse(response.data["committed"])
+        self.assertEqual(
+            [item["status"] for item in response.data["responses"]], [200, 400, 424]
+        )
+        self.useful.refresh_from_db()
+        self.assertEqual(self.useful.action, "Бег")
+
+    def test_items_outside_habit_routes_and_unresolved_references_fail(self):
+        response = self.batch(
+            {"method": "GET", "path": "/batch/"},
+            {"method": "POST", "path": "/register/", "body": {}},
+            {"method": "GET", "path": "/habits/999999/"},
+            {"method": "GET", "path": "/habits/$2.id/"},
+        )
+
+        self.assertEqual(
+            [item["status"] for item in response.data["responses"]],
+            [404, 404, 404, 424],
+        )
+
+    def test_batch_is_validated(self):
+        too_many = [{"method": "GET", "path": "/habits/"}] * 21
+        for body in (
+            {"requests": []},
+            {"requests": too_many},
+            {"requests": [{"method": "TRACE", "path": "/habits/"}]},
+            {"requests": [{"method": "GET", "path": "habits/"}]},
+        ):
+            response = self.client.post(self.url, body, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials()
+        response = self.batch({"method": "GET", "path": "/habits/"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BATCH_READ_CONCURRENCY=4, HABIT_LIST_CACHE_ENABLED=False)
+class ConcurrentBatchTests(TransactionTestCase):
+    def test_independent_reads_run_concurrently(self):
+        user = User.objects.create_user(username="batch_reader", password="pass12345")
+        habit = Habit.objects.create(
+            user=user,
+            place="Дом",
+            time=dt_time(8, 0),
+            action="Кофе",
+            is_pleasant=True,
+            is_public=True,
+            time_to_complete=60,
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        with patch(
+            "habits.batch.ThreadPoolExecutor", wraps=ThreadPoolExecutor
+        ) as executor:
+            response = client.post(
+                reverse("habits:batch"),
+                {
+                    "requests": [
+                        {"method": "GET", "path": "/habits/"},
+                        {"method": "GET", "path": f"/habits/{habit.pk}/"},
+                        {"method": "GET", "path": "/public-habits/"},
+                    ]
+                },
+                format="json",
+            )
+
+        executor.assert_called_once_with(max_workers=4)
+        self.assertEqual(
+            [item["status"] for item in response.data["responses"]], [200, 200, 200]
+        )
+        self.assertEqual(response.data["responses"][1]["body"]["action"], "Кофе")
+        self.assertEqual(response.data["responses"][2]["body"]["count"], 1)
+
+
+class HabitViewSetDirectCallTests(TestCase):
+    """
+    Небольшой прямой тест ViewSet через APIRequestFactory,
+    чтобы убедиться, что get_queryset фильтрует по пользователю.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="factory_user", password="strongpass123"
+        )
+        self.other_user = User.objects.create_user(
+            username="factory_other", password="strongpass123"
+        )
+        Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=timezone.now().time(),
+            action="Моя привычка",
+            is_pleasant=False,
+            periodicity=1,
+            time_to_complete=60,
+            is_public=False,
+        )
+        Habit.objects.create(
+            user=self.other_user,
+            place="Офис",
+            time=timezone.now().time(),
+            action="Чужая привычка",
+            is_pleasant=False,
+            periodicity=1,
+            time_to_complete=60,
+            is_public=False,
+        )
+        self.factory = APIRequestFactory()
+
+    def test_get_queryset_returns_only_user_habits(self):
+        view = HabitViewSet.as_view({"get": "list"})
+        request = self.factory.get("/habits/")
+        force_authenticate(request, user=self.user)
+        # list асинхронный: view — корутина
+        response = async_to_sync(view)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["results"][0]["action"], "Моя привычка")
+
+
+@override_settings(HABIT_LIST_CACHE_ENABLED=False)
+class AsyncHabitViewTests(TestCase):
+    """
+    list/retrieve и публичный список через ASGI (AsyncClient): JWT,
+    выборка и пагинация — асинхронный ORM.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="async_user", password="pass")
+        self.other_user = User.objects.create_user(username="async_other")
+        self.habits = [
+            Habit.objects.create(
+                user=self.user,
+                place="Дом",
+                time=dt_time(8, minute),
+                action=f"Привычка {minute}",
+                reward="Чай",
+                time_to_complete=60,
+                is_public=True,
+            )
+            for minute in range(3)
+        ]
+        self.foreign = Habit.objects.create(
+            user=self.other_user,
+            place="Офис",
+            time=dt_time(9, 0),
+            action="Чужая привычка",
+            reward="Чай",
+            time_to_complete=60,
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def test_read_views_are_coroutines(self):
+        self.assertTrue(iscoroutinefunction(HabitViewSet.as_view({"get": "list"})))
+        self.assertTrue(
+            iscoroutinefunction(resolve(reverse("habits:public-habits")).func)
+        )
+
+    async def test_list_is_paginated_and_scoped_to_user(self):
+        response = await self.async_client.get(
+            reverse("habits:habit-list"), {"page": 2}, headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual([item["action"] for item in data["results"]], ["Привычка 2"])
+        self.assertIsNone(data["next"])
+
+    async def test_invalid_page_is_404(self):
+        response = await self.async_client.get(
+            reverse("habits:habit-list"), {"page": 5}, headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_retrieve_own_and_foreign_habit(self):
+        own = await self.async_client.get(
+            reverse("habits:habit-detail", args=[self.habits[0].pk]),
+            headers=self.headers,
+        )
+        foreign = await self.async_client.get(
+            reverse("habits:habit-detail", args=[self.foreign.pk]),
+            headers=self.headers,
+        )
+
+        self.assertEqual(own.status_code, status.HTTP_200_OK)
+        self.assertEqual(own.json()["action"], "Привычка 0")
+        self.assertEqual(foreign.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_sync_actions_still_work_under_asgi(self):
+        response = await self.async_client.post(
+            reverse("habits:habit-list"),
+            {
+                "place": "Парк",
+                "time": "07:00",
+                "action": "Пробежка",
+                "reward": "Смузи",
+                "time_to_complete": 90,
+            },
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await Habit.objects.filter(action="Пробежка").aexists())
+
+    async def test_invalid_or_inactive_credentials_are_401(self):
+        anonymous = await self.async_client.get(reverse("habits:habit-list"))
+        self.user.is_active = False
+        await self.user.asave(update_fields=["is_active"])
+        inactive = await self.async_client.get(
+            reverse("habits:habit-list"), headers=self.headers
+        )
+
+        self.assertEqual(anonymous.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(inactive.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("Bearer", inactive["WWW-Authenticate"])
+
+    async def test_public_habits_list(self):
+        await sync_to_async(refresh_catalog)()
+
+        response = await self.async_client.get(
+            reverse("habits:public-habits"), headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+
+
+class SendHabitRemindersTaskTests(TestCase):
+    def setUp(self):
+        self.enterContext(eager_tasks())
+        self.user = User.objects.create_user(
+            username="task_user",
+            password="strongpass123",
+            telegram_chat_id=123456,
+        )
+
+    @override_settings(
+        TELEGRAM_API_URL="https://test-api", TELEGRAM_BOT_TOKEN="TEST_TOKEN"
+    )
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_send_habit_reminders_sends_message_for_matching_habit(
+        self,
+        mock_localtime,
+        mock_post,
+    ):
+        now = timezone.now().replace(second=0, microsecond=0)
+        if timezone.is_naive(now):
+            now = timezone.make_aware(now, timezone.get_current_timezone())
+        mock_localtime.return_value = now
+
+        habit = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=now.time(),
+            action="Выпить воду",
+            is_pleasant=False,
+            periodicity=1,
+            time_to_complete=60,
+            is_public=False,
+        )
+
+        send_habit_reminders()
+
+        self.assertTrue(mock_post.called)
+        args, kwargs = mock_post.call_args
+        url = args[0]
+        self.assertIn("https://test-api", url)
+        self.assertIn("botTEST_TOKEN/sendMessage", url)
+        self.assertEqual(kwargs["json"]["chat_id"], self.user.telegram_chat_id)
+        self.assertIn("Выпить воду", kwargs["json"]["text"])
+        self.assertIn(habit.place, kwargs["json"]["text"])
+
+    @override_settings(
+        TELEGRAM_API_URL="https://test-api", TELEGRAM_BOT_TOKEN="TEST_TOKEN"
+    )
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_send_habit_reminders_respects_periodicity(
+        self,
+        mock_localtime,
+        mock_post,
+    ):
+        now = timezone.now().replace(second=0, microsecond=0)
+        if timezone.is_naive(now):
+            now = timezone.make_aware(now, timezone.get_current_timezone())
+        mock_localtime.return_value = now
+
+        habit = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=now.time(),
+            action="Привычка с периодичностью 2 дня",
+            is_pleasant=False,
+            periodicity=2,
+            time_to_complete=60,
+            is_public=False,
+        )
+        # сделаем так, чтобы с даты создания прошёл 1 день → напоминания быть не должно
+        habit.created_at = now - timedelta(days=1)
+        habit.save(update_fields=["created_at"])
+
+        send_habit_reminders()
+
+        mock_post.assert_not_called()
+
+    @override_settings(
+        METRICS_REDIS_URL="", METRICS_FLUSH_INTERVAL=0, REMINDER_DELIVERY_MAX_RETRIES=0
+    )
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_send_habit_reminders_records_tick_metrics(
+        self,
+        mock_localtime,
+        mock_post,
+    ):
+        STORE.clear()
+        now = timezone.now().replace(second=0, microsecond=0)
+        mock_localtime.return_value = now
+        for periodicity in (1, 1, 2):
+            habit = Habit.objects.create(
+                user=self.user,
+                place="Дом",
+                time=now.time(),
+                action="Привычка",
+                periodicity=periodicity,
+                reward="Чай",
+                time_to_complete=60,
+            )
+        habit.created_at = now - timedelta(days=1)
+        habit.save(update_fields=["created_at"])
+        mock_post.side_effect = [MagicMock(ok=True), requests.ConnectionError()]
+
+        send_habit_reminders()
+
+        metrics = render()
+        for result, count in (("queued", 2), ("skipped", 1)):
+            self.assertIn(
+                f'habit_reminders_last_tick{{result="{result}"}} {count}', metrics
+            )
+        for result, count in (("sent", 1), ("failed", 1), ("queued", 2)):
+            self.assertIn(
+                f'habit_reminders_total{{result="{result}"}} {count}', metrics
+            )
+        self.assertIn(
+            'telegram_api_duration_seconds_count{method="sendMessage"} 2', metrics
+        )
+
+    @override_settings(METRICS_REDIS_URL="", METRICS_FLUSH_INTERVAL=0)
+    @patch("habits.tasks.requests.post")
+    def test_deliver_reminder_retries_transient_errors(self, mock_post):
+        STORE.clear()
+        mock_post.side_effect = [
+            requests.ConnectionError(),
+            MagicMock(ok=False, status_code=502),
+            MagicMock(ok=True),
+        ]
+
+        deliver_reminder.delay(123456, "Напоминание")
+
+        self.assertEqual(mock_post.call_count, 3)
+        metrics = render()
+        self.assertIn('habit_reminders_total{result="retried"} 2', metrics)
+        self.assertIn('habit_reminders_total{result="sent"} 1', metrics)
+
+    @override_settings(
+        REMINDER_RETRY_QUEUE="reminders.retries", REMINDER_DELIVERY_RETRY_DELAY=30
+    )
+    @patch("habits.tasks.requests.post")
+    def test_deliver_reminder_retry_goes_to_retry_queue(self, mock_post):
+        throttled = MagicMock(ok=False, status_code=429)
+        throttled.json.return_value = {"parameters": {"retry_after": 7}}
+        mock_post.side_effect = [throttled, MagicMock(ok=False, status_code=503)]
+
+        with patch.object(deliver_reminder, "retry", side_effect=RuntimeError) as retry:
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    deliver_reminder.run(123456, "Напоминание")
+
+        first, second = retry.call_args_list
+        self.assertEqual(first.kwargs["countdown"], 7)
+        self.assertEqual(first.kwargs["queue"], "reminders.retries")
+        self.assertEqual(second.kwargs["countdown"], 30)
+
+    @override_settings(METRICS_REDIS_URL="", METRICS_FLUSH_INTERVAL=0)
+    @patch("habits.tasks.requests.post")
+    def test_deliver_reminder_does_not_retry_client_errors(self, mock_post):
+        STORE.clear()
+        mock_post.return_value = MagicMock(ok=False, status_code=403)
+
+        deliver_reminder.delay(123456, "Напоминание")
+
+        mock_post.assert_called_once()
+        self.assertIn('habit_reminders_total{result="failed"} 1', render())
+
+    @patch("config.beat.redis_client")
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_send_habit_reminders_runs_once_per_minute(
+        self, mock_localtime, mock_post, mock_redis
+    ):
+        now = timezone.now().replace(second=0, microsecond=0)
+        mock_localtime.return_value = now
+        Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=now.time(),
+            action="Привычка",
+            reward="Чай",
+            time_to_complete=60,
+        )
+        mock_redis.return_value.set.side_effect = [True, None]
+
+        send_habit_reminders()
+        send_habit_reminders()
+
+        mock_post.assert_called_once()
+        key = mock_redis.return_value.set.call_args.args[0]
+        self.assertEqual(key, f"beat:tick:send_habit_reminders:{now:%Y-%m-%dT%H:%M}")
+
+    @override_settings(REMINDER_STREAM_ENABLED=True)
+    @patch("habits.reminders.redis_client")
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_send_habit_reminders_publishes_to_stream(
+        self, mock_localtime, mock_post, mock_redis
+    ):
+        now = timezone.now().replace(second=0, microsecond=0)
+        mock_localtime.return_value = now
+        web_user = User.objects.create_user(username="web_user")
+        for user in (self.user, web_user):
+            Habit.objects.create(
+                user=user,
+                place="Дом",
+                time=now.time(),
+                action="Привычка",
+                reward="Чай",
+                time_to_complete=60,
+            )
+        pipe = mock_redis.return_value.pipeline.return_value
+        pipe.execute.return_value = [1, 0]
+
+        send_habit_reminders()
+
+        channels = sorted(call.args[0] for call in pipe.publish.call_args_list)
+        self.assertEqual(
+            channels, [f"reminders:{self.user.pk}", f"reminders:{web_user.pk}"]
+        )
+        event = json.loads(pipe.publish.call_args_list[0].args[1])
+        self.assertEqual(event["time"], f"{now:%H:%M}")
+        # Telegram — только пользователю с chat_id
+        mock_post.assert_called_once()
+
+    @override_settings(REMINDER_STREAM_ENABLED=True)
+    @patch("habits.reminders.redis_client")
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_stream_unavailable_does_not_block_telegram(
+        self, mock_localtime, mock_post, mock_redis
+    ):
+        now = timezone.now().replace(second=0, microsecond=0)
+        mock_localtime.return_value = now
+        Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=now.time(),
+            action="Привычка",
+            reward="Чай",
+            time_to_complete=60,
+        )
+        pipe = mock_redis.return_value.pipeline.return_value
+        pipe.execute.side_effect = redis.ConnectionError()
+
+        with self.assertLogs("habits.reminders", "WARNING"):
+            send_habit_reminders()
+
+        mock_post.assert_called_once()
+
+
+class ReminderHubTests(SimpleTestCase):
+    @override_settings(REMINDER_STREAM_QUEUE_SIZE=2)
+    def test_slow_client_drops_oldest_events(self):
+        async def scenario():
+            hub = ReminderHub()
+            with patch.object(hub, "start"):
+                queue = await hub.subscribe(7)
+                other = await hub.subscribe(8)
+            for n in range(3):
+                hub.deliver(b"reminders:7", json.dumps({"id": n}))
+            hub.deliver("reminders:bogus", "{}")
+            self.assertEqual(len(hub), 2)
+            await hub.unsubscribe(7, queue)
+            self.assertEqual(len(hub), 1)
+            self.assertTrue(other.empty())
+            return [queue.get_nowait()["id"] for _ in range(queue.qsize())]
+
+        self.assertEqual(async_to_sync(scenario)(), [1, 2])
+
+    def test_sse_event_format(self):
+        chunk = sse_event({"id": "5:2026-01-01T08:00", "action": "Вода"})
+
+        self.assertTrue(chunk.startswith(b"id: 5:2026-01-01T08:00\nevent: reminder\n"))
+        self.assertTrue(chunk.endswith(b"\n\n"))
+        self.assertIn("Вода".encode(), chunk)
+
+
+@override_settings(REMINDER_STREAM_HEARTBEAT=0.05, REMINDER_STREAM_MAX_AGE=60)
+@patch("habits.streams.close_old_connections")
+@patch.object(ReminderHub, "start")
+class ReminderStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="stream_user")
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def scope(self, headers=(), query_string=b"", method="GET"):
+        return {
+            "type": "http",
+            "method": method,
+            "path": STREAM_PATH,
+            "query_string": query_string,
+            "headers": [(b"origin", b"http://localhost:3000"), *headers],
+        }
+
+    async def request(self, scope, until=lambda messages: True):
+        """
+        Вызывает reminder_stream; клиент отключается, когда until(сообщения).
+        """
+        messages = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            if not messages:
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if until(messages):
+                disconnect.set()
+
+        await asyncio.wait_for(reminder_stream(scope, receive, send), 5)
+        return messages
+
+    def body(self, messages):
+        return b"".join(m.get("body", b"") for m in messages[1:])
+
+    async def test_requires_token(self, *mocks):
+        messages = await self.request(self.scope())
+
+        self.assertEqual(messages[0]["status"], 401)
+
+    async def test_streams_reminders_and_heartbeats(self, *mocks):
+        def until(messages):
+            return b": heartbeat" in self.body(messages)
+
+        async def publish():
+            hub = reminder_hub()
+            while not len(hub):
+                await asyncio.sleep(0.01)
+            hub.deliver(f"reminders:{self.user.pk}", json.dumps({"id": "1:x"}))
+
+        headers = [(b"authorization", f"Bearer {self.token}".encode())]
+        messages, _ = await asyncio.gather(
+            self.request(self.scope(headers), until), publish()
+        )
+
+        self.assertEqual(messages[0]["status"], 200)
+        headers = dict(messages[0]["headers"])
+        self.assertEqual(headers[b"content-type"], b"text/event-stream; charset=utf-8")
+        self.assertEqual(
+            headers[b"access-control-allow-origin"], b"http://localhost:3000"
+        )
+        body = self.body(messages)
+        self.assertTrue(body.startswith(b"retry: "))
+        self.assertIn(b"id: 1:x\nevent: reminder\n", body)
+        # Отключившийся клиент отписан
+        self.assertEqual(len(reminder_hub()), 0)
+
+    async def test_query_string_token_and_max_age(self, *mocks):
+        query = f"access_token={self.token}".encode()
+        with self.settings(REMINDER_STREAM_MAX_AGE=0.1):
+            messages = await self.request(
+                self.scope(query_string=query), until=lambda messages: False
+            )
+
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertFalse(messages[-1].get("more_body"))
+
+    @override_settings(REMINDER_STREAM_MAX_CONNECTIONS=0)
+    async def test_rejects_over_node_limit(self, *mocks):
+        headers = [(b"authorization", f"Bearer {self.token}".encode())]
+        messages = await self.request(self.scope(headers))
+
+        self.assertEqual(messages[0]["status"], 503)
+        self.assertIn((b"retry-after", b"5"), messages[0]["headers"])
+
+
+class NDJSONCopyStreamTests(TestCase):
+    def test_converts_ndjson_to_csv_rows(self):
+        source = StringIO(
+            '{"external_key": "a", "username": "u", "place": "Дом, кухня", '
+            '"time": "08:00", "action": "Чай", "is_pleasant": true, '
+            '"time_to_complete": 30}\n'
+            "\n"
+            '{"external_key": "b", "related_key": "a", "periodicity": 2}\n'
+        )
+
+        data = NDJSONCopyStream(source).read()
+
+        rows = list(csv.reader(StringIO(data)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+            rows[0],
+            ["a", "u", "Дом, кухня", "08:00", "Чай", "true", "", "", "", "30", ""],
+        )
+        self.assertEqual(rows[1][IMPORT_COLUMNS.index("related_key")], "a")
+
+    def test_read_in_small_chunks_returns_whole_stream(self):
+        lines = "".join(
+            json.dumps({"external_key": str(i), "action": "x"}) + "\n"
+            for i in range(50)
+        )
+        stream = NDJSONCopyStream(StringIO(lines), chunk_lines=7)
+
+        chunks = []
+        while chunk := stream.read(13):
+            chunks.append(chunk)
+
+        self.assertEqual(len(list(csv.reader(StringIO("".join(chunks))))), 50)
+
+    def test_malformed_line_is_reported_with_its_number(self):
+        source = StringIO('{"external_key": "a"}\n\n{"external_key": \n')
+
+        with self.assertRaisesMessage(CommandError, "строка 3"):
+            NDJSONCopyStream(source).read()
+
+        with self.assertRaisesMessage(CommandError, "строка 1: ожидается объект"):
+            NDJSONCopyStream(StringIO("[1, 2]\n")).read()
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY есть только в PostgreSQL")
+class ImportHabitsCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="importer", password="pass12345")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command("import_habits", path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_resolves_related_habit_by_external_key(self):
+        path = self.write_file(
+            "habits.csv",
+            "external_key,username,place,time,action,is_pleasant,related_key,"
+            "periodicity,reward,time_to_complete,is_public\n"
+            "useful,importer,Дом,07:30,Зарядка,false,reward,1,,60,true\n"
+            "reward,importer,Дом,08:00,Кофе,true,,,,30,\n",
+        )
+
+        out, _ = self.run_import(path, "--chunk-size", "1")
+
+        self.assertIn("Импортировано: 2, отклонено: 0.", out)
+        useful = Habit.objects.get(action="Зарядка")
+        self.assertEqual(useful.user, self.user)
+        self.assertTrue(useful.is_public)
+        self.assertEqual(useful.related_habit.action, "Кофе")
+        self.assertTrue(useful.related_habit.is_pleasant)
+
+    def test_interrupted_merge_leaves_no_rows_and_can_be_rerun(self):
+        path = self.write_file(
+            "habits.csv",
+            "external_key,username,place,time,action,is_pleasant,time_to_complete\n"
+            "a,importer,Дом,08:00,Кофе,true,30\n"
+            "b,importer,Дом,09:00,Чай,true,30\n",
+        )
+
+        class InterruptedOutput(StringIO):
+            # Процесс «убивают» сразу после переноса первой пачки
+            def write(self, text):
+                if text.startswith("  1/2"):
+                    raise RuntimeError("killed")
+                return super().write(text)
+
+        with self.assertRaisesMessage(RuntimeError, "killed"):
+            call_command(
+                "import_habits",
+                path,
+                "--chunk-size",
+                "1",
+                stdout=InterruptedOutput(),
+                stderr=StringIO(),
+            )
+        self.assertFalse(Habit.objects.exists())
+
+        out, _ = self.run_import(path, "--chunk-size", "1")
+
+        self.assertIn("Импортировано: 2, отклонено: 0.", out)
+        self.assertEqual(Habit.objects.count(), 2)
+
+    def test_malformed_ndjson_line_fails_with_command_error(self):
+        path = self.write_file(
+            "habits.ndjson", '{"external_key": "a"}\n{"external_key": "b",\n'
+        )
+
+        with self.assertRaisesMessage(CommandError, "NDJSON, строка 2"):
+            self.run_import(path, "--username", "importer")
+
+    @override_settings(DB_POOL_MODE="pgbouncer")
+    def test_refuses_to_run_through_pgbouncer(self):
+        path = self.write_file("habits.csv", "external_key,username\n")
+
+        with self.assertRaisesMessage(CommandError, "сессионного соединения"):
+            self.run_import(path)
+
+    def test_invalid_rows_are_rejected_with_field_messages(self):
+        path = self.write_file(
+            "habits.ndjson",
+            "\n".join(
+                json.dumps(row)
+                for row in [
+                    {
+                        "external_key": "ok",
+                        "place": "Дом",
+                        "time": "07:00",
+                        "action": "Вода",
+                        "time_to_complete": 10,
+                    },
+                    {
+                        "external_key": "slow",
+                        "place": "Дом",
+                        "time": "07:00",
+                        "action": "Долго",
+                        "time_to_complete": 500,
+                    },
+                    {
+                        "external_key": "rare",
+                        "place": "Дом",
+                        "time": "07:00",
+                        "action": "Редко",
+                        "periodicity": 8,
+                        "time_to_complete": 10,
+                    },
+                    {
+                        "external_key": "bad_link",
+                        "place": "Дом",
+                        "time": "07:00",
+                        "action": "Ссылка",
+                        "related_key": "ok",
+                        "time_to_complete": 10,
+                    },
+                    {
+                        "external_key": "both",
+                        "place": "Дом",
+                        "time": "07:00",
+                        "action": "Оба",
+                        "related_key": "ok",
+                        "reward": "Торт",
+                        "time_to_complete": 10,
+                    },
+                ]
+            ),
+        )
+
+        out, err = self.run_import(path, "--username", "importer")
+
+        self.assertIn("Импортировано: 1, отклонено: 4.", out)
+        self.assertEqual(list(Habit.objects.values_list("action", flat=True)), ["Вода"])
+        self.assertIn(
+            "Время на выполнение привычки не может превышать 120 секунд.", err
+        )
+        self.assertIn("Нельзя выполнять привычку реже, чем 1 раз в 7 дней.", err)
+        self.assertIn(
+            "В связанные привычки могут попадать только приятные привычки.", err
+        )
+        self.assertIn("Нельзя одновременно указывать вознаграждение", err)
+
+    def test_unknown_user_is_rejected(self):
+        path = self.write_file(
+            "habits.csv",
+            "external_key,username,place,time,action,time_to_complete\n"
+            "x,nobody,Дом,07:00,Вода,10\n",
+        )
+
+        _, err = self.run_import(path)
+
+        self.assertIn("Пользователь не найден.", err)
+        self.assertFalse(Habit.objects.exists())
+
+
+class GenerateHabitsCommandTests(TestCase):
+    def generate(self, prefix, **options):
+        params = {
+            "users": 30,
+            "habits_per_user": 4,
+            "seed": 7,
+            "prefix": prefix,
+            "batch_size": 40,
+            "stdout": StringIO(),
+        }
+        params.update(options)
+        call_command("generate_habits", **params)
+        return Habit.objects.filter(user__username__startswith=prefix).order_by("id")
+
+    def snapshot(self, habits):
+        return [
+            (
+                habit.user.username.split("_", 1)[1],
+                habit.place,
+                habit.time,
+                habit.action,
+                habit.is_pleasant,
+                habit.related_habit is not None,
+                habit.periodicity,
+                habit.reward,
+                habit.time_to_complete,
+                habit.is_public,
+            )
+            for habit in habits.select_related("user", "related_habit")
+        ]
+
+    def test_same_seed_generates_same_data(self):
+        first = self.generate("first_")
+        second = self.generate("second_", chat_id_offset=1000)
+
+        self.assertTrue(first.exists())
+        self.assertEqual(self.snapshot(first), self.snapshot(second))
+
+    def test_generated_habits_satisfy_business_rules(self):
+        habits = self.generate("rules_", related_share=0.6, reward_share=0.4)
+
+        for habit in habits.select_related("related_habit"):
+            if habit.related_habit is not None:
+                self.assertTrue(habit.related_habit.is_pleasant)
+                self.assertEqual(habit.related_habit.user_id, habit.user_id)
+                self.assertIsNone(habit.reward)
+            if habit.is_pleasant:
+                self.assertIsNone(habit.reward)
+                self.assertIsNone(habit.related_habit)
+            self.assertTrue(1 <= habit.periodicity <= 7)
+            self.assertLessEqual(habit.time_to_complete, 120)
+
+    def test_distribution_options_are_applied(self):
+        habits = self.generate(
+            "dist_",
+            users=50,
+            periodicity="7=1",
+            public_share=0,
+            pleasant_share=0,
+            telegram_share=1,
+            time_clusters="09:00=1",
+            time_spread=0,
+            uniform_time_share=0,
+        )
+
+        self.assertEqual(User.objects.filter(username__startswith="dist_").count(), 50)
+        self.assertFalse(
+            User.objects.filter(
+                username__startswith="dist_", telegram_chat_id__isnull=True
+            ).exists()
+        )
+        self.assertEqual(set(habits.values_list("periodicity", flat=True)), {7})
+        self.assertEqual(set(habits.values_list("time", flat=True)), {dt_time(9, 0)})
+        self.assertFalse(
+            habits.filter(Q(is_public=True) | Q(is_pleasant=True)).exists()
+        )
+
+    def test_created_at_is_spread_over_past_days(self):
+        habits = self.generate("created_", created_days=30)
+
+        dates = {habit.created_at.date() for habit in habits}
+        self.assertGreater(len(dates), 1)
+        self.assertLessEqual(
+            timezone.now() - min(habit.created_at for habit in habits),
+            timedelta(days=31),
+        )
+
+
+class HabitQueryBudgetTests(APITestCase):
+    """
+    Бюджеты на число SQL-запросов для эндпоинтов привычек и задачи
+    напоминаний. Число запросов не должно расти вместе с числом строк.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="budget_user", password="strongpass123"
+        )
+        self.pleasant = Habit.objects.create(
+            user=self.user,
+            place="Дом",
+            time=timezone.now().time(),
+            action="Кофе",
+            is_pleasant=True,
+            periodicity=1,
+            time_to_complete=60,
+            is_public=True,
+        )
+        for i in range(5):
+            Habit.objects.create(
+                user=self.user,
+                place=f"Место {i}",
+                time=timezone.now().time(),
+                action=f"Привычка {i}",
+                related_habit=self.pleasant,
+                periodicity=1,
+                time_to_complete=60,
+                is_public=True,
+            )
+        self.client.force_authenticate(user=self.user)
+        self.detail_url = reverse("habits:habit-detail", args=[self.pleasant.id])
+
+    def test_list_queries(self):
+        # COUNT для пагинации + страница
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("habits:habit-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_public_list_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("habits:public-habits"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_does_not_load_owner(self):
+        # Только выборка привычки: IsOwnerOrReadOnly сравнивает user_id
+        with self.assertNumQueries(1):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_create_queries(self):
+        payload = {
+            "place": "Дом",
+            "time": "08:00:00",
+            "action": "Зарядка",
+            "related_habit": self.pleasant.id,
+            "periodicity": 1,
+            "time_to_complete": 60,
+        }
+        # related_habit + SAVEPOINT/INSERT/RELEASE
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                reverse("habits:habit-list"), payload, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_partial_update_queries(self):
+        # привычка + SAVEPOINT/UPDATE/upsert в каталог/RELEASE
+        with self.assertNumQueries(5):
+            response = self.client.patch(
+                self.detail_url, {"action": "Чай"}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(
+        TELEGRAM_API_URL="https://test-api", TELEGRAM_BOT_TOKEN="TEST_TOKEN"
+    )
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_send_habit_reminders_uses_single_query(self, mock_localtime, mock_post):
+        now = timezone.now().replace(second=0, microsecond=0)
+        mock_localtime.return_value = now
+        Habit.objects.update(time=now.time())
+        self.user.telegram_chat_id = 42
+        self.user.save(update_fields=["telegram_chat_id"])
+        for i in range(3):
+            other = User.objects.create_user(
+                username=f"reminded_{i}",
+                password="strongpass123",
+                telegram_chat_id=100 + i,
+            )
+            Habit.objects.create(
+                user=other,
+                place="Дом",
+                time=now.time(),
+                action="Вода",
+                periodicity=1,
+                time_to_complete=60,
+            )
+
+        with eager_tasks(), self.assertNumQueries(1):
+            send_habit_reminders()
+
+        self.assertEqual(mock_post.call_count, 9)
+
+
+class BenchmarkEndpointsCommandTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.baseline = os.path.join(self.tmpdir.name, "baseline.json")
+
+    def run_benchmark(self, *args):
+        call_command(
+            "benchmark_endpoints",
+            "--baseline",
+            self.baseline,
+            "--iterations",
+            "1",
+            *args,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+    def test_passes_against_own_baseline_and_rolls_back(self):
+        self.run_benchmark("--update-baseline")
+        self.run_benchmark("--tolerance", "100")
+
+        self.assertFalse(User.objects.filter(username="benchmark_user").exists())
+        with open(self.baseline) as f:
+            baseline = json.load(f)
+        self.assertEqual(baseline["habits-retrieve"]["queries"], 1)
+        self.assertEqual(baseline["send-habit-reminders"]["queries"], 1)
+
+    def test_fails_when_query_budget_is_exceeded(self):
+        self.run_benchmark("--update-baseline")
+        with open(self.baseline) as f:
+            baseline = json.load(f)
+        baseline["habits-list"]["queries"] = 1
+        with open(self.baseline, "w") as f:
+            json.dump(baseline, f)
+
+        with self.assertRaisesMessage(CommandError, "Обнаружено регрессий: 1"):
+            self.run_benchmark("--tolerance", "100")
+
+    def test_seq_scan_detection(self):
+        plan = {
+            "Plan": {
+                "Node Type": "Hash Join",
+                "Plans": [
+                    {
+                        "Node Type": "Seq Scan",
+                        "Relation Name": "habits_habit",
+                        "Actual Rows": 10,
+                        "Rows Removed by Filter": 5000,
+                    },
+                    {
+                        "Node Type": "Seq Scan",
+                        "Relation Name": "users_user",
+                        "Actual Rows": 3,
+                    },
+                ],
+            }
+        }
+
+        self.assertEqual(seq_scans(plan, min_rows=1000), {"habits_habit"})
+
+
+class ShardPlacementTests(SimpleTestCase):
+    @override_settings(HABIT_SHARDS=["default", "habits_shard_1"])
+    def test_placement_is_stable_and_spread(self):
+        shards = [placement(user_id) for user_id in range(1000)]
+
+        self.assertEqual(shards, [placement(user_id) for user_id in range(1000)])
+        self.assertGreater(shards.count("default"), 400)
+        self.assertGreater(shards.count("habits_shard_1"), 400)
+
+    def test_adding_shard_moves_only_users_to_the_new_shard(self):
+        with self.settings(HABIT_SHARDS=["default", "habits_shard_1"]):
+            before = [placement(user_id) for user_id in range(1000)]
+        with self.settings(
+            HABIT_SHARDS=["default", "habits_shard_1", "habits_shard_2"]
+        ):
+            after = [placement(user_id) for user_id in range(1000)]
+
+        moved = [new for old, new in zip(before, after) if old != new]
+        self.assertTrue(moved)
+        self.assertEqual(set(moved), {"habits_shard_2"})
+        self.assertLess(len(moved), 450)
+
+    def test_pinned_shard_wins_over_hash(self):
+        user = User(pk=1, habit_shard="habits_shard_1")
+
+        with self.settings(HABIT_SHARDS=["default", "habits_shard_1"]):
+            self.assertEqual(shard_for_user(user), "habits_shard_1")
+        self.assertIsNone(shard_for_user(user))
+
+
+@override_settings(HABIT_SHARDS=["default"])
+class SingleShardTests(APITestCase):
+    """
+    Шардированные пути (using(шард), fan-out, слияние страниц) на одной БД.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="sharded", password="pass12345", telegram_chat_id=555
+        )
+        self.enterContext(eager_tasks())
+        self.client.force_authenticate(user=self.user)
+
+    def create_habit(self, **kwargs):
+        data = {
+            "place": "Дом",
+            "time": "08:00",
+            "action": "Зарядка",
+            "reward": "Чай",
+            "time_to_complete": 60,
+            "is_public": True,
+        }
+        data.update(kwargs)
+        response = self.client.post(reverse("habits:habit-list"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data["id"]
+
+    def test_crud_and_public_list_through_shard_paths(self):
+        for hour in (9, 7, 8):
+            self.create_habit(time=f"{hour:02d}:00", action=f"Привычка {hour}")
+        Habit.objects.create(
+            user=User.objects.create_user(username="other", password="pass12345"),
+            place="Парк",
+            time="07:30",
+            action="Чужая",
+            reward="Чай",
+            time_to_complete=60,
+            is_public=True,
+        )
+
+        own = self.client.get(reverse("habits:habit-list"))
+        public = self.client.get(reverse("habits:public-habits"), {"page": 2})
+
+        self.assertEqual(own.data["count"], 3)
+        self.assertEqual(public.data["count"], 4)
+        self.assertEqual(
+            [habit["action"] for habit in public.data["results"]],
+            ["Привычка 8", "Привычка 9"],
+        )
+
+    def test_related_habit_is_looked_up_in_users_shard(self):
+        pleasant = self.create_habit(is_pleasant=True, reward=None, is_public=False)
+
+        self.create_habit(reward=None, related_habit=pleasant)
+
+        self.assertEqual(Habit.objects.filter(related_habit_id=pleasant).count(), 1)
+
+    @patch("habits.tasks.requests.post")
+    @patch("django.utils.timezone.localtime")
+    def test_reminders_fan_out_and_load_users_from_default(
+        self, mock_localtime, mock_post
+    ):
+        now = timezone.now().replace(second=0, microsecond=0)
+        mock_localtime.return_value = now
+        self.create_habit(time=now.strftime("%H:%M"))
+
+        send_habit_reminders()
+
+        self.assertEqual(mock_post.call_args.kwargs["json"]["chat_id"], 555)
+
+
+HAS_SECOND_SHARD = "habits_shard_1" in connections.databases
+
+
+@skipUnless(
+    connection.vendor == "postgresql" and HAS_SECOND_SHARD,
+    "нужна вторая PostgreSQL БД с алиасом habits_shard_1",
+)
+@override_settings(HABIT_SHARDS=["default", "habits_shard_1"])
+class RebalanceHabitShardsCommandTests(APITestCase):
+    databases = {"default", "habits_shard_1"} if HAS_SECOND_SHARD else {"default"}
+
+    def setUp(self):
+        # Пользователь с привычками из эпохи до шардирования — в default
+        with self.settings(HABIT_SHARDS=[]):
+            self.user = User.objects.create_user(username="mover", password="pass12345")
+            pleasant = Habit.objects.create(
+                user=self.user,
+                place="Дом",
+                time="08:00",
+                action="Кофе",
+                is_pleasant=True,
+                time_to_complete=30,
+            )
+            self.useful = Habit.objects.create(
+                user=self.user,
+                place="Дом",
+                time="07:00",
+                action="Зарядка",
+                related_habit=pleasant,
+                time_to_complete=60,
+            )
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command("rebalance_habit_shards", *args, stdout=out)
+        return out.getvalue()
+
+    def test_move_user_preserves_ids_and_relations(self):
+        created_at = self.useful.created_at
+
+        self.run_command("--user", str(self.user.pk), "--to", "habits_shard_1")
+
+        self.assertFalse(Habit.objects.using("default").filter(user=self.user).exists())
+        moved = Habit.objects.using("habits_shard_1").get(pk=self.useful.pk)
+        self.assertEqual(moved.related_habit.action, "Кофе")
+        self.assertEqual(moved.created_at, created_at)
+
+        self.user.refresh_from_db()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("habits:habit-list"))
+        self.assertEqual(response.data["count"], 2)
+
+    def test_new_habits_get_ids_unique_across_shards(self):
+        self.run_command("--prepare")
+        other = User.objects.create_user(username="fresh", password="pass12345")
+
+        ids = {
+            alias: Habit.objects.using(alias)
+            .create(
+                user=other,
+                place="Дом",
+                time="09:00",
+                action="Вода",
+                reward="Чай",
+                time_to_complete=10,
+            )
+            .pk
+            for alias in ("default", "habits_shard_1")
+        }
+
+        self.assertEqual(ids["default"] % SHARD_ID_STRIDE, 1)
+        self.assertEqual(ids["habits_shard_1"] % SHARD_ID_STRIDE, 2)
+        self.assertGreater(min(ids.values()), self.useful.pk)
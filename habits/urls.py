@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .apps import HabitsConfig
-from .views import HabitViewSet, PublicHabitListView
+from .views import BatchView, HabitViewSet, PublicHabitListView
 
 app_name = HabitsConfig.name
 
@@ -18,4 +18,6 @@ urlpatterns = [
         PublicHabitListView.as_view(),
         name="public-habits",
     ),
+    # Пакет подзапросов к маршрутам выше
+    path("batch/", BatchView.as_view(), name="batch"),
 ]
@@ -1,9 +1,45 @@
 from typing import Optional
 
+from django.db import IntegrityError
 from rest_framework.serializers import ValidationError
 
 from .models import Habit
 
+# Тексты ошибок общие для Python-валидатора и ограничений в БД
+REWARD_WITH_RELATED_HABIT = (
+    "Нельзя одновременно указывать вознаграждение и связанную привычку."
+)
+RELATED_HABIT_WITH_REWARD = (
+    "Нельзя одновременно указывать связанную привычку и вознаграждение."
+)
+TIME_TO_COMPLETE_TOO_LONG = (
+    "Время на выполнение привычки не может превышать 120 секунд."
+)
+RELATED_HABIT_NOT_PLEASANT = (
+    "В связанные привычки могут попадать только приятные привычки."
+)
+PLEASANT_HABIT_WITH_REWARD = "У приятной привычки не может быть вознаграждения."
+PLEASANT_HABIT_WITH_RELATED_HABIT = (
+    "У приятной привычки не может быть связанной привычки."
+)
+PERIODICITY_NOT_INTEGER = "Периодичность должна быть целым числом от 1 до 7."
+PERIODICITY_OUT_OF_RANGE = "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."
+
+# Ограничения и триггеры на habits_habit -> ошибки по полям
+HABIT_CONSTRAINT_ERRORS = {
+    "habit_reward_xor_related_habit": {
+        "reward": REWARD_WITH_RELATED_HABIT,
+        "related_habit": RELATED_HABIT_WITH_REWARD,
+    },
+    "habit_periodicity_range": {"periodicity": PERIODICITY_OUT_OF_RANGE},
+    "habit_time_to_complete_max": {"time_to_complete": TIME_TO_COMPLETE_TOO_LONG},
+    "habit_pleasant_without_reward": {"reward": PLEASANT_HABIT_WITH_REWARD},
+    "habit_pleasant_without_related_habit": {
+        "related_habit": PLEASANT_HABIT_WITH_RELATED_HABIT
+    },
+    "habit_related_habit_is_pleasant": {"related_habit": RELATED_HABIT_NOT_PLEASANT},
+}
+
 
 def validate_habit_business_rules(
     attrs: dict, instance: Optional[Habit] = None
@@ -47,46 +83,67 @@ def validate_habit_business_rules(
 
     # 1. reward и related_habit взаимоисключающие
     if reward and related_habit:
-        errors["reward"] = (
-            "Нельзя одновременно указывать вознаграждение и связанную привычку."
-        )
-        errors["related_habit"] = (
-            "Нельзя одновременно указывать связанную привычку и вознаграждение."
-        )
+        errors["reward"] = REWARD_WITH_RELATED_HABIT
+        errors["related_habit"] = RELATED_HABIT_WITH_REWARD
 
     # 2. Время выполнения <= 120 (дополнительная защита)
     if time_to_complete is not None and time_to_complete > 120:
-        errors["time_to_complete"] = (
-            "Время на выполнение привычки не может превышать 120 секунд."
-        )
+        errors["time_to_complete"] = TIME_TO_COMPLETE_TOO_LONG
 
     # 3. В связанные привычки могут попадать только приятные привычки
     if related_habit is not None and not related_habit.is_pleasant:
-        errors["related_habit"] = (
-            "В связанные привычки могут попадать только приятные привычки."
-        )
+        errors["related_habit"] = RELATED_HABIT_NOT_PLEASANT
 
     # 4. У приятной привычки не может быть вознаграждения или связанной привычки
     if is_pleasant:
         if reward:
-            errors["reward"] = "У приятной привычки не может быть вознаграждения."
+            errors["reward"] = PLEASANT_HABIT_WITH_REWARD
         if related_habit is not None:
-            errors["related_habit"] = (
-                "У приятной привычки не может быть связанной привычки."
-            )
+            errors["related_habit"] = PLEASANT_HABIT_WITH_RELATED_HABIT
 
     # 5. Нельзя выполнять привычку реже, чем 1 раз в 7 дней (periodicity ∈ [1, 7])
     if periodicity is not None:
         try:
             value = int(periodicity)
         except (TypeError, ValueError):
-            errors["periodicity"] = "Периодичность должна быть целым числом от 1 до 7."
+            errors["periodicity"] = PERIODICITY_NOT_INTEGER
         else:
             if value < 1 or value > 7:
-                errors["periodicity"] = (
-                    "Нельзя выполнять привычку реже, чем 1 раз в 7 дней."
-                )
+                errors["periodicity"] = PERIODICITY_OUT_OF_RANGE
 
     if errors:
         # DRF ValidationError: поддерживает ошибки по полям
         raise ValidationError(errors)
+
+
+def get_violated_habit_constraint(exc: IntegrityError) -> Optional[str]:
+    """
+    Имя нарушенного ограничения Habit из IntegrityError.
+
+    PostgreSQL отдаёт имя в diag.constraint_name (в том числе для триггера),
+    SQLite — только в тексте ошибки.
+    """
+    diag = getattr(exc.__cause__, "diag", None)
+    name = getattr(diag, "constraint_name", None)
+    if name in HABIT_CONSTRAINT_ERRORS:
+        return name
+
+    message = str(exc)
+    for name in HABIT_CONSTRAINT_ERRORS:
+        if name in message:
+            return name
+    return None
+
+
+def habit_integrity_error_to_validation_error(
+    exc: IntegrityError,
+) -> Optional[ValidationError]:
+    """
+    Переводит нарушение ограничения Habit в ValidationError с теми же
+    сообщениями по полям, что и validate_habit_business_rules.
+    Возвращает None, если ошибка не относится к бизнес-правилам.
+    """
+    name = get_violated_habit_constraint(exc)
+    if name is None:
+        return None
+    return ValidationError(dict(HABIT_CONSTRAINT_ERRORS[name]))
@@ -1,31 +1,83 @@
-from rest_framework import viewsets, generics
+from django.utils import timezone
+from rest_framework import generics, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import Habit
+from config.async_views import (
+    AsyncAPIViewMixin,
+    AsyncListModelMixin,
+    AsyncRetrieveModelMixin,
+)
+from config.db_router import ReplicaReadMixin
+
+from .batch import Batch
+from .cache import acached_list
+from .completions import record_completion
+from .models import Habit, PublicHabit
 from .pagination import HabitPagination
 from .permissions import IsOwnerOrReadOnly
-from .serializers import HabitSerializer
+from .serializers import (
+    BatchSerializer,
+    HabitCompletionSerializer,
+    HabitSerializer,
+    HabitStatsQuerySerializer,
+    HabitStatsSerializer,
+    PublicHabitSerializer,
+)
+from .sharding import shard_for_user
+from .stats import habit_stats
 
 
-class HabitViewSet(viewsets.ModelViewSet):
+class HabitViewSet(
+    AsyncListModelMixin,
+    AsyncRetrieveModelMixin,
+    ReplicaReadMixin,
+    AsyncAPIViewMixin,
+    viewsets.ModelViewSet,
+):
     """
     CRUD для привычек текущего пользователя.
 
     - list:   список привычек текущего пользователя с пагинацией
     - create: создание привычки (user = request.user)
     - retrieve/update/partial_update/destroy: только свои привычки
+    - complete: отметка о выполнении привычки
+    - stats:    серии и доля выполнения по битовым картам HabitActivity
+
+    list, retrieve и stats читаются с реплики, кроме нескольких секунд после
+    изменений пользователя (read-your-writes). Страницы list кэшируются
+    (habits.cache) до следующего изменения привычек пользователя.
+
+    list и retrieve асинхронные (config.async_views): под ASGI запрос
+    не занимает поток; остальные action выполняются в потоке.
     """
 
     serializer_class = HabitSerializer
     permission_classes = (IsAuthenticated, IsOwnerOrReadOnly)
     pagination_class = HabitPagination
+    replica_actions = ("list", "retrieve", "stats")
 
     def get_queryset(self):
         """
         Возвращаем только привычки текущего пользователя.
         Это автоматически ограничивает и list, и retrieve, и update, и destroy.
         """
-        return Habit.objects.filter(user=self.request.user).order_by("time", "place")
+        if getattr(self, "swagger_fake_view", False):
+            # Генерация схемы (config.schema) идёт без запроса
+            return Habit.objects.none()
+        return (
+            Habit.objects.using(shard_for_user(self.request.user))
+            .filter(user=self.request.user)
+            .order_by("time", "place")
+        )
+
+    async def list(self, request, *args, **kwargs):
+        async def build():
+            return (await super(HabitViewSet, self).list(request)).data
+
+        return Response(await acached_list(request, build))
 
     def perform_create(self, serializer):
         """
@@ -33,22 +85,87 @@ class HabitViewSet(viewsets.ModelViewSet):
         """
         serializer.save(user=self.request.user)
 
+    @action(detail=True, methods=["post"], serializer_class=HabitCompletionSerializer)
+    def complete(self, request, pk=None):
+        """
+        Отметка о выполнении: 202, если отметка принята в буфер Redis
+        (в БД её перенесёт flush_habit_completions), 201 — если записана
+        сразу в БД.
+        """
+        habit = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        completion, buffered = record_completion(
+            habit, serializer.validated_data.get("completed_at", timezone.now())
+        )
+        return Response(
+            self.get_serializer(completion).data,
+            status=status.HTTP_202_ACCEPTED if buffered else status.HTTP_201_CREATED,
+        )
+
+    @action(detail=True, methods=["get"], serializer_class=HabitStatsSerializer)
+    def stats(self, request, pk=None):
+        """
+        Статистика привычки; ?days= — окно для доли выполнения (по умолчанию 30).
+        """
+        habit = self.get_object()
+        query = HabitStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        stats = habit_stats(habit, window_days=query.validated_data["days"])
+        return Response(self.get_serializer(stats).data)
+
 
-class PublicHabitListView(generics.ListAPIView):
+class PublicHabitListView(
+    AsyncListModelMixin, ReplicaReadMixin, AsyncAPIViewMixin, generics.ListAPIView
+):
     """
     Список публичных привычек (is_public=True).
 
     По ТЗ: "Пользователь может видеть список публичных привычек без
     возможности их редактировать или удалять."
 
-    Здесь только GET, без изменений.
+    Здесь только GET, без изменений. Читается из каталога PublicHabit
+    (один на все шарды, обновляется сигналами и периодической задачей)
+    с реплики: страница выбирается по покрывающему индексу, не затрагивая
+    таблицу habits_habit. Выполняется асинхронно.
     """
 
-    serializer_class = HabitSerializer
+    serializer_class = PublicHabitSerializer
     permission_classes = (
         IsAuthenticated,
     )  # можно заменить на AllowAny при необходимости
     pagination_class = HabitPagination
 
     def get_queryset(self):
-        return Habit.objects.filter(is_public=True).order_by("time", "place")
+        return PublicHabit.objects.order_by("time", "place", "habit_id")
+
+    async def get(self, request, *args, **kwargs):
+        return await self.list(request, *args, **kwargs)
+
+
+class BatchView(APIView):
+    """
+    Несколько запросов к API привычек за один round-trip и одну проверку
+    JWT (habits.batch.Batch). Тело:
+
+        {"atomic": true, "requests": [
+            {"method": "POST", "path": "/habits/", "body": {...}},
+            {"method": "PATCH", "path": "/habits/$0.id/",
+             "body": {"related_habit": "$1.id"}},
+            {"method": "GET", "path": "/habits/"}
+        ]}
+
+    Ответ — статус и тело каждого элемента в том же порядке.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batch = Batch(
+            request,
+            serializer.validated_data["requests"],
+            atomic=serializer.validated_data["atomic"],
+        )
+        return Response(batch.run())
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from .models import User
+        from .signals import user_changed
+
+        post_save.connect(user_changed, sender=User)
+        post_delete.connect(user_changed, sender=User)
@@ -0,0 +1,93 @@
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from config.metrics import TELEGRAM_API_LATENCY
+from users.telegram import handle_telegram_updates
+
+OFFSET_CACHE_KEY = "telegram:polling:offset"
+
+
+class Command(BaseCommand):
+    """
+    Получение обновлений Telegram через long polling (getUpdates).
+
+    Альтернатива webhook-у для окружений, где /telegram/webhook/ недоступен
+    извне. Обновления обрабатываются пачками той же логикой, что и webhook.
+    Offset сохраняется в кэше (Redis), поэтому после перезапуска воркер
+    продолжает с того же места.
+
+    Пример:
+        python manage.py telegram_polling --timeout 30 --limit 100
+    """
+
+    help = "Long polling обновлений Telegram (getUpdates)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=30,
+            help="Таймаут long polling в секундах.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=100,
+            help="Максимальный размер пачки обновлений (1-100).",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить один запрос getUpdates и выйти.",
+        )
+
+    def handle(self, *args, **options):
+        timeout = options["timeout"]
+        limit = options["limit"]
+        offset = cache.get(OFFSET_CACHE_KEY)
+        backoff = 1
+
+        while True:
+            try:
+                updates = self.get_updates(offset, timeout, limit)
+            except (requests.RequestException, ValueError) as exc:
+                self.stderr.write(f"getUpdates failed: {exc}")
+                if options["once"]:
+                    return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+
+            if updates:
+                handle_telegram_updates(updates)
+                # Сохраняем offset только после обработки пачки (at-least-once)
+                offset = max(update["update_id"] for update in updates) + 1
+                cache.set(OFFSET_CACHE_KEY, offset, timeout=None)
+                self.stdout.write(f"Processed {len(updates)} update(s)")
+
+            if options["once"]:
+                return
+
+    def get_updates(self, offset, timeout, limit):
+        url = f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/getUpdates"
+        params = {
+            "timeout": timeout,
+            "limit": limit,
+            "allowed_updates": '["message"]',
+        }
+        if offset is not None:
+            params["offset"] = offset
+
+        # Включает ожидание long polling — смотреть вместе с --timeout
+        with TELEGRAM_API_LATENCY.time(method="getUpdates"):
+            response = requests.get(url, params=params, timeout=timeout + 10)
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("ok"):
+            raise ValueError(data.get("description") or "Telegram API error")
+        return data.get("result") or []
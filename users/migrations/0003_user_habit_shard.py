@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_telegram_chat_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="habit_shard",
+            field=models.CharField(
+                blank=True,
+                help_text=(
+                    "Алиас БД с привычками пользователя, если он закреплён "
+                    "ребалансировкой. Пусто — шард выбирается по хэшу id."
+                ),
+                max_length=64,
+                null=True,
+                verbose_name="Шард привычек",
+            ),
+        ),
+    ]
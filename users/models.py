@@ -10,6 +10,14 @@ class User(AbstractUser):
         verbose_name="Telegram chat id",
         help_text="ID чата пользователя в Telegram для отправки уведомлений.",
     )
+    habit_shard = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name="Шард привычек",
+        help_text="Алиас БД с привычками пользователя, если он закреплён "
+        "ребалансировкой. Пусто — шард выбирается по хэшу id.",
+    )
 
     def __str__(self):
         return self.username
@@ -0,0 +1,16 @@
+from django.db import transaction
+
+from config.invalidation import BUS
+
+
+def user_changed(sender, instance, raw=False, **kwargs):
+    """
+    post_save/post_delete User: событие "users:<id>" для локальных кэшей
+    процессов. Рассылается после коммита, чтобы другой процесс не успел
+    перечитать незакоммиченное состояние.
+    """
+    if raw:
+        return
+    # После удаления Django обнуляет pk, поэтому запоминаем его сейчас
+    pk = instance.pk
+    transaction.on_commit(lambda: BUS.publish("users", pk), using=instance._state.db)
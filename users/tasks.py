@@ -0,0 +1,79 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .telegram import handle_telegram_update
+
+
+def update_key(update_id) -> str:
+    return f"telegram:update:{update_id}"
+
+
+def claim_telegram_update(update_id) -> bool:
+    """
+    Помечаем update_id как обработанный (SET NX с TTL в Redis).
+
+    Telegram повторяет доставку медленных webhook-ов, поэтому одно и то же
+    обновление может прийти несколько раз. Возвращает False, если такой
+    update_id уже встречался в пределах TELEGRAM_UPDATE_DEDUP_TTL.
+    """
+    if update_id is None:
+        return True
+    try:
+        return cache.add(
+            update_key(update_id), 1, timeout=settings.TELEGRAM_UPDATE_DEDUP_TTL
+        )
+    except Exception:
+        # Redis недоступен — лучше обработать повтор, чем потерять обновление
+        return True
+
+
+async def aclaim_telegram_update(update_id) -> bool:
+    """
+    claim_telegram_update для async-view.
+    """
+    if update_id is None:
+        return True
+    try:
+        return await cache.aadd(
+            update_key(update_id), 1, timeout=settings.TELEGRAM_UPDATE_DEDUP_TTL
+        )
+    except Exception:
+        return True
+
+
+def release_telegram_update(update_id) -> None:
+    """
+    Снимаем отметку, если обработка упала: повтор от Telegram
+    должен обработать обновление, а не отброситься как дубликат.
+    """
+    if update_id is None:
+        return
+    try:
+        cache.delete(update_key(update_id))
+    except Exception:
+        pass
+
+
+async def arelease_telegram_update(update_id) -> None:
+    if update_id is None:
+        return
+    try:
+        await cache.adelete(update_key(update_id))
+    except Exception:
+        pass
+
+
+@shared_task
+def process_telegram_update(update):
+    """
+    Асинхронная обработка обновления, принятого webhook-ом.
+    """
+    update_id = update.get("update_id")
+    if not claim_telegram_update(update_id):
+        return
+    try:
+        handle_telegram_update(update)
+    except BaseException:
+        release_telegram_update(update_id)
+        raise
@@ -0,0 +1,158 @@
+import asyncio
+from contextlib import nullcontext
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from config.metrics import TELEGRAM_API_LATENCY
+
+try:
+    import httpx
+except ImportError:  # без httpx async-отправка идёт через requests в потоке
+    httpx = None
+
+User = get_user_model()
+
+START_GREETING = "Привет! Я буду напоминать тебе о твоих привычках."
+
+
+def send_message_url() -> str:
+    return f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+
+
+def send_message(chat_id: int, text: str) -> None:
+    """
+    Отправка сообщения пользователю через Telegram Bot API.
+    """
+    with TELEGRAM_API_LATENCY.time(method="sendMessage"):
+        requests.post(
+            send_message_url(), json={"chat_id": chat_id, "text": text}, timeout=5
+        )
+
+
+def async_client():
+    """
+    Клиент httpx для пачки отправок: async with закрывает его вместе
+    с соединениями, поэтому они не переживают event loop. Без httpx —
+    пустой контекст (None).
+    """
+    if httpx is None:
+        return nullcontext()
+    return httpx.AsyncClient(timeout=5)
+
+
+async def asend_message(chat_id: int, text: str, client=None) -> None:
+    """
+    send_message для async-кода: через httpx.AsyncClient (переданный client
+    или собственный на один запрос), без httpx — requests в потоке, чтобы
+    не блокировать event loop.
+    """
+    if httpx is None:
+        await asyncio.to_thread(send_message, chat_id, text)
+        return
+    if client is None:
+        async with async_client() as client:
+            await asend_message(chat_id, text, client)
+        return
+    with TELEGRAM_API_LATENCY.time(method="sendMessage"):
+        await client.post(send_message_url(), json={"chat_id": chat_id, "text": text})
+
+
+def parse_messages(updates: list) -> list:
+    """
+    (chat_id, username, text) сообщений из пачки обновлений.
+    """
+    messages = []
+    for update in updates:
+        message = update.get("message") or {}
+        chat = message.get("chat") or {}
+        chat_id = chat.get("id")
+        if not chat_id:
+            continue
+        messages.append((chat_id, chat.get("username"), message.get("text") or ""))
+    return messages
+
+
+def usernames(messages: list) -> set:
+    return {username for _, username, _ in messages if username}
+
+
+def link_chats(messages: list, users: dict) -> tuple:
+    """
+    Пользователи, у которых изменился chat_id, и чаты, которым нужно
+    приветствие.
+    """
+    changed = {}
+    replies = []
+    for chat_id, username, text in messages:
+        if username:
+            user = users.get(username)
+            if user is None:
+                continue
+
+            if user.telegram_chat_id != chat_id:
+                user.telegram_chat_id = chat_id
+                changed[user.pk] = user
+
+        if text.strip() == "/start":
+            replies.append(chat_id)
+    return list(changed.values()), replies
+
+
+def handle_telegram_update(update: dict) -> None:
+    """
+    Обработка одного обновления от Telegram (webhook).
+    """
+    handle_telegram_updates([update])
+
+
+def handle_telegram_updates(updates: list) -> None:
+    """
+    Обработка пачки обновлений от Telegram.
+
+    Если приходит сообщение от пользователя, пробуем найти его по username
+    и сохранить chat_id в его профиле. На /start отвечаем приветствием.
+
+    Пользователи всей пачки загружаются одним запросом (username__in),
+    а новые chat_id сохраняются одним bulk_update.
+    """
+    messages = parse_messages(updates)
+    users = {
+        user.username: user
+        for user in User.objects.filter(username__in=usernames(messages))
+    }
+    changed, replies = link_chats(messages, users)
+    if changed:
+        User.objects.bulk_update(changed, ["telegram_chat_id"])
+
+    for chat_id in replies:
+        try:
+            send_message(chat_id, START_GREETING)
+        except requests.RequestException:
+            continue
+
+
+async def ahandle_telegram_updates(updates: list) -> None:
+    """
+    handle_telegram_updates для async-view: асинхронный ORM, ответы
+    на /start отправляются одновременно.
+    """
+    messages = parse_messages(updates)
+    users = {
+        user.username: user
+        async for user in User.objects.filter(username__in=usernames(messages))
+    }
+    changed, replies = link_chats(messages, users)
+    if changed:
+        await User.objects.abulk_update(changed, ["telegram_chat_id"])
+
+    if not replies:
+        return
+    # Ответы пачки идут через один клиент; ошибка одной отправки
+    # не отменяет остальные
+    async with async_client() as client:
+        await asyncio.gather(
+            *(asend_message(chat_id, START_GREETING, client) for chat_id in replies),
+            return_exceptions=True,
+        )
@@ -1,12 +1,28 @@
-from unittest.mock import patch
-
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import requests
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
 
 from users.serializers import UserRegisterSerializer
+from users.tasks import process_telegram_update, update_key
+from users.telegram import handle_telegram_updates
+from users.throttles import (
+    LoginIPRateThrottle,
+    LoginUsernameRateThrottle,
+    RegisterIPRateThrottle,
+)
 
 User = get_user_model()
 
@@ -76,59 +92,183 @@ class RegisterViewTests(APITestCase):
 
 class TelegramWebhookTests(APITestCase):
     def setUp(self):
+        self.url = reverse("users:telegram-webhook")
+
+    @patch("users.views.process_telegram_update.delay")
+    def test_webhook_enqueues_update_and_returns_200(self, mock_delay):
+        payload = {
+            "update_id": 1001,
+            "message": {
+                "chat": {
+                    "id": 555555,
+                    "username": "telegram_user",
+                },
+                "text": "hello",
+            },
+        }
+
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_delay.assert_called_once_with(payload)
+
+    @patch("users.views.process_telegram_update.delay")
+    def test_webhook_with_empty_body_does_not_enqueue(self, mock_delay):
+        response = self.client.post(self.url, {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_delay.assert_not_called()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    TELEGRAM_WEBHOOK_INLINE=True,
+    TELEGRAM_API_URL="https://test-api",
+    TELEGRAM_BOT_TOKEN="TEST_TOKEN",
+)
+class InlineTelegramWebhookTests(TestCase):
+    """
+    TELEGRAM_WEBHOOK_INLINE: обновление обрабатывается в async-view
+    без очереди Celery.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.url = reverse("users:telegram-webhook")
+        self.user = User.objects.create_user(username="inline_user")
+        # Без httpx ответ уходит через requests в потоке — его и подменяем
+        patcher = patch("users.telegram.httpx", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("users.views.process_telegram_update.delay")
+    @patch("requests.post")
+    async def test_start_is_handled_in_request_once(self, mock_post, mock_delay):
+        payload = {
+            "update_id": 42,
+            "message": {
+                "chat": {"id": 424242, "username": self.user.username},
+                "text": "/start",
+            },
+        }
+
+        for _ in range(2):
+            response = await self.async_client.post(
+                self.url, payload, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        await self.user.arefresh_from_db()
+        self.assertEqual(self.user.telegram_chat_id, 424242)
+        mock_delay.assert_not_called()
+        mock_post.assert_called_once()
+        args, kwargs = mock_post.call_args
+        self.assertIn("botTEST_TOKEN/sendMessage", args[0])
+        self.assertEqual(kwargs["json"]["chat_id"], 424242)
+
+    @patch("users.views.ahandle_telegram_updates", side_effect=RuntimeError)
+    async def test_failed_inline_update_is_not_marked_processed(self, mock_handle):
+        payload = {"update_id": 43, "message": {"chat": {"id": 1}, "text": "hi"}}
+
+        with self.assertRaises(RuntimeError):
+            await self.async_client.post(
+                self.url, payload, content_type="application/json"
+            )
+
+        self.assertIsNone(await cache.aget(update_key(43)))
+
+    @patch("users.views.process_telegram_update.delay")
+    async def test_httpx_client_is_closed_after_replies(self, mock_delay):
+        httpx = MagicMock()
+        client = httpx.AsyncClient.return_value
+        client.__aenter__.return_value = client
+        client.post = AsyncMock()
+        payload = {
+            "update_id": 44,
+            "message": {"chat": {"id": 1}, "text": "/start"},
+        }
+
+        with patch("users.telegram.httpx", httpx):
+            response = await self.async_client.post(
+                self.url, payload, content_type="application/json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        client.post.assert_awaited_once()
+        client.__aexit__.assert_awaited_once()
+
+    @patch("requests.post", side_effect=requests.ConnectionError)
+    async def test_send_failure_does_not_fail_webhook(self, mock_post):
+        payload = {"update_id": 43, "message": {"chat": {"id": 1}, "text": "/start"}}
+
+        response = await self.async_client.post(
+            self.url, payload, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_post.assert_called_once()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ProcessTelegramUpdateTaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
         self.user = User.objects.create_user(
             username="telegram_user",
             password="strongpass123",
         )
-        self.url = reverse("users:telegram-webhook")
 
-    def test_webhook_without_chat_id_returns_200_and_does_not_change_user(self):
+    def test_update_without_chat_id_does_not_change_user(self):
         payload = {
+            "update_id": 1,
             "message": {
                 "chat": {},
                 "text": "hello",
-            }
+            },
         }
 
         old_chat_id = self.user.telegram_chat_id
 
-        response = self.client.post(self.url, payload, format="json")
+        process_telegram_update(payload)
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.user.refresh_from_db()
         self.assertEqual(self.user.telegram_chat_id, old_chat_id)
 
-    def test_webhook_with_unknown_username_returns_200_without_side_effects(self):
+    def test_update_with_unknown_username_has_no_side_effects(self):
         payload = {
+            "update_id": 2,
             "message": {
                 "chat": {
                     "id": 123456,
                     "username": "unknown_user",
                 },
                 "text": "hello",
-            }
+            },
         }
 
-        response = self.client.post(self.url, payload, format="json")
+        process_telegram_update(payload)
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.user.refresh_from_db()
         self.assertIsNone(self.user.telegram_chat_id)
 
-    def test_webhook_updates_telegram_chat_id_for_existing_user(self):
+    def test_update_sets_telegram_chat_id_for_existing_user(self):
         payload = {
+            "update_id": 3,
             "message": {
                 "chat": {
                     "id": 555555,
                     "username": self.user.username,
                 },
                 "text": "hello",
-            }
+            },
         }
 
-        response = self.client.post(self.url, payload, format="json")
+        process_telegram_update(payload)
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.user.refresh_from_db()
         self.assertEqual(self.user.telegram_chat_id, 555555)
 
@@ -136,21 +276,21 @@ class TelegramWebhookTests(APITestCase):
         TELEGRAM_API_URL="https://test-api", TELEGRAM_BOT_TOKEN="TEST_TOKEN"
     )
     @patch("requests.post")
-    def test_webhook_start_command_sends_greeting_message(self, mock_post):
+    def test_start_command_sends_greeting_message(self, mock_post):
         chat_id = 777777
         payload = {
+            "update_id": 4,
             "message": {
                 "chat": {
                     "id": chat_id,
                     "username": self.user.username,
                 },
                 "text": "/start",
-            }
+            },
         }
 
-        response = self.client.post(self.url, payload, format="json")
+        process_telegram_update(payload)
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.user.refresh_from_db()
         self.assertEqual(self.user.telegram_chat_id, chat_id)
 
@@ -162,6 +302,43 @@ class TelegramWebhookTests(APITestCase):
         self.assertEqual(kwargs["json"]["chat_id"], chat_id)
         self.assertIn("Привет!", kwargs["json"]["text"])
 
+    @patch("requests.post")
+    def test_repeated_update_id_is_processed_once(self, mock_post):
+        payload = {
+            "update_id": 5,
+            "message": {
+                "chat": {
+                    "id": 888888,
+                    "username": self.user.username,
+                },
+                "text": "/start",
+            },
+        }
+
+        process_telegram_update(payload)
+        process_telegram_update(payload)
+
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_failed_update_can_be_redelivered(self):
+        payload = {
+            "update_id": 6,
+            "message": {
+                "chat": {"id": 999999, "username": self.user.username},
+                "text": "hello",
+            },
+        }
+
+        with (
+            patch("users.tasks.handle_telegram_update", side_effect=RuntimeError),
+            self.assertRaises(RuntimeError),
+        ):
+            process_telegram_update(payload)
+        process_telegram_update(payload)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.telegram_chat_id, 999999)
+
 
 class JWTAuthTests(APITestCase):
     def setUp(self):
@@ -200,3 +377,288 @@ class JWTAuthTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("access", response.data)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class AuthThrottlingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username="throttled",
+            password="strongpass123",
+        )
+        self.token_url = reverse("users:token_obtain_pair")
+        self.register_url = reverse("users:register")
+
+    def test_login_is_throttled_per_username(self):
+        limit = LoginUsernameRateThrottle().num_requests
+        payload = {"username": "throttled", "password": "wrongpass"}
+
+        for _ in range(limit):
+            response = self.client.post(self.token_url, payload, format="json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(self.token_url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    def test_login_budget_is_per_username(self):
+        limit = LoginUsernameRateThrottle().num_requests
+        for _ in range(limit + 1):
+            self.client.post(
+                self.token_url,
+                {"username": "throttled", "password": "wrongpass"},
+                format="json",
+            )
+
+        response = self.client.post(
+            self.token_url,
+            {"username": "someone_else", "password": "wrongpass"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_storm_does_not_consume_register_budget(self):
+        limit = LoginUsernameRateThrottle().num_requests
+        for _ in range(limit + 1):
+            self.client.post(
+                self.token_url,
+                {"username": "throttled", "password": "wrongpass"},
+                format="json",
+            )
+
+        response = self.client.post(
+            self.register_url,
+            {"username": "newcomer", "password": "strongpass123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_register_is_throttled_per_ip(self):
+        limit = RegisterIPRateThrottle().num_requests
+        for i in range(limit):
+            response = self.client.post(
+                self.register_url,
+                {"username": f"bulk_{i}", "password": "strongpass123"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(
+            self.register_url,
+            {"username": "one_more", "password": "strongpass123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_does_not_bypass_ip_limit(self):
+        limit = RegisterIPRateThrottle().num_requests
+        for i in range(limit):
+            self.client.post(
+                self.register_url,
+                {"username": f"bulk_{i}", "password": "strongpass123"},
+                format="json",
+                HTTP_X_FORWARDED_FOR=f"10.0.0.{i}",
+            )
+
+        response = self.client.post(
+            self.register_url,
+            {"username": "one_more", "password": "strongpass123"},
+            format="json",
+            HTTP_X_FORWARDED_FOR="10.0.1.1",
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_non_object_body_is_rejected_not_crashed(self):
+        response = self.client.post(self.token_url, [1, 2], format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_previous_window_is_weighted_by_elapsed_time(self):
+        throttle = LoginIPRateThrottle()
+        request = APIRequestFactory().post(self.token_url)
+        duration = throttle.duration
+
+        # Конец прошлого окна: набираем ровно лимит
+        with patch.object(throttle, "timer", return_value=duration - 1):
+            for _ in range(throttle.num_requests):
+                self.assertTrue(throttle.allow_request(Request(request), None))
+
+        # Начало нового окна: прошлые запросы ещё почти полностью учитываются
+        with patch.object(throttle, "timer", return_value=duration + 1):
+            self.assertFalse(throttle.allow_request(Request(request), None))
+            self.assertGreater(throttle.wait(), 0)
+
+        # Ближе к концу нового окна вес прошлого окна почти нулевой
+        with patch.object(throttle, "timer", return_value=2 * duration - 1):
+            self.assertTrue(throttle.allow_request(Request(request), None))
+
+
+class StubBotAPIHandler(BaseHTTPRequestHandler):
+    """
+    Локальная заглушка Telegram Bot API: отдаёт заранее заданные обновления
+    на getUpdates и запоминает вызовы sendMessage.
+    """
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        self.server.get_updates_params.append(params)
+        offset = int(params.get("offset", ["0"])[0])
+        result = [u for u in self.server.updates if u["update_id"] >= offset]
+        self.send_json({"ok": True, "result": result})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.sent_messages.append(json.loads(self.rfile.read(length)))
+        self.send_json({"ok": True, "result": {}})
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TelegramPollingCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        self.server = HTTPServer(("127.0.0.1", 0), StubBotAPIHandler)
+        self.server.updates = []
+        self.server.get_updates_params = []
+        self.server.sent_messages = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        host, port = self.server.server_address
+        settings_override = override_settings(
+            TELEGRAM_API_URL=f"http://{host}:{port}",
+            TELEGRAM_BOT_TOKEN="TEST_TOKEN",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.alice = User.objects.create_user(username="alice", password="pass12345")
+        self.bob = User.objects.create_user(username="bob", password="pass12345")
+
+    def message(self, update_id, chat_id, username, text="hello"):
+        return {
+            "update_id": update_id,
+            "message": {
+                "chat": {"id": chat_id, "username": username},
+                "text": text,
+            },
+        }
+
+    def test_batch_updates_chat_ids_and_replies_to_start(self):
+        self.server.updates = [
+            self.message(10, 111, "alice", "/start"),
+            self.message(11, 222, "bob"),
+            self.message(12, 333, "unknown", "/start"),
+        ]
+
+        call_command("telegram_polling", "--once", "--timeout", "0", stdout=StringIO())
+
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.telegram_chat_id, 111)
+        self.assertEqual(self.bob.telegram_chat_id, 222)
+        self.assertEqual(
+            [m["chat_id"] for m in self.server.sent_messages],
+            [111],
+        )
+
+    def test_offset_is_persisted_between_runs(self):
+        self.server.updates = [
+            self.message(10, 111, "alice", "/start"),
+            self.message(11, 222, "bob"),
+        ]
+
+        call_command("telegram_polling", "--once", "--timeout", "0", stdout=StringIO())
+        call_command("telegram_polling", "--once", "--timeout", "0", stdout=StringIO())
+
+        self.assertNotIn("offset", self.server.get_updates_params[0])
+        self.assertEqual(self.server.get_updates_params[1]["offset"], ["12"])
+        # Повторного ответа на /start быть не должно
+        self.assertEqual(len(self.server.sent_messages), 1)
+
+    def test_batch_uses_one_lookup_and_one_bulk_update(self):
+        updates = [
+            self.message(10, 111, "alice"),
+            self.message(11, 222, "bob"),
+        ]
+
+        # Один SELECT пользователей и один UPDATE на всю пачку
+        with self.assertNumQueries(2):
+            handle_telegram_updates(updates)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class UserQueryBudgetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username="budget_user", password="strongpass123"
+        )
+
+    def test_register_queries(self):
+        # проверка уникальности username + INSERT
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse("users:register"),
+                {"username": "budget_new", "password": "strongpass123"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_token_obtain_queries(self):
+        # выборка пользователя (last_login не обновляется)
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse("users:token_obtain_pair"),
+                {"username": "budget_user", "password": "strongpass123"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_token_refresh_queries(self):
+        refresh = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"username": "budget_user", "password": "strongpass123"},
+            format="json",
+        ).data["refresh"]
+
+        # проверка, что пользователь всё ещё активен
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse("users:token_refresh"), {"refresh": refresh}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @patch("users.views.process_telegram_update.delay")
+    def test_telegram_webhook_has_no_queries(self, _):
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                reverse("users:telegram-webhook"),
+                {"update_id": 1, "message": {"chat": {"id": 1}}},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
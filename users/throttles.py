@@ -0,0 +1,117 @@
+from collections.abc import Mapping
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Троттлинг по алгоритму скользящего окна (sliding window counter).
+
+    Вместо списка временных меток (как в SimpleRateThrottle) храним два
+    счётчика — для текущего и предыдущего окна — и оцениваем число запросов
+    за последние `duration` секунд как
+
+        previous * (1 - elapsed / duration) + current
+
+    Счётчик увеличивается атомарным `incr`, поэтому при общем Redis-кэше
+    лимит соблюдается сразу на всех узлах, без гонок "прочитал-записал".
+    """
+
+    def get_ident_value(self, request):
+        """
+        Значение, по которому считается лимит (IP, username и т.п.).
+        Должно быть переопределено.
+        """
+        raise NotImplementedError(".get_ident_value() must be overridden")
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        if not ident:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+
+        current_key = f"{self.key}:{window}"
+        previous_key = f"{self.key}:{window - 1}"
+
+        try:
+            # Окно живёт две длительности: пока оно "предыдущее", оно нужно для оценки
+            self.cache.add(current_key, 0, timeout=self.duration * 2)
+            self.current = self.cache.incr(current_key)
+            self.previous = self.cache.get(previous_key, 0)
+        except Exception:
+            # Кэш недоступен — не блокируем вход/регистрацию целиком
+            return True
+
+        weight = 1 - self.elapsed / self.duration
+        if self.previous * weight + self.current > self.num_requests:
+            return False
+        return True
+
+    def wait(self):
+        """
+        Через сколько секунд оценка опустится ниже лимита.
+        """
+        remaining = self.duration - self.elapsed
+        if self.current > self.num_requests or not self.previous:
+            return remaining
+
+        # previous * (1 - (elapsed + t) / duration) + current <= num_requests
+        wait = (
+            self.duration * (1 - (self.num_requests - self.current) / self.previous)
+            - self.elapsed
+        )
+        return max(min(wait, remaining), 0)
+
+
+class IPRateThrottle(SlidingWindowRateThrottle):
+    """
+    Лимит по IP-адресу клиента. Адрес берётся из REMOTE_ADDR или из
+    X-Forwarded-For с учётом NUM_PROXIES доверенных прокси: заголовок
+    от самого клиента лимит не обходит.
+    """
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class UsernameRateThrottle(SlidingWindowRateThrottle):
+    """
+    Лимит по username из тела запроса (защита от перебора паролей
+    к одному аккаунту с разных IP).
+    """
+
+    def get_ident_value(self, request):
+        if not isinstance(request.data, Mapping):
+            return None
+        username = request.data.get("username")
+        if not isinstance(username, str) or not username.strip():
+            return None
+        return username.strip().lower()
+
+
+class LoginIPRateThrottle(IPRateThrottle):
+    scope = "login_ip"
+
+
+class LoginUsernameRateThrottle(UsernameRateThrottle):
+    scope = "login_username"
+
+
+class RegisterIPRateThrottle(IPRateThrottle):
+    scope = "register_ip"
+
+
+class RegisterUsernameRateThrottle(UsernameRateThrottle):
+    scope = "register_username"
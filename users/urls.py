@@ -1,18 +1,19 @@
 from django.urls import path
 
 from .apps import UsersConfig
-from .views import RegisterView, telegram_webhook
+from .views import RegisterView, ThrottledTokenObtainPairView, telegram_webhook
 
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView
 
 app_name = UsersConfig.name
 
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("telegram/webhook/", telegram_webhook, name="telegram-webhook"),
-    path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path(
+        "token/",
+        ThrottledTokenObtainPairView.as_view(),
+        name="token_obtain_pair",
+    ),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 ]
@@ -1,14 +1,26 @@
-from django.contrib.auth import get_user_model
-from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .serializers import UserRegisterSerializer
+from config.async_views import AsyncAPIViewMixin
 
-User = get_user_model()
+from .serializers import UserRegisterSerializer
+from .tasks import (
+    aclaim_telegram_update,
+    arelease_telegram_update,
+    process_telegram_update,
+)
+from .telegram import ahandle_telegram_updates
+from .throttles import (
+    LoginIPRateThrottle,
+    LoginUsernameRateThrottle,
+    RegisterIPRateThrottle,
+    RegisterUsernameRateThrottle,
+)
 
 
 class RegisterView(APIView):
@@ -18,6 +30,7 @@ class RegisterView(APIView):
     """
 
     permission_classes = (AllowAny,)
+    throttle_classes = (RegisterIPRateThrottle, RegisterUsernameRateThrottle)
 
     def post(self, request, *args, **kwargs):
         serializer = UserRegisterSerializer(data=request.data)
@@ -26,51 +39,48 @@ class RegisterView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-@csrf_exempt
-@api_view(["POST"])
-@permission_classes([AllowAny])
-def telegram_webhook(request):
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    """
+    Получение JWT-пары с ограничением частоты запросов.
+    Проверка пароля (PBKDF2) дорогая по CPU, поэтому лимитируем
+    и по IP, и по username.
     """
-    Webhook для Telegram бота.
 
-    Ожидаем входящие обновления от Telegram.
-    Если приходит сообщение от пользователя, пробуем найти его по username
-    и сохранить chat_id в его профиле.
+    throttle_classes = (LoginIPRateThrottle, LoginUsernameRateThrottle)
+
+
+class TelegramWebhookView(AsyncAPIViewMixin, APIView):
     """
-    data = request.data
+    Webhook для Telegram бота (async).
 
-    message = data.get("message") or {}
-    chat = message.get("chat") or {}
-    text = message.get("text") or ""
-    chat_id = chat.get("id")
-    username = chat.get("username")
+    Сразу подтверждаем получение и ставим обновление в очередь Celery:
+    Telegram ждёт ответа и повторяет медленные запросы, поэтому поиск
+    пользователя и ответ на /start выполняются в process_telegram_update.
 
-    if not chat_id:
-        return Response(status=200)
+    С TELEGRAM_WEBHOOK_INLINE обновление обрабатывается прямо в запросе
+    (асинхронный ORM и HTTP-клиент, без очереди) — для ASGI-развёртывания,
+    где ожидание Telegram API не занимает поток.
+    """
+
+    permission_classes = (AllowAny,)
 
-    if username:
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
+    async def post(self, request):
+        data = request.data
+        if not (isinstance(data, dict) and data):
             return Response(status=200)
 
-        if user.telegram_chat_id != chat_id:
-            user.telegram_chat_id = chat_id
-            user.save(update_fields=["telegram_chat_id"])
-
-    if text.strip() == "/start":
-        from django.conf import settings
-        import requests
-
-        url = (
-            f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-        )
-        requests.post(
-            url,
-            json={
-                "chat_id": chat_id,
-                "text": "Привет! Я буду напоминать тебе о твоих привычках.",
-            },
-        )
-
-    return Response(status=200)
+        if settings.TELEGRAM_WEBHOOK_INLINE:
+            update_id = data.get("update_id")
+            if await aclaim_telegram_update(update_id):
+                try:
+                    await ahandle_telegram_updates([dict(data)])
+                except BaseException:
+                    # Ответ 500: Telegram повторит доставку
+                    await arelease_telegram_update(update_id)
+                    raise
+        else:
+            await sync_to_async(process_telegram_update.delay)(dict(data))
+        return Response(status=200)
+
+
+telegram_webhook = TelegramWebhookView.as_view()